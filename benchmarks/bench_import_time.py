@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# =====================================================
+# IMPORT-TIME BUDGET FOR PIPELINE MODULES
+# -----------------------------------------------------
+# Every module is imported in a fresh interpreter (best
+# of --repeat runs). Importing must stay cheap and free
+# of side effects: no Firestore connection and none of
+# the heavy libraries a module only needs at run time.
+# Exits 1 when a module is over budget.
+# =====================================================
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT, "scripts")
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results", "import_time.json")
+
+HEAVY = ["pandas", "numpy", "scipy", "matplotlib", "firebase_admin"]
+LIGHT_BUDGET = {"max_seconds": 0.25, "forbidden": HEAVY}
+# data stages work on DataFrames from the first line, pandas is expected
+DATA_BUDGET = {"max_seconds": 1.5, "forbidden": ["matplotlib", "firebase_admin"]}
+
+BUDGETS = {
+    "run_pipeline.py": LIGHT_BUDGET,
+    "1_setup_firestore.py": LIGHT_BUDGET,
+    "2_export_firestore.py": LIGHT_BUDGET,
+    "3_transform_to_csv.py": DATA_BUDGET,
+    "4_validate_csv.py": LIGHT_BUDGET,
+    "4a_great_expectations_check.py": LIGHT_BUDGET,
+    "5_analytics.py": DATA_BUDGET,
+}
+
+_PROBE = """
+import sys, json, time, importlib.util
+sys.path.insert(0, {scripts!r})
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("probe", {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(script_name: str, repeat: int) -> dict:
+    code = _PROBE.format(
+        scripts=SCRIPTS_DIR, path=os.path.join(SCRIPTS_DIR, script_name), heavy=HEAVY
+    )
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, check=True,
+            capture_output=True, text=True,
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        "seconds": round(min(r["seconds"] for r in runs), 4),
+        "loaded": runs[0]["loaded"],
+    }
+
+
+def run_benchmark(repeat: int) -> list:
+    results = []
+    for script_name, budget in BUDGETS.items():
+        measured = measure(script_name, repeat)
+        problems = []
+        if measured["seconds"] > budget["max_seconds"]:
+            problems.append(f"{measured['seconds']:.3f}s > {budget['max_seconds']}s")
+        eager = sorted(set(measured["loaded"]) & set(budget["forbidden"]))
+        if eager:
+            problems.append("imports " + ", ".join(eager) + " at import time")
+
+        results.append({
+            "module": script_name,
+            **measured,
+            "budget_seconds": budget["max_seconds"],
+            "ok": not problems,
+            "problems": problems,
+        })
+        mark = "OK  " if not problems else "FAIL"
+        print(f"{mark} {script_name:34s} {measured['seconds']:7.3f}s  {'; '.join(problems)}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time budget for pipeline modules")
+    parser.add_argument("--repeat", type=int, default=5, help="imports per module (best is kept)")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeat)
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w", encoding="utf-8") as f:
+        json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
@@ -0,0 +1,214 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import importlib.util
+
+# =====================================================
+# PIPELINE BENCHMARK
+# -----------------------------------------------------
+# For every scale a synthetic dataset is exported from a
+# local Firestore stand-in and pushed through transform,
+# both validators and analytics. Every stage runs in its
+# own worker process, so peak RSS is per stage; timings
+# come from the stage's own run metrics (utils_metrics),
+# including the analytics sub-steps.
+#
+#   python benchmarks/bench_pipeline.py --scales 1,100,10000
+#   python benchmarks/bench_pipeline.py --update-baseline
+#
+# Runs fully offline. Exits 1 when a stage or step is
+# slower / bigger than the baseline by more than
+# --threshold percent.
+# =====================================================
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT, "scripts")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "pipeline.json")
+
+# (short name, script, entry function)
+STAGES = [
+    ("export", "2_export_firestore.py", "export_firestore"),
+    ("transform", "3_transform_to_csv.py", "transform_data"),
+    ("validate", "4_validate_csv.py", "validate_csv_files"),
+    ("expectations", "4a_great_expectations_check.py", "run_custom_expectations"),
+    ("analytics", "5_analytics.py", "run_analytics"),
+]
+DEFAULT_SCALES = [1, 100]
+DEFAULT_THRESHOLD_PCT = 25.0
+MIN_SECONDS = 0.25          # timing differences below this are noise
+RUN_ID = "bench"
+
+
+# =====================================================
+# WORKER: ONE STAGE, ONE PROCESS
+# =====================================================
+def load_stage(script_name):
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+    module_name = "stage_" + os.path.splitext(script_name)[0]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPTS_DIR, script_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_worker(script_name, entry, scale):
+    """Runs in the scale's work directory; the stage records its own metrics."""
+    module = load_stage(script_name)
+    if script_name == "2_export_firestore.py":
+        from synthetic import generate_dataset
+        from utils_firestore import set_db
+        from local_firestore import LocalFirestore
+
+        db = LocalFirestore.from_env()
+        db.import_collections(generate_dataset(scale))
+        set_db(db)
+    getattr(module, entry)()
+
+
+# =====================================================
+# DRIVER
+# =====================================================
+def bench_scale(scale, keep=False) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench_{scale}x_")
+    env = dict(
+        os.environ,
+        PIPELINE_RUN_ID=RUN_ID,
+        METRICS_FOLDER=os.path.join(workdir, "metrics"),
+        MPLBACKEND="Agg",
+        # in-memory stand-in; FIRESTORE_LOCAL_LATENCY_MS etc. still apply
+        FIRESTORE_LOCAL_PATH="",
+        PYTHONPATH=os.pathsep.join([BENCH_DIR, SCRIPTS_DIR]),
+    )
+    try:
+        for name, script_name, entry in STAGES:
+            print(f"  {scale}x {name} ...", flush=True)
+            started = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", script_name,
+                 "--entry", entry, "--scale", str(scale)],
+                cwd=workdir, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            )
+            if proc.returncode != 0:
+                print(proc.stderr[-3000:], file=sys.stderr)
+                raise RuntimeError(f"{script_name} failed at {scale}x")
+            print(f"  {scale}x {name} done in {time.perf_counter() - started:.1f}s", flush=True)
+
+        steps = {}
+        for path in glob.glob(os.path.join(workdir, "metrics", RUN_ID, "*.json")):
+            with open(path, "r", encoding="utf-8") as f:
+                for row in json.load(f)["steps"]:
+                    steps[row["path"]] = row
+    finally:
+        if keep:
+            print(f"  work directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {}
+    for name, script_name, _ in STAGES:
+        stage_name = os.path.splitext(script_name)[0]
+        for path, row in steps.items():
+            if path != stage_name and not path.startswith(stage_name + "/"):
+                continue
+            rows = row["firestore_docs"] if name == "export" else row["rows_in"]
+            results[f"{scale}x/{path}"] = {
+                "wall_s": row["wall_s"],
+                "cpu_s": row["cpu_s"],
+                "peak_rss_mb": row["peak_rss_mb"],
+                "rows": rows,
+                "rows_per_s": round(rows / row["wall_s"], 1) if row["wall_s"] and rows else None,
+            }
+    return results
+
+
+def compare(results, baseline, threshold_pct) -> list:
+    regressions = []
+    for key, row in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for metric, floor in (("wall_s", MIN_SECONDS), ("peak_rss_mb", 1.0)):
+            old, new = before.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            if change > threshold_pct and new - old > floor:
+                regressions.append(f"{key} {metric}: {old} -> {new} (+{change:.0f}%)")
+    return regressions
+
+
+def print_table(results):
+    print(f"\n{'step':60s} {'wall s':>9s} {'rows/s':>12s} {'peak MB':>9s}")
+    for key, row in results.items():
+        rate = f"{row['rows_per_s']:,.0f}" if row["rows_per_s"] else "-"
+        peak = f"{row['peak_rss_mb']:.0f}" if row["peak_rss_mb"] is not None else "-"
+        print(f"{key:60s} {row['wall_s']:9.3f} {rate:>12s} {peak:>9s}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                        help="comma-separated multiples of the seed dataset (e.g. 1,100,10000)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD_PCT,
+                        help="regression threshold in percent")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this run as the new baseline")
+    parser.add_argument("--keep", action="store_true", help="keep the per-scale work directories")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--entry", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.entry, args.scale)
+        sys.exit(0)
+
+    results = {}
+    for scale in [int(s) for s in args.scales.split(",") if s.strip()]:
+        print(f"Benchmarking {scale}x the seed dataset...")
+        results.update(bench_scale(scale, args.keep))
+    print_table(results)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = os.path.join(RESULTS_DIR, f"pipeline_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {result_path}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {BASELINE_PATH}")
+        sys.exit(0)
+
+    if not os.path.exists(BASELINE_PATH):
+        print("No baseline yet; run with --update-baseline to create one.")
+        sys.exit(0)
+
+    with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline["results"], args.threshold)
+    if baseline.get("machine") != report["machine"]:
+        print(f"Note: baseline was recorded on {baseline.get('machine')}, timings may not be comparable.")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"{len(regressions)} regression(s) beyond {args.threshold:.0f}% "
+          f"against the baseline from {baseline['created_at']}.")
+    sys.exit(1 if regressions else 0)
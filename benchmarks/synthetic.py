@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import random
+import datetime
+import importlib.util
+import numpy as np
+
+# =====================================================
+# SYNTHETIC DATASETS
+# -----------------------------------------------------
+# Documents shaped exactly like the ones 1_setup_firestore
+# writes, scaled from the seed: scale 1 = 20 recipes,
+# 10 users, 120 interactions. Generation is seeded, so a
+# scale always yields the same dataset.
+# =====================================================
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT, "scripts")
+SEED_PATH = os.path.join(ROOT, "seed_data.json")
+
+SEED_RECIPES = 20
+SEED_USERS = 10
+SEED_INTERACTIONS = 120
+HISTORY_DAYS = 30
+INTERACTION_TYPES = ["view", "like", "cook_attempt"]
+INTERACTION_WEIGHTS = [0.7, 0.2, 0.1]
+RATINGS = [None] * 6 + [3, 4, 5]
+
+
+def _setup_module():
+    """The seeding script, for its generators (importing it has no side effects)."""
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+    spec = importlib.util.spec_from_file_location(
+        "stage_1_setup_firestore", os.path.join(SCRIPTS_DIR, "1_setup_firestore.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_recipes(n: int, setup, rng: random.Random, start: datetime.datetime) -> list:
+    with open(SEED_PATH, "r", encoding="utf-8") as f:
+        pav = json.load(f)
+    pav.update({"id": "pav_bhaji_001", "cuisine": "Indian", "region": "Maharashtra",
+                "created_at": start.isoformat()})
+    recipes = [pav]
+
+    # make_ingredients / make_steps draw from the module-level random
+    random.seed(rng.random())
+    titles = setup.RECIPE_TITLES
+    for i in range(1, n):
+        base = titles[(i - 1) % len(titles)]
+        variant = (i - 1) // len(titles)
+        title = base if variant == 0 else f"{base} {variant + 1}"
+
+        first = setup.slugify(base).split("_")[0]
+        main_ing = setup.MAIN_INGREDIENTS.get(first, "mixed vegetables")
+
+        recipes.append({
+            "id": f"{setup.slugify(title)}_{i + 1:03d}",
+            "title": title,
+            "description": f"{title} prepared in a simple home-style method.",
+            "servings": rng.choice([2, 3, 4]),
+            "prep_time_minutes": rng.randint(10, 25),
+            "cook_time_minutes": rng.randint(15, 40),
+            "difficulty": rng.choices(["easy", "medium", "hard"], weights=[0.5, 0.35, 0.15])[0],
+            "cuisine": rng.choice(["North Indian", "South Indian", "Indo-Chinese"]),
+            "region": rng.choice(["North India", "West India", "South India"]),
+            "calories": rng.randint(250, 550),
+            "tags": ["vegetarian"],
+            "ingredients": setup.make_ingredients(main_ing, setup.COMMON_INGREDIENTS, rng.randint(7, 9)),
+            "steps": setup.make_steps(title, main_ing, rng.randint(6, 8)),
+            "created_at": start.isoformat(),
+        })
+    return recipes
+
+
+def generate_users(n: int, setup) -> list:
+    names = setup.USER_NAMES
+    users = []
+    for i in range(n):
+        name = names[i % len(names)] if i < len(names) else f"{names[i % len(names)]} {i // len(names) + 1}"
+        users.append({"id": "user_" + setup.slugify(name), "name": name})
+    return users
+
+
+def generate_interactions(n: int, recipe_ids: list, user_ids: list,
+                          np_rng: np.random.Generator, start: datetime.datetime) -> list:
+    """Vectorized draw of n interactions spread over HISTORY_DAYS."""
+    recipe_idx = np_rng.integers(0, len(recipe_ids), n).tolist()
+    user_idx = np_rng.integers(0, len(user_ids), n).tolist()
+    type_idx = np_rng.choice(len(INTERACTION_TYPES), n, p=INTERACTION_WEIGHTS).tolist()
+    rating_idx = np_rng.integers(0, len(RATINGS), n).tolist()
+    offsets = np.sort(np_rng.integers(0, HISTORY_DAYS * 86_400, n))
+    ids = np_rng.integers(0, 2**63, n, dtype=np.int64).tolist()
+    timestamps = (np.datetime64(start, "s") + offsets.astype("timedelta64[s]")).astype(str).tolist()
+
+    return [
+        {
+            "id": f"{ids[i]:016x}-{i}",
+            "recipe_id": recipe_ids[recipe_idx[i]],
+            "user_id": user_ids[user_idx[i]],
+            "type": INTERACTION_TYPES[type_idx[i]],
+            "timestamp": timestamps[i],
+            "rating": RATINGS[rating_idx[i]],
+        }
+        for i in range(n)
+    ]
+
+
+def generate_dataset(scale: int, seed: int = 42) -> dict:
+    """{collection name: [document dicts]} at scale x the seed dataset."""
+    setup = _setup_module()
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    start = datetime.datetime(2025, 1, 1)
+
+    recipes = generate_recipes(SEED_RECIPES * scale, setup, rng, start)
+    users = generate_users(SEED_USERS * scale, setup)
+    interactions = generate_interactions(
+        SEED_INTERACTIONS * scale,
+        [r["id"] for r in recipes], [u["id"] for u in users], np_rng, start,
+    )
+    return {"recipes": recipes, "users": users, "interactions": interactions}
@@ -1,5 +1,3 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import json
 import uuid
 import random
@@ -8,7 +6,9 @@ import re
 import os
 import logging
 from dotenv import load_dotenv
-from utils_retry import retry   # RETRY DECORATOR
+from utils_firestore import get_db
+from utils_metrics import stage, next_step
+from utils_write_scheduler import WriteScheduler
 
 # =====================================================
 # 1. LOGGING CONFIGURATION
@@ -19,44 +19,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# =====================================================
-# 2. LOAD ENVIRONMENT VARIABLES
-# =====================================================
-load_dotenv()
-
-SERVICE_ACCOUNT_PATH = os.getenv("SERVICE_ACCOUNT_PATH")
-PAV_SEED_PATH = os.getenv("PAV_SEED_PATH")
-
-if not SERVICE_ACCOUNT_PATH:
-    raise ValueError("SERVICE_ACCOUNT_PATH not found in .env")
-
-if not PAV_SEED_PATH:
-    raise ValueError("PAV_SEED_PATH not found in .env")
-
-# =====================================================
-# 3. FIRESTORE INITIALIZATION WITH RETRY
-# =====================================================
-@retry(Exception, tries=5, delay=1, backoff=2)
-def init_firestore():
-    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app(cred)
-    return firestore.client()
-
-try:
-    db = init_firestore()
-    logger.info("Connected to Firebase Firestore successfully!")
-except Exception as e:
-    logger.error("Failed to initialize Firestore: %s", e)
-    raise
-
 
 # =====================================================
-# SAFE WRITE (RETRY FOR .set())
+# 2. SCHEDULED WRITES
+# Every .set() is submitted to the write scheduler (ramp-up
+# rate limit, adaptive concurrency, retries); each insert
+# step waits for its writes before it reports success.
+# Firestore is connected lazily on the first write.
 # =====================================================
-@retry(Exception, tries=3, delay=1, backoff=2)
-def safe_set(collection: str, doc_id: str, data: dict):
-    db.collection(collection).document(doc_id).set(data)
+def set_doc(collection: str, doc_id: str, data: dict):
+    get_db().collection(collection).document(doc_id).set(data)
 
 
 # =====================================================
@@ -111,31 +83,9 @@ def make_steps(title, main, steps_n=8):
 
 
 # =====================================================
-# 5. INSERT MAIN PAV BHAJI RECIPE
-# =====================================================
-try:
-    logger.info("Loading Pav Bhaji seed data...")
-    with open(PAV_SEED_PATH, "r", encoding="utf-8") as f:
-        pav = json.load(f)
-
-    pav["id"] = "pav_bhaji_001"
-    pav["difficulty"] = random_difficulty()
-    pav["cuisine"] = "Indian"
-    pav["region"] = "Maharashtra"
-    pav["created_at"] = timestamp()
-
-    safe_set("recipes", pav["id"], pav)
-    logger.info("Inserted main recipe: Pav Bhaji")
-
-except Exception as e:
-    logger.error("Failed to insert Pav Bhaji: %s", e)
-    raise
-
-
-# =====================================================
-# 6. INSERT 19 OTHER RECIPES (ONE-BY-ONE WITH RETRY)
+# 3. SEED DATA
 # =====================================================
-recipe_titles = [
+RECIPE_TITLES = [
     "Paneer Tikka Masala", "Kadai Paneer", "Palak Paneer", "Shahi Paneer",
     "Paneer Bhurji", "Veg Biryani", "Jeera Rice", "Aloo Gobi", "Chole Masala",
     "Rajma Masala", "Dal Tadka", "Dal Makhani", "Masala Dosa",
@@ -143,122 +93,198 @@ recipe_titles = [
     "Vegetable Fried Rice", "Bhindi Masala"
 ]
 
-common_ing = [
+COMMON_INGREDIENTS = [
     "onion", "tomato", "ginger", "garlic", "turmeric",
     "red chilli powder", "coriander powder", "garam masala",
     "oil", "butter", "peas", "carrot", "beans", "capsicum"
 ]
 
-logger.info("Generating vegetarian recipes...")
-
-try:
-    for idx, title in enumerate(recipe_titles, start=2):
-        rid = f"{slugify(title)}_{idx:03d}"
-
-        first = slugify(title).split("_")[0]
-        main_map = {
-            "paneer": "paneer",
-            "aloo": "potato",
-            "veg": "mixed vegetables",
-            "chole": "chickpeas",
-            "rajma": "kidney beans",
-            "dal": "lentils",
-            "rice": "rice",
-            "poha": "flattened rice",
-            "bhindi": "okra",
-            "dosa": "rice batter",
-            "sambar": "lentils"
-        }
-        main_ing = main_map.get(first, "mixed vegetables")
-
-        ingredients = make_ingredients(main_ing, common_ing, random.randint(7, 9))
-        steps = make_steps(title, main_ing, random.randint(6, 8))
-
-        recipe = {
-            "id": rid,
-            "title": title,
-            "description": f"{title} prepared in a simple home-style method.",
-            "servings": random.choice([2, 3, 4]),
-            "prep_time_minutes": random.randint(10, 25),
-            "cook_time_minutes": random.randint(15, 40),
-            "difficulty": random_difficulty(),
-            "cuisine": random.choice(["North Indian", "South Indian", "Indo-Chinese"]),
-            "region": random.choice(["North India", "West India", "South India"]),
-            "calories": random.randint(250, 550),
-            "tags": ["vegetarian"],
-            "ingredients": ingredients,
-            "steps": steps,
-            "created_at": timestamp()
-        }
-
-        safe_set("recipes", rid, recipe)
-
-    logger.info("All vegetarian recipes inserted successfully!")
-
-except Exception as e:
-    logger.error("Failed to insert veg recipes: %s", e)
-    raise
+MAIN_INGREDIENTS = {
+    "paneer": "paneer",
+    "aloo": "potato",
+    "veg": "mixed vegetables",
+    "chole": "chickpeas",
+    "rajma": "kidney beans",
+    "dal": "lentils",
+    "rice": "rice",
+    "poha": "flattened rice",
+    "bhindi": "okra",
+    "dosa": "rice batter",
+    "sambar": "lentils"
+}
+
+USER_NAMES = [
+    "Aarav Sharma", "Riya Singh", "Kunal Verma", "Sneha Gupta", "Rohan Mehta",
+    "Ananya Pillai", "Kavya Patil", "Manav Jain", "Tanvi Desai", "Siddharth Rao"
+]
+
+INTERACTION_COUNT = 120
+
+
+def recipe_ids():
+    return ["pav_bhaji_001"] + [
+        f"{slugify(title)}_{idx:03d}" for idx, title in enumerate(RECIPE_TITLES, start=2)
+    ]
 
 
 # =====================================================
-# 7. INSERT USERS
+# 4. INSERT MAIN PAV BHAJI RECIPE
 # =====================================================
-user_names = [
-    "Aarav Sharma", "Riya Singh", "Kunal Verma", "Sneha Gupta", "Rohan Mehta",
-    "Ananya Pillai", "Kavya Patil", "Manav Jain", "Tanvi Desai", "Siddharth Rao"
-]
+def insert_pav_bhaji(seed_path: str, writes: WriteScheduler):
+    try:
+        logger.info("Loading Pav Bhaji seed data...")
+        with open(seed_path, "r", encoding="utf-8") as f:
+            pav = json.load(f)
 
-logger.info("Inserting users...")
+        pav["id"] = "pav_bhaji_001"
+        pav["difficulty"] = random_difficulty()
+        pav["cuisine"] = "Indian"
+        pav["region"] = "Maharashtra"
+        pav["created_at"] = timestamp()
 
-try:
-    for name in user_names:
-        uid = "user_" + slugify(name)
-        user = {"id": uid, "name": name}
-        safe_set("users", uid, user)
+        writes.submit(set_doc, "recipes", pav["id"], pav)
+        writes.join()
+        logger.info("Inserted main recipe: Pav Bhaji")
 
-    logger.info("Users inserted successfully!")
+    except Exception as e:
+        logger.error("Failed to insert Pav Bhaji: %s", e)
+        raise
 
-except Exception as e:
-    logger.error("Failed to insert users: %s", e)
-    raise
+
+# =====================================================
+# 5. INSERT 19 OTHER RECIPES (THROUGH THE WRITE SCHEDULER)
+# =====================================================
+def insert_recipes(writes: WriteScheduler):
+    logger.info("Generating vegetarian recipes...")
+
+    try:
+        for idx, title in enumerate(RECIPE_TITLES, start=2):
+            rid = f"{slugify(title)}_{idx:03d}"
+
+            first = slugify(title).split("_")[0]
+            main_ing = MAIN_INGREDIENTS.get(first, "mixed vegetables")
+
+            ingredients = make_ingredients(main_ing, COMMON_INGREDIENTS, random.randint(7, 9))
+            steps = make_steps(title, main_ing, random.randint(6, 8))
+
+            recipe = {
+                "id": rid,
+                "title": title,
+                "description": f"{title} prepared in a simple home-style method.",
+                "servings": random.choice([2, 3, 4]),
+                "prep_time_minutes": random.randint(10, 25),
+                "cook_time_minutes": random.randint(15, 40),
+                "difficulty": random_difficulty(),
+                "cuisine": random.choice(["North Indian", "South Indian", "Indo-Chinese"]),
+                "region": random.choice(["North India", "West India", "South India"]),
+                "calories": random.randint(250, 550),
+                "tags": ["vegetarian"],
+                "ingredients": ingredients,
+                "steps": steps,
+                "created_at": timestamp()
+            }
+
+            writes.submit(set_doc, "recipes", rid, recipe)
+
+        writes.join()
+        logger.info("All vegetarian recipes inserted successfully!")
+
+    except Exception as e:
+        logger.error("Failed to insert veg recipes: %s", e)
+        raise
 
 
 # =====================================================
-# 8. INSERT INTERACTIONS
+# 6. INSERT USERS
 # =====================================================
-logger.info("Generating interactions...")
+def insert_users(writes: WriteScheduler):
+    logger.info("Inserting users...")
 
-try:
-    all_recipes = ["pav_bhaji_001"] + [
-        f"{slugify(title)}_{idx:03d}" for idx, title in enumerate(recipe_titles, start=2)
-    ]
-    interaction_types = ["view", "like", "cook_attempt"]
+    try:
+        for name in USER_NAMES:
+            uid = "user_" + slugify(name)
+            user = {"id": uid, "name": name}
+            writes.submit(set_doc, "users", uid, user)
+        writes.join()
+
+        logger.info("Users inserted successfully!")
+
+    except Exception as e:
+        logger.error("Failed to insert users: %s", e)
+        raise
 
-    for _ in range(120):
-        rec = random.choice(all_recipes)
-        user = random.choice(user_names)
-        user_id = "user_" + slugify(user)
 
-        itype = random.choices(interaction_types, weights=[0.7, 0.2, 0.1])[0]
+# =====================================================
+# 7. INSERT INTERACTIONS
+# =====================================================
+def insert_interactions(writes: WriteScheduler, n=INTERACTION_COUNT):
+    logger.info("Generating interactions...")
+
+    try:
+        all_recipes = recipe_ids()
+        interaction_types = ["view", "like", "cook_attempt"]
+
+        for _ in range(n):
+            rec = random.choice(all_recipes)
+            user = random.choice(USER_NAMES)
+            user_id = "user_" + slugify(user)
+
+            itype = random.choices(interaction_types, weights=[0.7, 0.2, 0.1])[0]
+
+            inter = {
+                "id": str(uuid.uuid4()),
+                "recipe_id": rec,
+                "user_id": user_id,
+                "type": itype,
+                "timestamp": timestamp(),
+                "rating": random.choice([None]*6 + [3, 4, 5])
+            }
+
+            writes.submit(set_doc, "interactions", inter["id"], inter)
+
+        writes.join()
+        logger.info("Interactions inserted successfully!")
+
+    except Exception as e:
+        logger.error("Failed to insert interactions: %s", e)
+        raise
+
+
+# =====================================================
+# 8. SETUP ENTRY POINT
+# =====================================================
+@stage("1_setup_firestore")
+def setup_firestore():
+    load_dotenv()
+    seed_path = os.getenv("PAV_SEED_PATH")
+    if not seed_path:
+        raise ValueError("PAV_SEED_PATH not found in .env")
+
+    with WriteScheduler("setup") as writes:
+        next_step("pav_bhaji")
+        insert_pav_bhaji(seed_path, writes)
+        next_step("recipes")
+        insert_recipes(writes)
+        next_step("users")
+        insert_users(writes)
+        next_step("interactions")
+        insert_interactions(writes)
 
-        inter = {
-            "id": str(uuid.uuid4()),
-            "recipe_id": rec,
-            "user_id": user_id,
-            "type": itype,
-            "timestamp": timestamp(),
-            "rating": random.choice([None]*6 + [3, 4, 5])
-        }
+    logger.info("Setup script completed successfully!")
 
-        safe_set("interactions", inter["id"], inter)
 
-    logger.info("Interactions inserted successfully!")
+def run_stage(tables=None) -> dict:
+    """In-process entry point; this stage only writes to Firestore."""
+    setup_firestore()
+    return {}
 
-except Exception as e:
-    logger.error("Failed to insert interactions: %s", e)
-    raise
 
 # =====================================================
-# DONE
+# MAIN
 # =====================================================
-logger.info("Setup script completed successfully!")
+if __name__ == "__main__":
+    try:
+        setup_firestore()
+    except Exception as e:
+        logger.error("Setup failed: %s", e)
+        raise
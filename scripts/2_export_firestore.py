@@ -1,10 +1,12 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-import pandas as pd
 import logging
 import os
-from dotenv import load_dotenv
+import argparse
 from utils_retry import retry
+from utils_firestore import get_db
+from utils_tables import write_tables, AGGREGATE_COLUMNS, INTERACTION_COLUMNS
+from cdc import (RecipeSnapshot, cdc_enabled, content_hash, invalidate_changes,
+                 new_snapshot_id, publish_changes)
+from utils_metrics import stage, next_step, count
 
 # =====================================================
 # LOGGING
@@ -15,123 +17,164 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# =====================================================
-# LOAD ENVIRONMENT VARIABLES
-# =====================================================
-load_dotenv()
-
-SERVICE_ACCOUNT_PATH = os.getenv("SERVICE_ACCOUNT_PATH")
-
-if not SERVICE_ACCOUNT_PATH:
-    raise ValueError("SERVICE_ACCOUNT_PATH missing in .env")
-
-
-# =====================================================
-# FIRESTORE INIT WITH RETRY
-# =====================================================
-@retry(Exception, tries=5, delay=1, backoff=2)
-def init_firestore():
-    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app(cred)
-    return firestore.client()
-
-
-try:
-    db = init_firestore()
-    logger.info("Connected to Firestore.")
-except Exception as e:
-    logger.error("Failed to connect: %s", e)
-    raise
+AGGREGATE_COLLECTION = "interaction_aggregates"     # written by compact_interactions.py
 
 
 # =====================================================
 # SAFE GET WITH RETRY
 # =====================================================
-@retry(Exception, tries=3, delay=1, backoff=2)
+@retry(Exception, tries=3, delay=1, backoff=2, backend="firestore")
 def safe_get(collection_name):
-    return db.collection(collection_name).stream()
+    count("firestore_calls")
+    return get_db().collection(collection_name).stream()
+
+
+def flatten_recipe(data: dict):
+    """(ingredient rows, step rows) of one recipe document; step rows carry the text."""
+    recipe_id = data.get("id")
+    ingredients = [
+        (recipe_id, item.get("name"), item.get("quantity"))
+        for item in data.get("ingredients", [])
+    ]
+    steps = [
+        (recipe_id, step.get("order"), step.get("text"))
+        for step in data.get("steps", [])
+    ]
+    return ingredients, steps
 
 
 # =====================================================
 # EXPORT FUNCTION
 # =====================================================
-def export_firestore():
-    os.makedirs("outputs", exist_ok=True)
-    logger.info("Output folder ready.")
+@stage("2_export_firestore")
+def export_firestore(write_files=True, cdc=None) -> dict:
+    """
+    Flatten the Firestore collections into tables.
+
+    Returns {table name: DataFrame}; with write_files the tables are also
+    written to their CSV files under outputs/. With cdc (default: EXPORT_CDC)
+    recipes are diffed against the previous snapshot (see cdc.py).
+    """
+    import pandas as pd
 
     # ---------------------------- RECIPES ----------------------------
+    next_step("recipes")
     logger.info("Fetching RECIPES...")
     recipe_docs = safe_get("recipes")
 
+    cdc = cdc_enabled() if cdc is None else cdc
+    previous = RecipeSnapshot.load() if cdc else RecipeSnapshot()
+    current = RecipeSnapshot(new_snapshot_id())
+    keyed = True            # every recipe has its own id (required to diff by id)
+
     recipes_list = []
     ingredients_list = []
     steps_list = []
+    step_text_ids = {}   # step text -> dictionary id (step_text is dictionary-encoded)
 
     for doc in recipe_docs:
         data = doc.to_dict()
         recipes_list.append(data)
-
         recipe_id = data.get("id")
 
-        # ---------------- EXTRACT INGREDIENTS ----------------
-        ing = data.get("ingredients", [])
-        for item in ing:
-            ingredients_list.append({
-                "recipe_id": recipe_id,
-                "ingredient_name": item.get("name"),
-                "quantity": item.get("quantity")
-            })
-
-        # ---------------- EXTRACT STEPS ----------------
-        step_data = data.get("steps", [])
-        for step in step_data:
-            steps_list.append({
-                "recipe_id": recipe_id,
-                "order": step.get("order"),
-                "step_text": step.get("text")
-            })
-
-    # Save recipes
-    recipes_df = pd.DataFrame(recipes_list)
-    recipes_df.to_csv("outputs/recipe.csv", index=False)
-    logger.info("recipes.csv exported.")
-
-    # Save ingredients
-    ingredients_df = pd.DataFrame(ingredients_list)
-    ingredients_df.to_csv("outputs/ingredients.csv", index=False)
-    logger.info("ingredients.csv exported.")
-
-    # Save steps
-    steps_df = pd.DataFrame(steps_list)
-    steps_df.to_csv("outputs/steps.csv", index=False)
-    logger.info("steps.csv exported.")
+        if cdc:
+            # unchanged recipes reuse the rows flattened by the previous export
+            digest = content_hash(data)
+            rows = previous.cached_rows(recipe_id, digest) or flatten_recipe(data)
+            if recipe_id is None or recipe_id in current.docs:
+                keyed = False
+            current.docs[recipe_id] = (digest, *rows)
+        else:
+            rows = flatten_recipe(data)
+
+        ingredients_list.extend(rows[0])
+        for rid, order, text in rows[1]:
+            steps_list.append((
+                rid, order, None if text is None else step_text_ids.setdefault(text, len(step_text_ids))
+            ))
+
+    count("firestore_docs", len(recipes_list))
+    tables = {
+        "recipe": pd.DataFrame(recipes_list),
+        "ingredients": pd.DataFrame(ingredients_list, columns=["recipe_id", "ingredient_name", "quantity"]),
+    }
+
+    steps_df = pd.DataFrame(steps_list, columns=["recipe_id", "order", "step_text_id"])
+    steps_df["step_text_id"] = steps_df["step_text_id"].astype("Int64")
+    tables["steps"] = steps_df
+    tables["step_texts"] = pd.DataFrame({
+        "step_text_id": list(step_text_ids.values()),
+        "step_text": list(step_text_ids.keys()),
+    })
+    logger.info("Recipes flattened (%d distinct step texts).", len(step_text_ids))
+
+    if cdc and keyed:
+        next_step("cdc")
+        publish_changes(previous, current, recipes_list)
+    elif cdc:
+        logger.warning("Recipes without a unique id: no change set written, consumers rebuild fully.")
+        invalidate_changes()
+    else:
+        invalidate_changes()
 
     # ---------------------------- USERS ----------------------------
+    next_step("users")
     logger.info("Fetching USERS...")
     user_docs = safe_get("users")
-    users_list = [doc.to_dict() for doc in user_docs]
-
-    pd.DataFrame(users_list).to_csv("outputs/users.csv", index=False)
-    logger.info("users.csv exported.")
+    tables["users"] = pd.DataFrame([doc.to_dict() for doc in user_docs])
+    count("firestore_docs", len(tables["users"]))
 
     # ---------------------------- INTERACTIONS ----------------------------
+    next_step("interactions")
     logger.info("Fetching INTERACTIONS...")
     inter_docs = safe_get("interactions")
-    inter_list = [doc.to_dict() for doc in inter_docs]
-
-    pd.DataFrame(inter_list).to_csv("outputs/interactions.csv", index=False)
-    logger.info("interactions.csv exported.")
+    tables["interactions"] = pd.DataFrame([doc.to_dict() for doc in inter_docs], columns=INTERACTION_COLUMNS)
+    count("firestore_docs", len(tables["interactions"]))
+
+    # ------------------- COMPACTED INTERACTIONS -------------------
+    # older interactions rolled up by compact_interactions.py:
+    # one row per (recipe, day, user, type, rating) with its count
+    next_step("interaction_aggregates")
+    logger.info("Fetching INTERACTION AGGREGATES...")
+    aggregate_docs = safe_get(AGGREGATE_COLLECTION)
+    aggregate_rows = []
+    aggregate_count = 0
+    for doc in aggregate_docs:
+        data = doc.to_dict()
+        aggregate_count += 1
+        for group in data.get("groups", []):
+            aggregate_rows.append({"recipe_id": data.get("recipe_id"), "day": data.get("day"), **group})
+    tables["interaction_aggregates"] = pd.DataFrame(aggregate_rows, columns=AGGREGATE_COLUMNS)
+    count("firestore_docs", aggregate_count)
+    if aggregate_count:
+        logger.info("%d compacted interactions in %d recipe-day aggregates.",
+                    int(tables["interaction_aggregates"]["count"].sum()), aggregate_count)
+
+    if write_files:
+        next_step("write")
+        os.makedirs("outputs", exist_ok=True)
+        write_tables(tables)
 
     logger.info("All collections exported successfully!")
+    return tables
+
+
+def run_stage(tables=None) -> dict:
+    """In-process entry point: tables are handed downstream in memory."""
+    return export_firestore(write_files=False)
 
 
 # =====================================================
 # MAIN
 # =====================================================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Firestore collections to CSV")
+    parser.add_argument("--cdc", action="store_true",
+                        help="diff recipes against the previous export and write change sets (EXPORT_CDC)")
+    args = parser.parse_args()
+
     try:
-        export_firestore()
+        export_firestore(cdc=args.cdc or None)
         logger.info("Export script completed successfully!")
     except Exception as e:
         logger.error("Export failed: %s", e)
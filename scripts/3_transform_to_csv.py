@@ -1,7 +1,11 @@
-import pandas as pd
 import os
+import pandas as pd
 import logging
-from utils_retry import retry
+from utils_steps import encode_step_text, compact_dictionary, decode_step_text
+from utils_quantity import COLUMNS as QUANTITY_COLUMNS, normalize_quantities
+from utils_tables import get_table, get_optional_table, write_tables, AGGREGATE_COLUMNS, TABLE_PATHS
+from cdc import incremental_changes, changed_ids, merge_changed, mark_processed
+from utils_metrics import stage, next_step
 
 # =====================================================
 # LOGGING
@@ -14,77 +18,152 @@ logger = logging.getLogger(__name__)
 
 
 # =====================================================
-# RETRY CSV READ (in case file is locked or slow)
-# =====================================================
-@retry(Exception, tries=3, delay=1, backoff=2)
-def safe_read_csv(path):
-    return pd.read_csv(path)
-
-
-# =====================================================
-# MAIN TRANSFORMATION FUNCTION
+# RECIPE TABLES
+# -----------------------------------------------------
+# Recipes, ingredients and steps are cleaned row by row
+# within a recipe, so after a CDC export (see cdc.py)
+# only the changed recipes are cleaned again and merged
+# into the previous clean tables.
 # =====================================================
-def transform_data():
-
-    input_folder = "outputs"
-    output_folder = "outputs/clean"
-    os.makedirs(output_folder, exist_ok=True)
-    logger.info("Clean output folder created.")
+CDC_CONSUMER = "3_transform_to_csv"
+# code the clean tables depend on: a change there forces a full clean
+CDC_SOURCES = ("3_transform_to_csv.py", "utils_quantity.py", "utils_steps.py", "cdc.py")
+RECIPE_CLEAN_TABLES = ["recipes_clean", "ingredients_clean", "steps_clean", "step_texts_clean"]
 
-    # ---------------------------- READ FILES ----------------------------
-    logger.info("Loading exported CSV files...")
-
-    recipes = safe_read_csv(f"{input_folder}/recipe.csv")
-    ingredients = safe_read_csv(f"{input_folder}/ingredients.csv")
-    steps = safe_read_csv(f"{input_folder}/steps.csv")
-    users = safe_read_csv(f"{input_folder}/users.csv")
-    interactions = safe_read_csv(f"{input_folder}/interactions.csv")
-
-    logger.info("All source CSV files successfully read.")
-
-    # ---------------------------- CLEAN RECIPES ----------------------------
-    logger.info("Cleaning recipes...")
 
+def clean_recipes(recipes: pd.DataFrame) -> pd.DataFrame:
+    recipes = recipes.copy()
     recipes["title"] = recipes["title"].astype(str).str.strip()
     recipes["difficulty"] = recipes["difficulty"].astype(str).str.lower()
 
     # Remove duplicates if any
-    recipes = recipes.drop_duplicates(subset=["id"])
-
-    recipes.to_csv(f"{output_folder}/recipes_clean.csv", index=False)
-    logger.info("recipes_clean.csv created.")
+    return recipes.drop_duplicates(subset=["id"])
 
-    # ---------------------------- CLEAN INGREDIENTS ----------------------------
-    logger.info("Cleaning ingredients...")
 
+def clean_ingredients(ingredients: pd.DataFrame) -> pd.DataFrame:
+    ingredients = ingredients.copy()
     ingredients["ingredient_name"] = ingredients["ingredient_name"].astype(str).str.strip()
     ingredients = ingredients.drop_duplicates()
 
-    ingredients.to_csv(f"{output_folder}/ingredients_clean.csv", index=False)
-    logger.info("ingredients_clean.csv created.")
+    # Normalize free-text quantities ("1 cup", "½ cup", "150g") to metric amounts
+    ingredients = ingredients.drop(columns=QUANTITY_COLUMNS, errors="ignore")
+    return ingredients.join(normalize_quantities(ingredients["quantity"]))
 
-    # ---------------------------- CLEAN STEPS ----------------------------
-    logger.info("Cleaning steps...")
 
+def clean_steps(steps: pd.DataFrame) -> pd.DataFrame:
     steps = steps.drop_duplicates()
-
     steps["order"] = steps["order"].astype(int)
+    # stable: steps sharing an order keep their export order
+    return steps.sort_values(by=["recipe_id", "order"], kind="stable")
 
-    steps = steps.sort_values(by=["recipe_id", "order"])
 
-    steps.to_csv(f"{output_folder}/steps_clean.csv", index=False)
-    logger.info("steps_clean.csv created.")
+def clean_recipe_tables(recipes, ingredients, steps, step_texts):
+    next_step("recipes")
+    logger.info("Cleaning recipes...")
+    recipes = clean_recipes(recipes)
+
+    next_step("ingredients")
+    logger.info("Cleaning ingredients and normalizing quantities...")
+    ingredients = clean_ingredients(ingredients)
+
+    next_step("steps")
+    logger.info("Cleaning steps...")
+    # keep only referenced step texts, with dense ids
+    steps, step_texts = compact_dictionary(clean_steps(steps), step_texts)
+    return recipes, ingredients, steps, step_texts
+
+
+def has_previous_output() -> bool:
+    return all(os.path.exists(TABLE_PATHS[name]) for name in RECIPE_CLEAN_TABLES)
+
+
+def apply_recipe_changes(changes, recipes, ingredients, steps, step_texts):
+    """
+    Clean only the recipes in the change set and merge them into the
+    previous clean tables (unchanged recipes are taken as they are).
+    The result matches a full clean of the current export.
+    """
+    changed = changed_ids(changes)
+    order = recipes["id"]
+    logger.info("Incremental clean of snapshot %s: %d changed, %d deleted recipes.",
+                changes["snapshot"], len(changed), len(changes["delete"]))
+
+    next_step("recipes")
+    recipes = merge_changed(
+        get_table(None, "recipes_clean"), clean_recipes(recipes[recipes["id"].isin(changed)]),
+        changes, order, key="id",
+    )
+
+    next_step("ingredients")
+    ingredients = merge_changed(
+        get_table(None, "ingredients_clean"),
+        clean_ingredients(ingredients[ingredients["recipe_id"].isin(changed)]),
+        changes, order,
+    )
+
+    next_step("steps")
+    # previous steps go back to text, then onto this export's dictionary ids
+    previous = get_table(None, "steps_clean")
+    previous_text = decode_step_text(previous, get_table(None, "step_texts_clean"))
+    text_ids = pd.Series(step_texts["step_text_id"].to_numpy(), index=step_texts["step_text"].to_numpy())
+    previous["step_text_id"] = previous_text.map(text_ids).astype("Int64")
+    kept = previous[~previous["recipe_id"].isin(changed | set(changes["delete"]))]
+    merged = pd.concat([kept, steps[steps["recipe_id"].isin(changed)]], ignore_index=True)
+    steps, step_texts = compact_dictionary(clean_steps(merged), step_texts)
+    return recipes, ingredients, steps, step_texts
+
+
+# =====================================================
+# MAIN TRANSFORMATION FUNCTION
+# =====================================================
+@stage("3_transform_to_csv")
+def transform_data(tables=None, write_files=True) -> dict:
+    """
+    Clean the exported tables.
+
+    Input tables come from memory when handed over (in-process pipeline),
+    otherwise from the CSV files in outputs/. Returns the *_clean tables;
+    with write_files they are also written to outputs/clean/ and the CDC
+    snapshot is marked processed (else checkpoint_written() does that).
+    """
+    # ---------------------------- READ FILES ----------------------------
+    next_step("load")
+    logger.info("Loading exported tables...")
+
+    recipes = get_table(tables, "recipe")
+    ingredients = get_table(tables, "ingredients")
+    steps = get_table(tables, "steps")
+    if "step_text" in steps.columns:
+        # legacy export with inline text: encode it here
+        steps, step_texts = encode_step_text(steps)
+    else:
+        step_texts = get_table(tables, "step_texts")
+    users = get_table(tables, "users")
+    # always the full history: the clean tables are rewritten as a whole, so
+    # INTERACTIONS_SINCE/UNTIL only apply to the readers downstream
+    interactions = get_table(tables, "interactions")
+    interaction_aggregates = get_optional_table(tables, "interaction_aggregates", AGGREGATE_COLUMNS)
+
+    logger.info("All source tables successfully loaded.")
+
+    # ---------------------------- RECIPES / INGREDIENTS / STEPS ----------------------------
+    changes = incremental_changes(CDC_CONSUMER, CDC_SOURCES) if has_previous_output() else None
+    if changes is None:
+        recipes, ingredients, steps, step_texts = clean_recipe_tables(recipes, ingredients, steps, step_texts)
+    else:
+        recipes, ingredients, steps, step_texts = apply_recipe_changes(
+            changes, recipes, ingredients, steps, step_texts
+        )
 
     # ---------------------------- CLEAN USERS ----------------------------
+    next_step("users")
     logger.info("Cleaning users...")
 
     users = users.drop_duplicates()
     users["name"] = users["name"].astype(str).str.title()
 
-    users.to_csv(f"{output_folder}/users_clean.csv", index=False)
-    logger.info("users_clean.csv created.")
-
     # ---------------------------- CLEAN INTERACTIONS ----------------------------
+    next_step("interactions")
     logger.info("Cleaning interactions...")
 
     interactions = interactions.drop_duplicates(subset=["id"])
@@ -92,11 +171,40 @@ def transform_data():
     # Convert timestamp to datetime safely
     interactions["timestamp"] = pd.to_datetime(interactions["timestamp"], errors="coerce")
 
-    interactions.to_csv(f"{output_folder}/interactions_clean.csv", index=False)
-    logger.info("interactions_clean.csv created.")
+    # compacted older interactions: keep groups that still count something
+    interaction_aggregates = interaction_aggregates.dropna(subset=["recipe_id"])
+    interaction_aggregates["count"] = (
+        pd.to_numeric(interaction_aggregates["count"], errors="coerce").fillna(0).astype(int)
+    )
+    interaction_aggregates = interaction_aggregates[interaction_aggregates["count"] > 0]
+
+    clean = {
+        "recipes_clean": recipes,
+        "ingredients_clean": ingredients,
+        "steps_clean": steps,
+        "step_texts_clean": step_texts,
+        "users_clean": users,
+        "interactions_clean": interactions,
+        "interaction_aggregates_clean": interaction_aggregates,
+    }
+    if write_files:
+        next_step("write")
+        write_tables(clean)
+        mark_processed(CDC_CONSUMER, CDC_SOURCES)
 
     # ---------------------------- DONE ----------------------------
     logger.info("Transformation completed successfully!")
+    return clean
+
+
+def run_stage(tables=None) -> dict:
+    """In-process entry point: clean tables are handed downstream in memory."""
+    return transform_data(tables, write_files=False)
+
+
+def checkpoint_written():
+    """Called by run_pipeline once the in-process clean tables are on disk."""
+    mark_processed(CDC_CONSUMER, CDC_SOURCES)
 
 
 # =====================================================
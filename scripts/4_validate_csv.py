@@ -1,7 +1,7 @@
-import pandas as pd
 import os
 import logging
-from utils_retry import retry
+from utils_tables import get_table, interaction_window
+from utils_metrics import stage, next_step
 
 # =====================================================
 # LOGGING
@@ -13,35 +13,31 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-# =====================================================
-# SAFE CSV READ WITH RETRY
-# =====================================================
-@retry(Exception, tries=3, delay=1, backoff=2)
-def safe_read_csv(path):
-    return pd.read_csv(path)
-
-
 # =====================================================
 # VALIDATION FUNCTION
 # =====================================================
-def validate_csv_files():
+@stage("4_validate_csv")
+def validate_csv_files(tables=None):
+    """Validate the exported tables (in memory when handed over, else the CSVs)."""
+    import pandas as pd
 
-    input_folder = "outputs"
     output_folder = "outputs/validated"
     os.makedirs(output_folder, exist_ok=True)
     logger.info("Validation folder created.")
 
     # ---------------------------- LOAD CSV FILES ----------------------------
+    next_step("load")
     logger.info("Reading CSV files for validation...")
 
-    recipes = safe_read_csv(f"{input_folder}/recipe.csv")
-    ingredients = safe_read_csv(f"{input_folder}/ingredients.csv")
-    steps = safe_read_csv(f"{input_folder}/steps.csv")
-    users = safe_read_csv(f"{input_folder}/users.csv")
-    interactions = safe_read_csv(f"{input_folder}/interactions.csv")
+    recipes = get_table(tables, "recipe")
+    ingredients = get_table(tables, "ingredients")
+    steps = get_table(tables, "steps")
+    users = get_table(tables, "users")
+    interactions = get_table(tables, "interactions", *interaction_window())
 
     logger.info("All CSV files loaded successfully.")
 
+    next_step("checks")
     validation_report = []
 
     # =====================================================
@@ -94,6 +90,20 @@ def validate_csv_files():
     else:
         validation_report.append("✔ Steps: order column valid")
 
+    # dictionary-encoded step text: every id must resolve to one text
+    if "step_text_id" in steps.columns:
+        step_texts = get_table(tables, "step_texts")
+
+        if step_texts["step_text_id"].duplicated().any():
+            validation_report.append("❌ Steps: Duplicate step_text_id in step text dictionary")
+        else:
+            validation_report.append("✔ Steps: step text dictionary ids unique")
+
+        if steps["step_text_id"].dropna().isin(step_texts["step_text_id"]).all():
+            validation_report.append("✔ Steps: All step_text_id match step text dictionary")
+        else:
+            validation_report.append("❌ Steps: Some step_text_id do NOT exist in step text dictionary")
+
     # =====================================================
     # 4. User Validation
     # =====================================================
@@ -149,6 +159,12 @@ def validate_csv_files():
     logger.info(f"Report saved to {report_path}")
 
 
+def run_stage(tables=None) -> dict:
+    """In-process entry point; the report file is this stage's only output."""
+    validate_csv_files(tables)
+    return {}
+
+
 # =====================================================
 # MAIN EXECUTION
 # =====================================================
@@ -1,7 +1,7 @@
 import os
 import logging
-import pandas as pd
-from utils_retry import retry
+from utils_tables import get_table, interaction_window
+from utils_metrics import stage, next_step
 
 # =====================================================
 # LOGGING
@@ -12,18 +12,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-BASE_PATH = os.path.join("outputs", "clean")
 REPORT_PATH = os.path.join("outputs", "validated", "custom_ge_report.txt")
 
 
-# =====================================================
-# SAFE CSV READ WITH RETRY
-# =====================================================
-@retry(Exception, tries=3, delay=1, backoff=2)
-def safe_read_csv(path: str) -> pd.DataFrame:
-    return pd.read_csv(path)
-
-
 # =====================================================
 # EXPECTATION HELPERS (GE-STYLE)
 # =====================================================
@@ -80,6 +71,8 @@ def expect_column_type_integer(df, column, table_name):
             "details": f"Column '{column}' does not exist"
         }
     # try to convert to integer type
+    import pandas as pd
+
     try:
         pd.to_numeric(df[column].dropna(), downcast="integer")
         success = True
@@ -129,7 +122,9 @@ def expect_foreign_key_match(df_child, child_col, df_parent, parent_col, table_n
 # =====================================================
 # MAIN VALIDATION FUNCTION
 # =====================================================
-def run_custom_expectations():
+@stage("4a_great_expectations_check")
+def run_custom_expectations(tables=None):
+    """Run the checks on the clean tables (in memory when handed over, else the CSVs)."""
     os.makedirs(os.path.join("outputs", "validated"), exist_ok=True)
     logger.info("Starting custom GE-style validation...")
 
@@ -138,15 +133,18 @@ def run_custom_expectations():
     # -------------------------------------------------
     # Load all cleaned CSVs
     # -------------------------------------------------
-    recipes = safe_read_csv(os.path.join(BASE_PATH, "recipes_clean.csv"))
-    ingredients = safe_read_csv(os.path.join(BASE_PATH, "ingredients_clean.csv"))
-    steps = safe_read_csv(os.path.join(BASE_PATH, "steps_clean.csv"))
-    users = safe_read_csv(os.path.join(BASE_PATH, "users_clean.csv"))
-    interactions = safe_read_csv(os.path.join(BASE_PATH, "interactions_clean.csv"))
+    next_step("load")
+    recipes = get_table(tables, "recipes_clean")
+    ingredients = get_table(tables, "ingredients_clean")
+    steps = get_table(tables, "steps_clean")
+    step_texts = get_table(tables, "step_texts_clean")
+    users = get_table(tables, "users_clean")
+    interactions = get_table(tables, "interactions_clean", *interaction_window())
 
     # =================================================
     # RECIPES CHECKS
     # =================================================
+    next_step("checks")
     table = "RECIPES_CLEAN"
     logger.info("Validating %s...", table)
 
@@ -193,6 +191,26 @@ def run_custom_expectations():
         )
     )
 
+    # FK: steps.step_text_id -> step_texts.step_text_id (steps without text carry no id)
+    results.append(expect_column_to_exist(steps, "step_text_id", table))
+    results.append(
+        expect_foreign_key_match(
+            steps.dropna(subset=["step_text_id"]), "step_text_id",
+            step_texts, "step_text_id", table
+        )
+    )
+
+    # =================================================
+    # STEP TEXT DICTIONARY CHECKS
+    # =================================================
+    table = "STEP_TEXTS_CLEAN"
+    logger.info("Validating %s...", table)
+
+    results.append(expect_column_to_exist(step_texts, "step_text_id", table))
+    results.append(expect_column_to_exist(step_texts, "step_text", table))
+    results.append(expect_column_values_not_null(step_texts, "step_text_id", table))
+    results.append(expect_column_values_unique(step_texts, "step_text_id", table))
+
     # =================================================
     # USERS CHECKS
     # =================================================
@@ -232,6 +250,7 @@ def run_custom_expectations():
     # =================================================
     # WRITE TEXT REPORT
     # =================================================
+    next_step("report")
     logger.info("Writing custom GE-style report to %s", REPORT_PATH)
 
     # group results by table for nicer formatting
@@ -268,6 +287,12 @@ def run_custom_expectations():
     logger.info("Report saved to %s", REPORT_PATH)
 
 
+def run_stage(tables=None) -> dict:
+    """In-process entry point; the report file is this stage's only output."""
+    run_custom_expectations(tables)
+    return {}
+
+
 # =====================================================
 # MAIN
 # =====================================================
@@ -1,8 +1,16 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
 import logging
-from utils_retry import retry
+import argparse
+from utils_engagement import ENGAGEMENT_WEIGHTS
+from text_index import index_for
+from utils_tables import (get_table, get_optional_table, AGGREGATE_COLUMNS, aggregates_in_window,
+                          interaction_window)
+from utils_metrics import stage, next_step
+from analytics_partitions import compute_recipe_aggregates, ingredient_counts
+from utils_stats import (
+    RunningMoments, RunningCovariance, FixedBinHistogram, RatingAccumulator, iter_chunks
+)
 
 # =====================================================
 # LOGGING
@@ -14,46 +22,110 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # =====================================================
-# SAFE CSV READ WITH RETRY
+# STREAMING DISTRIBUTION STATISTICS
 # =====================================================
-@retry(Exception, tries=3, delay=1, backoff=2)
-def safe_read_csv(path: str) -> pd.DataFrame:
-    return pd.read_csv(path)
+STATS_CHUNK_SIZE = 50_000
+QUANTILE_BINS = 200
+COMPLEXITY_BINS = 15
+RATING_PRIOR_WEIGHT = 5     # pseudo-ratings at the global mean in the Bayesian average
+
+NUMERIC_COLS = [
+    "prep_time_minutes",
+    "cook_time_minutes",
+    "total_time",
+    "likes",
+    "views",
+    "attempts",
+    "complexity_score",
+    "engagement_score",
+    "rating_count",
+    "rating_bayes",
+]
+
+
+def compute_distribution_stats(recipes: pd.DataFrame, columns, chunk_size=STATS_CHUNK_SIZE):
+    """
+    Feed the recipes table chunk by chunk into mergeable accumulators.
+
+    Returns (moments, covariance, histograms). A first pass collects
+    moments + covariance, a second pass fills fixed-bin histograms whose
+    edges come from the merged min/max.
+    """
+    moments = {c: RunningMoments() for c in columns}
+    covariance = RunningCovariance(columns)
+
+    for chunk in iter_chunks(recipes, chunk_size):
+        for c in columns:
+            moments[c].update(chunk[c])
+        covariance.update(chunk)
+
+    histograms = {
+        c: FixedBinHistogram.from_range(moments[c].min, moments[c].max, QUANTILE_BINS)
+        for c in columns if moments[c].n
+    }
+    for chunk in iter_chunks(recipes, chunk_size):
+        for c, hist in histograms.items():
+            hist.update(chunk[c])
+
+    return moments, covariance, histograms
 
 
 # =====================================================
 # MAIN ANALYTICS FUNCTION
 # =====================================================
-def run_analytics():
+@stage("5_analytics")
+def run_analytics(tables=None, partitions=None, since=None, until=None):
+    """
+    partitions: recipe-hash partitions whose per-recipe aggregates are
+    computed in parallel worker processes (default ANALYTICS_PARTITIONS,
+    1 = single process, 0 = one per CPU).
+    since/until: only interactions in [since, until) (default
+    INTERACTIONS_SINCE / INTERACTIONS_UNTIL); other date partitions are not read.
+    """
+    import matplotlib.pyplot as plt     # only needed once charts are drawn
+
     # Folders
-    clean_folder = os.path.join("outputs", "clean")
     analysis_folder = "analysis"
     os.makedirs(analysis_folder, exist_ok=True)
     logger.info("Analysis folder ready.")
 
     # -----------------------------
-    # Load cleaned CSV files
+    # Load cleaned tables (in memory when handed over, else the CSVs)
+    # get_table returns private copies, safe to modify below
     # -----------------------------
-    logger.info("Loading cleaned CSV files for analytics...")
-
-    recipes = safe_read_csv(os.path.join(clean_folder, "recipes_clean.csv"))
-    ingredients = safe_read_csv(os.path.join(clean_folder, "ingredients_clean.csv"))
-    interactions = safe_read_csv(os.path.join(clean_folder, "interactions_clean.csv"))
-    steps = safe_read_csv(os.path.join(clean_folder, "steps_clean.csv"))
-    users = safe_read_csv(os.path.join(clean_folder, "users_clean.csv"))
+    next_step("load")
+    logger.info("Loading cleaned tables for analytics...")
+
+    recipes = get_table(tables, "recipes_clean")
+    ingredients = get_table(tables, "ingredients_clean")
+    if since is None and until is None:
+        since, until = interaction_window()
+    interactions = get_table(tables, "interactions_clean", since, until)
+    # older interactions compacted into per-recipe/day counts (compact_interactions.py)
+    compacted = aggregates_in_window(
+        get_optional_table(tables, "interaction_aggregates_clean", AGGREGATE_COLUMNS), since, until
+    )
+    steps = get_table(tables, "steps_clean")
+    step_texts = get_table(tables, "step_texts_clean")
 
-    # Safe copies
-    recipes = recipes.copy()
-    ingredients = ingredients.copy()
-    interactions = interactions.copy()
-    steps = steps.copy()
-    users = users.copy()
+    if interactions.empty and compacted.empty:
+        logger.warning("No interactions in the window (since=%s, until=%s): engagement, rating "
+                       "and user activity outputs are empty or zero.", since, until)
+    logger.info("Tables loaded successfully. Starting analytics...")
 
-    logger.info("CSV files loaded successfully. Starting analytics...")
+    # --------------------------------------------------------------
+    # RECIPE AGGREGATES
+    # Per-recipe / per-ingredient / per-user aggregates of the large
+    # tables, computed partition by partition (analytics_partitions.py)
+    # --------------------------------------------------------------
+    next_step("recipe_aggregates")
+    aggregates = compute_recipe_aggregates(recipes, ingredients, interactions, steps, partitions,
+                                           compacted)
 
     # --------------------------------------------------------------
     # DERIVED METRICS
     # --------------------------------------------------------------
+    next_step("derived_metrics")
     logger.info("Calculating derived metrics...")
 
     # Total time
@@ -62,14 +134,9 @@ def run_analytics():
         recipes["cook_time_minutes"].fillna(0)
     )
 
-    # Interactions split
-    likes = interactions[interactions["type"] == "like"]
-    views = interactions[interactions["type"] == "view"]
-    attempts = interactions[interactions["type"] == "cook_attempt"]
-
-    likes_count = likes.groupby("recipe_id").size().rename("likes")
-    views_count_full = views.groupby("recipe_id").size().rename("views")
-    attempts_count = attempts.groupby("recipe_id").size().rename("attempts")
+    likes_count = aggregates["likes"]
+    views_count_full = aggregates["views"]
+    attempts_count = aggregates["attempts"]
 
     # Merge engagement metrics back to recipes
     recipes = recipes.merge(likes_count, left_on="id", right_index=True, how="left")
@@ -80,11 +147,26 @@ def run_analytics():
     recipes["views"] = recipes["views"].fillna(0)
     recipes["attempts"] = recipes["attempts"].fillna(0)
 
+    # --------------------------------------------------------------
+    # RATINGS (count, mean, Bayesian average, star distribution)
+    # accumulated chunk by chunk so partial results can be merged
+    # --------------------------------------------------------------
+    next_step("ratings")
+    rating_stats = aggregates["ratings"].result(RATING_PRIOR_WEIGHT)
+    global_rating_mean = rating_stats.attrs["global_mean"]
+
+    recipes = recipes.merge(rating_stats, left_on="id", right_index=True, how="left")
+    star_cols = [f"rating_{s}" for s in RatingAccumulator.STARS]
+    recipes[["rating_count"] + star_cols] = recipes[["rating_count"] + star_cols].fillna(0).astype(int)
+    # unrated recipes sit exactly at the prior (global mean)
+    recipes["rating_bayes"] = recipes["rating_bayes"].fillna(global_rating_mean)
+
     # --------------------------------------------------------------
     # RECIPE COMPLEXITY SCORE
     # complexity = prep_time + cook_time + number_of_steps
     # --------------------------------------------------------------
-    step_counts_raw = steps.groupby("recipe_id").size().rename("step_count")
+    next_step("complexity_engagement")
+    step_counts_raw = aggregates["step_count"].rename("step_count")
     recipes = recipes.merge(step_counts_raw, left_on="id", right_index=True, how="left")
     recipes["step_count"] = recipes["step_count"].fillna(0)
 
@@ -99,17 +181,44 @@ def run_analytics():
     # engagement_score = views*0.5 + likes*1 + attempts*2
     # --------------------------------------------------------------
     recipes["engagement_score"] = (
-        recipes["views"] * 0.5 +
-        recipes["likes"] * 1.0 +
-        recipes["attempts"] * 2.0
+        recipes["views"] * ENGAGEMENT_WEIGHTS["view"] +
+        recipes["likes"] * ENGAGEMENT_WEIGHTS["like"] +
+        recipes["attempts"] * ENGAGEMENT_WEIGHTS["cook_attempt"]
     )
 
+    # --------------------------------------------------------------
+    # STREAMING STATISTICS (moments, covariance, quantile sketches)
+    # --------------------------------------------------------------
+    next_step("distribution_stats")
+    logger.info("Computing streaming distribution statistics...")
+
+    numeric_present = [c for c in NUMERIC_COLS if c in recipes.columns]
+    moments, covariance, histograms = compute_distribution_stats(recipes, numeric_present)
+
+    # pairwise-complete, like DataFrame.corr(): a column without values
+    # (e.g. rating_bayes when nothing is rated) only blanks its own pairs
+    corr_matrix = covariance.corr()
+
+    distribution_stats = pd.DataFrame([
+        {
+            "column": c,
+            **moments[c].to_dict(),
+            "p25": histograms[c].quantile(0.25) if c in histograms else float("nan"),
+            "p50": histograms[c].quantile(0.50) if c in histograms else float("nan"),
+            "p75": histograms[c].quantile(0.75) if c in histograms else float("nan"),
+            "p90": histograms[c].quantile(0.90) if c in histograms else float("nan"),
+        }
+        for c in numeric_present
+    ])
+    distribution_stats.to_csv(os.path.join(analysis_folder, "distribution_stats.csv"), index=False)
+
     # ==============================================================
     # 1. MOST COMMON INGREDIENTS
     # ==============================================================
+    next_step("top_ingredients")
     logger.info("Generating: Top common ingredients chart & CSV...")
 
-    top_ingredients = ingredients["ingredient_name"].value_counts().head(10)
+    top_ingredients = ingredient_counts(aggregates["ingredient_counts"]).head(10)
 
     plt.figure(figsize=(10, 6))
     top_ingredients.plot(kind="bar", color="skyblue")
@@ -125,10 +234,11 @@ def run_analytics():
     # ==============================================================
     # 2. AVERAGE PREPARATION & TOTAL TIME
     # ==============================================================
+    next_step("prep_time")
     logger.info("Generating: Prep time summary CSV...")
 
-    avg_prep = recipes["prep_time_minutes"].mean()
-    avg_total = recipes["total_time"].mean()
+    avg_prep = moments["prep_time_minutes"].mean if moments["prep_time_minutes"].n else float("nan")
+    avg_total = moments["total_time"].mean if moments["total_time"].n else float("nan")
 
     pd.DataFrame({
         "average_prep_time": [avg_prep],
@@ -138,6 +248,7 @@ def run_analytics():
     # ==============================================================
     # 3. DIFFICULTY DISTRIBUTION
     # ==============================================================
+    next_step("difficulty")
     logger.info("Generating: Difficulty distribution chart & CSV...")
 
     difficulty_dist = recipes["difficulty"].value_counts()
@@ -155,9 +266,10 @@ def run_analytics():
     # ==============================================================
     # 4. CORRELATION BETWEEN PREP TIME AND LIKES
     # ==============================================================
+    next_step("prep_vs_likes")
     logger.info("Generating: Prep vs Likes correlation and scatter chart...")
 
-    correlation_value = recipes["prep_time_minutes"].corr(recipes["likes"])
+    correlation_value = corr_matrix.loc["prep_time_minutes", "likes"]
 
     pd.DataFrame({"correlation_prep_vs_likes": [correlation_value]}).to_csv(
         os.path.join(analysis_folder, "correlation_prep_likes.csv"), index=False
@@ -175,6 +287,7 @@ def run_analytics():
     # ==============================================================
     # 5. MOST FREQUENTLY VIEWED RECIPES (Top 10 and Top 15)
     # ==============================================================
+    next_step("top_viewed")
     logger.info("Generating: Top viewed recipes charts & CSV...")
 
     top_views_10 = recipes.sort_values("views", ascending=False).head(10)
@@ -206,15 +319,12 @@ def run_analytics():
     # ==============================================================
     # 6. INGREDIENTS ASSOCIATED WITH HIGH ENGAGEMENT
     # ==============================================================
+    next_step("high_engagement_ingredients")
     logger.info("Generating: High engagement ingredients chart & CSV...")
 
     median_likes = recipes["likes"].median()
-    high_engaged_recipe_ids = recipes[recipes["likes"] >= median_likes]["id"]
-
     high_engagement_ingredients = (
-        ingredients[ingredients["recipe_id"].isin(high_engaged_recipe_ids)]["ingredient_name"]
-        .value_counts()
-        .head(10)
+        ingredient_counts(aggregates["ingredient_counts"], min_likes=median_likes).head(10)
     )
 
     plt.figure(figsize=(10, 6))
@@ -233,9 +343,10 @@ def run_analytics():
     # ==============================================================
     # 7. STEP COUNT ANALYSIS
     # ==============================================================
+    next_step("step_counts")
     logger.info("Generating: Step count analysis chart & CSV...")
 
-    step_counts = steps.groupby("recipe_id").size().sort_values(ascending=False)
+    step_counts = aggregates["step_count"].sort_values(ascending=False)
 
     plt.figure(figsize=(10, 6))
     step_counts.head(10).plot(kind="bar", color="purple")
@@ -253,24 +364,30 @@ def run_analytics():
     # ==============================================================
     # 8. MOST ACTIVE USERS (Top 20)
     # ==============================================================
+    next_step("active_users")
     logger.info("Generating: Most active users chart & CSV...")
 
-    user_activity_20 = interactions.groupby("user_id").size().sort_values(ascending=False).head(20)
-
-    plt.figure(figsize=(12, 6))
-    user_activity_20.plot(kind="bar")
-    plt.title("Top 20 Most Active Users")
-    plt.xlabel("User ID")
-    plt.ylabel("Total Interactions")
-    plt.tight_layout()
-    plt.savefig(os.path.join(analysis_folder, "top_active_users_20.png"))
-    plt.clf()
+    user_activity_20 = aggregates["user_activity"].sort_values(ascending=False).head(20)
+
+    if user_activity_20.empty:
+        # e.g. an INTERACTIONS_SINCE/UNTIL window without events
+        logger.warning("No interactions: skipping the most active users chart.")
+    else:
+        plt.figure(figsize=(12, 6))
+        user_activity_20.plot(kind="bar")
+        plt.title("Top 20 Most Active Users")
+        plt.xlabel("User ID")
+        plt.ylabel("Total Interactions")
+        plt.tight_layout()
+        plt.savefig(os.path.join(analysis_folder, "top_active_users_20.png"))
+        plt.clf()
 
     user_activity_20.to_csv(os.path.join(analysis_folder, "top_active_users_20.csv"))
 
     # ==============================================================
     # 9. PREP TIME vs COOK TIME (Scatter)
     # ==============================================================
+    next_step("prep_vs_cook")
     logger.info("Generating: Prep vs Cook time scatter chart...")
 
     plt.figure(figsize=(8, 6))
@@ -285,22 +402,9 @@ def run_analytics():
     # ==============================================================
     # 10. CORRELATION MATRIX (Numeric Fields)
     # ==============================================================
+    next_step("correlation_matrix")
     logger.info("Generating: Correlation matrix chart & CSV...")
 
-    numeric_cols = [
-        "prep_time_minutes",
-        "cook_time_minutes",
-        "total_time",
-        "likes",
-        "views",
-        "attempts",
-        "complexity_score",
-        "engagement_score",
-    ]
-    numeric_present = [c for c in numeric_cols if c in recipes.columns]
-
-    corr_matrix = recipes[numeric_present].corr()
-
     plt.figure(figsize=(10, 8))
     plt.imshow(corr_matrix, cmap="coolwarm", interpolation="nearest")
     plt.colorbar()
@@ -316,16 +420,27 @@ def run_analytics():
     # ==============================================================
     # 11. COMPLEXITY DISTRIBUTION + TOP/SIMPLEST RECIPES
     # ==============================================================
+    next_step("complexity_distribution")
     logger.info("Generating: Complexity distribution charts & CSV...")
 
-    plt.figure(figsize=(10, 6))
-    recipes["complexity_score"].plot(kind="hist", bins=15)
-    plt.title("Recipe Complexity Score Distribution")
-    plt.xlabel("Complexity Score")
-    plt.ylabel("Number of Recipes")
-    plt.tight_layout()
-    plt.savefig(os.path.join(analysis_folder, "complexity_distribution.png"))
-    plt.clf()
+    complexity_moments = moments["complexity_score"]
+    if complexity_moments.n:
+        complexity_hist = FixedBinHistogram.from_range(
+            complexity_moments.min, complexity_moments.max, COMPLEXITY_BINS
+        )
+        for chunk in iter_chunks(recipes, STATS_CHUNK_SIZE):
+            complexity_hist.update(chunk["complexity_score"])
+
+        plt.figure(figsize=(10, 6))
+        plt.hist(complexity_hist.edges[:-1], bins=complexity_hist.edges, weights=complexity_hist.counts)
+        plt.title("Recipe Complexity Score Distribution")
+        plt.xlabel("Complexity Score")
+        plt.ylabel("Number of Recipes")
+        plt.tight_layout()
+        plt.savefig(os.path.join(analysis_folder, "complexity_distribution.png"))
+        plt.clf()
+    else:
+        logger.warning("No complexity scores: skipping the complexity distribution chart.")
 
     top_complex = recipes.sort_values("complexity_score", ascending=False).head(10)
     top_complex.to_csv(os.path.join(analysis_folder, "top10_most_complex_recipes.csv"), index=False)
@@ -336,6 +451,7 @@ def run_analytics():
     # ==============================================================
     # 12. TOP ENGAGED RECIPES (Using engagement_score)
     # ==============================================================
+    next_step("top_engaged")
     logger.info("Generating: Top engaged recipes chart & CSV...")
 
     top_engaged = recipes.sort_values("engagement_score", ascending=False).head(10)
@@ -352,9 +468,24 @@ def run_analytics():
 
     top_engaged.to_csv(os.path.join(analysis_folder, "top_engaged_recipes.csv"), index=False)
 
+    # ==============================================================
+    # 12b. TOP RATED RECIPES (Bayesian average)
+    # ==============================================================
+    next_step("top_rated")
+    logger.info("Generating: Rating stats and top rated recipes CSV...")
+
+    rating_cols = ["id", "title", "rating_count", "rating_mean", "rating_bayes"] + star_cols
+    recipes[rating_cols].to_csv(os.path.join(analysis_folder, "recipe_ratings.csv"), index=False)
+
+    top_rated = recipes.sort_values(
+        ["rating_bayes", "rating_count"], ascending=False
+    ).head(10)
+    top_rated.to_csv(os.path.join(analysis_folder, "top_rated_recipes.csv"), index=False)
+
     # ==============================================================
     # 13. SENTIMENT ANALYSIS (Titles + Steps)
     # ==============================================================
+    next_step("sentiment")
     logger.info("Running simple sentiment analysis and chart...")
 
     positive_words = [
@@ -366,36 +497,29 @@ def run_analytics():
         "undercooked", "salty", "bitter"
     ]
 
-    sentiment_rows = []
-
-    for _, r in recipes.iterrows():
-        rid = r["id"]
-        title = str(r.get("title", ""))
-        desc = str(r.get("description", ""))
-
-        # gather all step text for this recipe
-        step_texts = steps[steps["recipe_id"] == rid]["step_text"].astype(str).tolist()
-        full_text = (title + " " + desc + " " + " ".join(step_texts)).lower()
-
-        pos_count = sum(word in full_text for word in positive_words)
-        neg_count = sum(word in full_text for word in negative_words)
-        score = pos_count - neg_count
-
-        if score > 0:
-            label = "Positive"
-        elif score < 0:
-            label = "Negative"
-        else:
-            label = "Neutral"
-
-        sentiment_rows.append({
-            "id": rid,
-            "title": title,
-            "sentiment_score": score,
-            "sentiment_label": label
-        })
+    # keyword hits come from the full-text index (re-indexed in memory only
+    # for recipes whose text differs) instead of re-scanning raw step text
+    text_index = index_for(recipes, steps, step_texts)
+    keyword_hits = (
+        text_index.term_frequencies(positive_words + negative_words)
+        .reindex(recipes["id"])
+        .fillna(0)
+        .gt(0)
+    )
 
-    sentiment_df = pd.DataFrame(sentiment_rows)
+    pos_count = keyword_hits[positive_words].sum(axis=1).to_numpy()
+    neg_count = keyword_hits[negative_words].sum(axis=1).to_numpy()
+    score = pos_count - neg_count
+
+    sentiment_df = pd.DataFrame({
+        "id": recipes["id"].to_numpy(),
+        "title": recipes["title"].astype(str).to_numpy(),
+        "sentiment_score": score,
+        "sentiment_label": pd.cut(
+            score, bins=[-float("inf"), -1, 0, float("inf")],
+            labels=["Negative", "Neutral", "Positive"]
+        ).astype(str),
+    })
     sentiment_df.to_csv(os.path.join(analysis_folder, "recipe_sentiment.csv"), index=False)
 
     # Sentiment distribution chart
@@ -410,9 +534,28 @@ def run_analytics():
     plt.savefig(os.path.join(analysis_folder, "sentiment_bar_chart.png"))
     plt.clf()
 
+    # ==============================================================
+    # 14. RECIPE WEIGHT + PER-SERVING CALORIES
+    # metric amounts come from the normalized quantity columns;
+    # millilitres are counted as grams (density ~1)
+    # ==============================================================
+    next_step("nutrition")
+    logger.info("Generating: Recipe weight and per-serving calories CSV...")
+
+    total_weight = aggregates["total_weight"]
+    nutrition = recipes[["id", "title", "servings"]].copy()
+    nutrition["total_weight_g"] = nutrition["id"].map(total_weight)
+    nutrition["weight_per_serving_g"] = nutrition["total_weight_g"] / recipes["servings"]
+    nutrition["calories"] = recipes["calories"] if "calories" in recipes.columns else float("nan")
+    nutrition["calories_per_serving"] = nutrition["calories"] / recipes["servings"]
+
+    nutrition.to_csv(os.path.join(analysis_folder, "recipe_nutrition.csv"), index=False)
+    avg_weight_per_serving = nutrition["weight_per_serving_g"].mean()
+
     # ==============================================================
     # SUMMARY FILE
     # ==============================================================
+    next_step("summary")
     logger.info("Writing insights_summary.txt...")
 
     summary_path = os.path.join(analysis_folder, "insights_summary.txt")
@@ -421,7 +564,8 @@ def run_analytics():
         f.write(f"Average Preparation Time: {avg_prep:.2f} minutes\n")
         f.write(f"Average Total Cooking Time: {avg_total:.2f} minutes\n")
         f.write(f"Correlation (Prep Time vs Likes): {correlation_value:.4f}\n")
-        f.write(f"Average Steps Per Recipe: {avg_steps_per_recipe:.2f}\n\n")
+        f.write(f"Average Steps Per Recipe: {avg_steps_per_recipe:.2f}\n")
+        f.write(f"Average Weight Per Serving: {avg_weight_per_serving:.1f} g\n\n")
 
         f.write("\nTOP INGREDIENTS:\n")
         f.write(top_ingredients.to_string())
@@ -439,6 +583,10 @@ def run_analytics():
         f.write(top_engaged[["id", "engagement_score"]].to_string())
         f.write("\n\n")
 
+        f.write(f"TOP RATED RECIPES (Bayesian average, global mean = {global_rating_mean:.2f}):\n")
+        f.write(top_rated[["id", "rating_count", "rating_mean", "rating_bayes"]].to_string())
+        f.write("\n\n")
+
         f.write("COMPLEXITY: Most complex recipes:\n")
         f.write(top_complex[["id", "title", "complexity_score"]].to_string())
         f.write("\n\n")
@@ -450,12 +598,26 @@ def run_analytics():
     logger.info("Analytics complete! Check the analysis folder.")
 
 
+def run_stage(tables=None) -> dict:
+    """In-process entry point; charts and insight files are written as before."""
+    run_analytics(tables)
+    return {}
+
+
 # =====================================================
 # ENTRY POINT
 # =====================================================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recipe analytics")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="recipe-hash partitions aggregated in parallel "
+                             "(default: ANALYTICS_PARTITIONS or 1; 0 = CPU count)")
+    parser.add_argument("--since", help="only interactions at or after this ISO date/time (INTERACTIONS_SINCE)")
+    parser.add_argument("--until", help="only interactions before this ISO date/time (INTERACTIONS_UNTIL)")
+    args = parser.parse_args()
+
     try:
-        run_analytics()
+        run_analytics(partitions=args.partitions, since=args.since, until=args.until)
     except Exception as e:
         logger.error("Analytics failed: %s", e)
         raise
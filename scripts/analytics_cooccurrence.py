@@ -0,0 +1,200 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from utils_retry import retry
+from utils_tables import get_table, interaction_window, warn_compacted_ignored
+from utils_engagement import engagement_by_recipe
+
+# =====================================================
+# LOGGING
+# =====================================================
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+CLEAN_FOLDER = os.path.join("outputs", "clean")
+ANALYSIS_FOLDER = "analysis"
+
+MIN_PAIR_COUNT = 2           # pairs seen in fewer recipes are dropped
+TOP_N = 50                   # rows written per output table
+TRIPLE_CANDIDATE_PAIRS = 500  # most frequent pairs extended to triples
+
+
+# =====================================================
+# SAFE CSV READ WITH RETRY
+# =====================================================
+@retry(Exception, tries=3, delay=1, backoff=2)
+def safe_read_csv(path: str) -> pd.DataFrame:
+    return pd.read_csv(path)
+
+
+# =====================================================
+# SPARSE INCIDENCE MATRIX
+# =====================================================
+def build_incidence(ingredients: pd.DataFrame):
+    """
+    Build a binary recipe x ingredient CSR matrix.
+
+    Returns (matrix, recipe_ids, ingredient_names) where row i of the
+    matrix is recipe_ids[i] and column j is ingredient_names[j].
+    """
+    pairs = ingredients[["recipe_id", "ingredient_name"]].dropna().drop_duplicates()
+
+    recipe_codes, recipe_ids = pd.factorize(pairs["recipe_id"])
+    ingredient_codes, ingredient_names = pd.factorize(pairs["ingredient_name"])
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (recipe_codes, ingredient_codes)),
+        shape=(len(recipe_ids), len(ingredient_names)),
+    )
+    return matrix, recipe_ids, ingredient_names
+
+
+# =====================================================
+# PAIR ASSOCIATIONS
+# =====================================================
+def pair_associations(matrix, ingredient_names, engagement, min_count=MIN_PAIR_COUNT):
+    """
+    Co-occurrence count, support, confidence, lift and engagement for every
+    ingredient pair, computed from X^T X and X^T diag(e) X.
+    """
+    n_recipes = matrix.shape[0]
+    freq = np.asarray(matrix.sum(axis=0)).ravel()
+
+    cooc = sparse.triu(matrix.T @ matrix, k=1).tocoo()
+    weighted = sparse.triu(matrix.T @ sparse.diags(engagement) @ matrix, k=1).tocsr()
+
+    keep = cooc.data >= min_count
+    a, b, count = cooc.row[keep], cooc.col[keep], cooc.data[keep].astype(float)
+    pair_engagement = np.asarray(weighted[a, b]).ravel()
+
+    mean_engagement = engagement.mean() if len(engagement) else 0.0
+    pair_mean_engagement = pair_engagement / count
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        engagement_lift = pair_mean_engagement / mean_engagement
+
+    return pd.DataFrame({
+        "ingredient_a": ingredient_names[a],
+        "ingredient_b": ingredient_names[b],
+        "recipe_count": count.astype(int),
+        "support": count / n_recipes,
+        "confidence_a_to_b": count / freq[a],
+        "confidence_b_to_a": count / freq[b],
+        "lift": count * n_recipes / (freq[a].astype(float) * freq[b]),
+        "mean_engagement": pair_mean_engagement,
+        "engagement_lift": engagement_lift,
+    })
+
+
+# =====================================================
+# TRIPLE ASSOCIATIONS
+# =====================================================
+def triple_associations(matrix, ingredient_names, pairs, min_count=MIN_PAIR_COUNT,
+                        max_pairs=TRIPLE_CANDIDATE_PAIRS):
+    """
+    Extend the most frequent pairs to triples.
+
+    The pair indicator columns X[:, a] * X[:, b] are built for all candidate
+    pairs at once, then multiplied against X to count every (a, b, c).
+    """
+    if pairs.empty:
+        return pd.DataFrame(columns=[
+            "ingredient_a", "ingredient_b", "ingredient_c", "recipe_count", "support", "lift"
+        ])
+
+    n_recipes = matrix.shape[0]
+    freq = np.asarray(matrix.sum(axis=0)).ravel()
+    name_to_code = pd.Index(ingredient_names)
+
+    candidates = pairs.nlargest(max_pairs, "recipe_count")
+    a = name_to_code.get_indexer(candidates["ingredient_a"])
+    b = name_to_code.get_indexer(candidates["ingredient_b"])
+
+    csc = matrix.tocsc()
+    pair_indicator = csc[:, a].multiply(csc[:, b]).tocsc()
+    triple_counts = (pair_indicator.T @ matrix).tocoo()
+
+    pair_idx, c, count = triple_counts.row, triple_counts.col, triple_counts.data
+    keep = (count >= min_count) & (c != a[pair_idx]) & (c != b[pair_idx])
+    pair_idx, c, count = pair_idx[keep], c[keep], count[keep].astype(float)
+
+    # a triple reached from two or three of its candidate pairs is reported
+    # once, with its codes sorted (first occurrence kept, order preserved)
+    triples = np.sort(np.column_stack([a[pair_idx], b[pair_idx], c]), axis=1)
+    _, first = np.unique(triples, axis=0, return_index=True)
+    first.sort()
+    ta, tb, c = triples[first].T
+    count = count[first]
+
+    return pd.DataFrame({
+        "ingredient_a": ingredient_names[ta],
+        "ingredient_b": ingredient_names[tb],
+        "ingredient_c": ingredient_names[c],
+        "recipe_count": count.astype(int),
+        "support": count / n_recipes,
+        "lift": count * n_recipes ** 2 / (freq[ta].astype(float) * freq[tb] * freq[c]),
+    })
+
+
+# =====================================================
+# MAIN CO-OCCURRENCE FUNCTION
+# =====================================================
+def run_cooccurrence():
+    os.makedirs(ANALYSIS_FOLDER, exist_ok=True)
+
+    logger.info("Loading cleaned ingredients and interactions...")
+    ingredients = safe_read_csv(os.path.join(CLEAN_FOLDER, "ingredients_clean.csv"))
+    since, until = interaction_window()
+    interactions = get_table(None, "interactions_clean", since, until)
+    warn_compacted_ignored("co-occurrence", since, until)
+
+    logger.info("Building sparse recipe x ingredient matrix...")
+    matrix, recipe_ids, ingredient_names = build_incidence(ingredients)
+    logger.info(
+        "Incidence matrix: %d recipes x %d ingredients (%d non-zeros)",
+        matrix.shape[0], matrix.shape[1], matrix.nnz
+    )
+
+    engagement = (
+        engagement_by_recipe(interactions)
+        .reindex(recipe_ids)
+        .fillna(0.0)
+        .to_numpy()
+    )
+
+    # ---------------------------- PAIRS ----------------------------
+    logger.info("Computing ingredient pair associations...")
+    pairs = pair_associations(matrix, ingredient_names, engagement)
+
+    top_pairs = pairs.sort_values(["lift", "recipe_count"], ascending=False).head(TOP_N)
+    top_pairs.to_csv(os.path.join(ANALYSIS_FOLDER, "ingredient_pairs.csv"), index=False)
+
+    engaging_pairs = pairs.sort_values(["engagement_lift", "recipe_count"], ascending=False).head(TOP_N)
+    engaging_pairs.to_csv(os.path.join(ANALYSIS_FOLDER, "ingredient_pairs_engagement.csv"), index=False)
+
+    # ---------------------------- TRIPLES ----------------------------
+    logger.info("Computing ingredient triple associations...")
+    triples = triple_associations(matrix, ingredient_names, pairs)
+
+    top_triples = triples.sort_values(["lift", "recipe_count"], ascending=False).head(TOP_N)
+    top_triples.to_csv(os.path.join(ANALYSIS_FOLDER, "ingredient_triples.csv"), index=False)
+
+    logger.info(
+        "Co-occurrence analysis complete: %d pairs, %d triples.", len(pairs), len(triples)
+    )
+
+
+# =====================================================
+# MAIN
+# =====================================================
+if __name__ == "__main__":
+    try:
+        run_cooccurrence()
+    except Exception as e:
+        logger.error("Co-occurrence analysis failed: %s", e)
+        raise
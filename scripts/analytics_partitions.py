@@ -0,0 +1,212 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from utils_quantity import normalize_quantities
+from utils_stats import RatingAccumulator, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# PARTITIONED RECIPE AGGREGATES (MAP / REDUCE)
+# -----------------------------------------------------
+# Everything 5_analytics computes from the large tables
+# (interactions, ingredients, steps) is an aggregate per
+# recipe, per ingredient or per user. The tables are
+# hash-sharded by recipe_id, so a recipe's rows all land
+# in one partition; each partition is aggregated in its
+# own worker process and the partials are merged:
+#
+#   per recipe      likes/views/attempts, step count,
+#                   ingredient weight (concatenated)
+#   ratings         RatingAccumulator (merged)
+#   per ingredient  counts by (recipe likes, ingredient),
+#                   summed; top / high-engagement lists
+#                   are cut from these after the merge
+#   per user        interaction counts (summed)
+#
+# The merged results are the same Series the single-pass
+# code produced (same values, order and tie order), so
+# every analytics output is unchanged.
+#
+# Compacted interactions (compact_interactions.py: event
+# counts per recipe, day, user, type and rating) are
+# sharded the same way and added to the interaction
+# counts, ratings and user activity with their counts as
+# weights, so totals include events no longer kept raw.
+#
+# Workers are spawned rather than forked: the in-process
+# pipeline runner has other threads alive.
+# =====================================================
+STATS_CHUNK_SIZE = 50_000
+NO_RECIPE = -1          # "likes" of ingredient rows whose recipe is unknown
+INTERACTION_COUNTS = (("likes", "like"), ("views", "view"), ("attempts", "cook_attempt"))
+
+
+def resolve_partitions(partitions=None) -> int:
+    """partitions, else ANALYTICS_PARTITIONS (default 1); 0 means one per CPU."""
+    if partitions is None:
+        partitions = int(os.getenv("ANALYTICS_PARTITIONS", "1"))
+    return partitions if partitions > 0 else (os.cpu_count() or 1)
+
+
+def partition_by_recipe(frame: pd.DataFrame, key: str, partitions: int) -> list:
+    """Split frame into `partitions` recipe-hash shards (empty ones included)."""
+    if partitions == 1:
+        return [frame]
+    # hash the string form so in-memory and CSV-loaded key dtypes shard alike
+    keys = frame[key].astype(str)
+    bucket = (pd.util.hash_pandas_object(keys, index=False) % partitions).to_numpy()
+    groups = dict(list(frame.groupby(bucket, sort=False)))
+    return [groups.get(p, frame.iloc[:0]) for p in range(partitions)]
+
+
+# =====================================================
+# MAP: ONE PARTITION
+# =====================================================
+def aggregate_partition(args) -> dict:
+    """
+    Worker entry point: aggregates of one recipe-hash partition.
+
+    Row labels must be global row positions (see compute_recipe_aggregates),
+    they are kept as first_row to restore first-appearance order on merge.
+    """
+    recipe_ids, ingredients, interactions, steps, compacted = args
+
+    counts = {
+        name: interactions[interactions["type"] == kind].groupby("recipe_id").size().rename(name)
+        for name, kind in INTERACTION_COUNTS
+    }
+    user_activity = interactions.groupby("user_id").size()
+
+    ratings = RatingAccumulator()
+    for chunk in iter_chunks(interactions, STATS_CHUNK_SIZE):
+        ratings.update(chunk)
+
+    if len(compacted):
+        for name, kind in INTERACTION_COUNTS:
+            rolled_up = compacted[compacted["type"] == kind].groupby("recipe_id")["count"].sum()
+            counts[name] = _add_counts(counts[name], rolled_up).rename(name)
+        user_activity = _add_counts(user_activity, compacted.groupby("user_id")["count"].sum())
+        ratings.update(compacted, weight="count")
+
+    # ingredient counts keyed by the recipe's like count, so the
+    # high-engagement cut (likes >= global median) can be made after the merge
+    recipe_likes = (
+        counts["likes"].reindex(pd.unique(recipe_ids), fill_value=0)
+        if len(recipe_ids) else pd.Series(dtype="int64")
+    )
+    by_ingredient = (
+        ingredients[["ingredient_name"]]
+        .assign(
+            likes=ingredients["recipe_id"].map(recipe_likes).fillna(NO_RECIPE),
+            first_row=ingredients.index,
+        )
+        .groupby(["likes", "ingredient_name"], sort=False)["first_row"]
+        .agg(["size", "min"])
+        .rename(columns={"size": "count", "min": "first_row"})
+        .reset_index()
+    )
+
+    if "quantity_metric" not in ingredients.columns:
+        ingredients = ingredients.join(normalize_quantities(ingredients["quantity"]))
+
+    return {
+        **counts,
+        "ratings": ratings,
+        "step_count": steps.groupby("recipe_id").size(),
+        "total_weight": ingredients.groupby("recipe_id")["quantity_metric"].sum(min_count=1),
+        "ingredient_counts": by_ingredient,
+        "user_activity": user_activity,
+    }
+
+
+def _add_counts(raw: pd.Series, rolled_up: pd.Series) -> pd.Series:
+    """Raw event counts plus compacted ones, keyed like groupby().size()."""
+    total = raw.add(rolled_up, fill_value=0).astype("int64")
+    total.index.name = raw.index.name
+    return total
+
+
+# =====================================================
+# REDUCE
+# =====================================================
+def _concat(parts, name):
+    """Per-recipe partials never overlap; sorting restores groupby's key order."""
+    merged = pd.concat([p[name] for p in parts]).sort_index()
+    merged.name = parts[0][name].name
+    return merged
+
+
+def ingredient_counts(counts: pd.DataFrame, min_likes=None) -> pd.Series:
+    """Same Series as ingredients["ingredient_name"].value_counts() (restricted to min_likes)."""
+    if min_likes is not None:
+        counts = counts[counts["likes"] >= min_likes]
+    merged = (
+        counts.groupby("ingredient_name")
+        .agg(count=("count", "sum"), first_row=("first_row", "min"))
+        .sort_values("first_row")
+    )
+    # value_counts order: first appearance, then a stable sort by count
+    return merged["count"].sort_values(ascending=False, kind="stable")
+
+
+def merge_partials(parts: list) -> dict:
+    ratings = RatingAccumulator()
+    for part in parts:
+        ratings.merge(part["ratings"])
+
+    user_activity = pd.concat([p["user_activity"] for p in parts])
+    user_activity = user_activity.groupby(level=0).sum()
+    user_activity.index.name = parts[0]["user_activity"].index.name
+
+    return {
+        "likes": _concat(parts, "likes"),
+        "views": _concat(parts, "views"),
+        "attempts": _concat(parts, "attempts"),
+        "ratings": ratings,
+        "step_count": _concat(parts, "step_count"),
+        "total_weight": _concat(parts, "total_weight"),
+        "ingredient_counts": pd.concat([p["ingredient_counts"] for p in parts], ignore_index=True),
+        "user_activity": user_activity,
+    }
+
+
+# =====================================================
+# DRIVER
+# =====================================================
+def compute_recipe_aggregates(recipes, ingredients, interactions, steps, partitions=None,
+                              compacted=None) -> dict:
+    """
+    Aggregate the large tables in `partitions` worker processes (1 = in this
+    process). compacted: interaction_aggregates_clean rows, if any.
+    """
+    partitions = resolve_partitions(partitions)
+    if compacted is None:
+        compacted = pd.DataFrame(columns=["recipe_id", "user_id", "type", "rating", "count"])
+
+    # global row positions as labels (first-appearance order on merge)
+    ingredients = ingredients.reset_index(drop=True)
+    interactions = interactions.reset_index(drop=True)
+    steps = steps.reset_index(drop=True)
+
+    work = list(zip(
+        [part["id"].to_numpy() for part in partition_by_recipe(recipes, "id", partitions)],
+        partition_by_recipe(ingredients, "recipe_id", partitions),
+        partition_by_recipe(interactions, "recipe_id", partitions),
+        partition_by_recipe(steps, "recipe_id", partitions),
+        partition_by_recipe(compacted, "recipe_id", partitions),
+    ))
+
+    if partitions > 1:
+        logger.info("Aggregating %d interactions in %d recipe partitions...",
+                    len(interactions), partitions)
+        with ProcessPoolExecutor(
+            max_workers=partitions, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            parts = list(pool.map(aggregate_partition, work))
+    else:
+        parts = [aggregate_partition(w) for w in work]
+
+    return merge_partials(parts)
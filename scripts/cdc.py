@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:       # pandas is imported on first use, not at import time
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# SNAPSHOT-DIFF CHANGE DATA CAPTURE (RECIPES)
+# -----------------------------------------------------
+# Recipes carry no update timestamp, so edits can only be
+# found by comparing content. A CDC export (EXPORT_CDC=1 /
+# 2_export_firestore.py --cdc) hashes every recipe
+# document, diffs the hashes against the previous
+# snapshot and writes to outputs/cdc/:
+#
+#   changes.json          snapshot id, base snapshot id,
+#                         inserted / updated / deleted ids
+#   recipe_changes.csv    id, op, content_hash
+#   *_delta.csv           flattened recipe, ingredient and
+#                         step rows of inserted/updated
+#                         recipes (step text inline)
+#   recipe_snapshot.pkl   hash + flattened rows per recipe,
+#                         reused for unchanged recipes
+#
+# Consumers (transform, text and ingredient indexes)
+# record the snapshot they last processed in
+# consumers.json, with a hash of the code that produced
+# their outputs; they reprocess only the changed recipes
+# when that is the base of the current diff, and fall
+# back to a full rebuild otherwise (first run, a skipped
+# or non-CDC export, a consumer that did not run, changed
+# consumer code, or CDC_FULL_REBUILD=1, which
+# run_pipeline.py --force / --from-stage sets).
+# =====================================================
+CDC_FOLDER = os.path.join("outputs", "cdc")
+SNAPSHOT_PATH = os.path.join(CDC_FOLDER, "recipe_snapshot.pkl")
+CHANGES_PATH = os.path.join(CDC_FOLDER, "changes.json")
+CHANGES_CSV_PATH = os.path.join(CDC_FOLDER, "recipe_changes.csv")
+CONSUMERS_PATH = os.path.join(CDC_FOLDER, "consumers.json")
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DELTA_PATHS = {
+    "recipe": os.path.join(CDC_FOLDER, "recipe_delta.csv"),
+    "ingredients": os.path.join(CDC_FOLDER, "ingredients_delta.csv"),
+    "steps": os.path.join(CDC_FOLDER, "steps_delta.csv"),
+}
+
+
+def cdc_enabled() -> bool:
+    return os.getenv("EXPORT_CDC", "0") == "1"
+
+
+def content_hash(doc: dict) -> str:
+    """Stable hash of a document's content (key order does not matter)."""
+    payload = json.dumps(doc, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# =====================================================
+# EXPORT SIDE: SNAPSHOTS + DIFF
+# =====================================================
+class RecipeSnapshot:
+    """recipe id -> (content hash, ingredient rows, step rows) of one export."""
+
+    def __init__(self, snapshot_id=None, docs=None):
+        self.snapshot_id = snapshot_id
+        self.docs = docs or {}
+
+    @classmethod
+    def load(cls, path=SNAPSHOT_PATH) -> "RecipeSnapshot":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        return cls(state["snapshot_id"], state["docs"])
+
+    def save(self, path=SNAPSHOT_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"snapshot_id": self.snapshot_id, "docs": self.docs}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def cached_rows(self, recipe_id, digest):
+        """(ingredient rows, step rows) flattened last time, if the content is unchanged."""
+        entry = self.docs.get(recipe_id)
+        if entry is not None and entry[0] == digest:
+            return entry[1], entry[2]
+        return None
+
+
+def new_snapshot_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+
+def diff_snapshots(previous: RecipeSnapshot, current: RecipeSnapshot) -> dict:
+    """Inserted / updated / deleted recipe ids, in current (resp. previous) order."""
+    insert, update = [], []
+    for recipe_id, entry in current.docs.items():
+        before = previous.docs.get(recipe_id)
+        if before is None:
+            insert.append(recipe_id)
+        elif before[0] != entry[0]:
+            update.append(recipe_id)
+    delete = [recipe_id for recipe_id in previous.docs if recipe_id not in current.docs]
+    return {
+        "snapshot": current.snapshot_id,
+        "base_snapshot": previous.snapshot_id,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "counts": {"insert": len(insert), "update": len(update), "delete": len(delete),
+                   "unchanged": len(current.docs) - len(insert) - len(update)},
+        "insert": insert,
+        "update": update,
+        "delete": delete,
+    }
+
+
+def write_changes(changes: dict, current: RecipeSnapshot, recipes: list):
+    """changes.json, recipe_changes.csv and the delta tables of changed recipes."""
+    import pandas as pd
+
+    changed = set(changes["insert"]) | set(changes["update"])
+    ops = {**{r: "insert" for r in changes["insert"]}, **{r: "update" for r in changes["update"]},
+           **{r: "delete" for r in changes["delete"]}}
+    os.makedirs(CDC_FOLDER, exist_ok=True)
+    pd.DataFrame({
+        "id": list(ops),
+        "op": list(ops.values()),
+        "content_hash": [current.docs[r][0] if r in current.docs else None for r in ops],
+    }).to_csv(CHANGES_CSV_PATH, index=False)
+
+    pd.DataFrame([r for r in recipes if r.get("id") in changed]).to_csv(
+        DELTA_PATHS["recipe"], index=False)
+    pd.DataFrame(
+        [row for r in current.docs if r in changed for row in current.docs[r][1]],
+        columns=["recipe_id", "ingredient_name", "quantity"],
+    ).to_csv(DELTA_PATHS["ingredients"], index=False)
+    pd.DataFrame(
+        [row for r in current.docs if r in changed for row in current.docs[r][2]],
+        columns=["recipe_id", "order", "step_text"],
+    ).to_csv(DELTA_PATHS["steps"], index=False)
+
+    _write_json(CHANGES_PATH, changes)
+    counts = changes["counts"]
+    logger.info("CDC snapshot %s: %d inserted, %d updated, %d deleted, %d unchanged recipes.",
+                changes["snapshot"], counts["insert"], counts["update"], counts["delete"],
+                counts["unchanged"])
+
+
+def publish_changes(previous: RecipeSnapshot, current: RecipeSnapshot, recipes: list):
+    """Diff current against previous, write the change set and keep current as the base."""
+    changes = diff_snapshots(previous, current)
+    unchanged = not changed_ids(changes) and not changes["delete"]
+    if unchanged and previous.snapshot_id is not None and current_snapshot() == previous.snapshot_id:
+        # nothing to apply: the last change set and snapshot stay current, so
+        # consumers skipped by the pipeline cache stay in sync
+        logger.info("CDC: no recipe changes since snapshot %s.", previous.snapshot_id)
+        return
+    write_changes(changes, current, recipes)
+    current.save()
+
+
+def invalidate_changes():
+    """A full (non-CDC) export breaks the snapshot chain: consumers rebuild next time."""
+    if os.path.exists(CHANGES_PATH):
+        os.remove(CHANGES_PATH)
+
+
+# =====================================================
+# CONSUMER SIDE
+# =====================================================
+def full_rebuild_requested() -> bool:
+    return os.getenv("CDC_FULL_REBUILD", "0") == "1"
+
+
+def code_version(sources) -> str:
+    """Hash of the script files (names in scripts/) a consumer's outputs depend on."""
+    digest = hashlib.sha1()
+    for name in sources:
+        with open(os.path.join(SCRIPTS_DIR, name), "rb") as f:
+            digest.update(name.encode() + b"\0" + f.read())
+    return digest.hexdigest()
+
+
+def current_snapshot():
+    """Snapshot id of the latest CDC export, None after a full export."""
+    changes = _read_json(CHANGES_PATH)
+    return changes["snapshot"] if changes else None
+
+
+def incremental_changes(consumer: str, sources=()):
+    """
+    The current changes if consumer last processed their base snapshot
+    (so applying them brings it up to date), an empty change set if it is
+    already at the current snapshot, else None: rebuild fully. Outputs
+    made by other code than sources (see code_version) are rebuilt too.
+    """
+    changes = _read_json(CHANGES_PATH)
+    if not changes or full_rebuild_requested():
+        return None
+    record = _read_json(CONSUMERS_PATH, {}).get(consumer)
+    if not isinstance(record, dict) or record.get("version") != code_version(sources):
+        return None
+    processed = record.get("snapshot")
+    if processed is not None and processed == changes["snapshot"]:
+        return {**changes, "insert": [], "update": [], "delete": []}      # up to date
+    if changes["base_snapshot"] is None or processed != changes["base_snapshot"]:
+        return None
+    return changes
+
+
+def mark_processed(consumer: str, sources=(), snapshot_id=None):
+    """Record that consumer's outputs now reflect snapshot_id (default: the current one)."""
+    consumers = _read_json(CONSUMERS_PATH, {})
+    consumers[consumer] = {
+        "snapshot": snapshot_id if snapshot_id is not None else current_snapshot(),
+        "version": code_version(sources),
+    }
+    _write_json(CONSUMERS_PATH, consumers)
+
+
+def changed_ids(changes: dict) -> set:
+    return set(changes["insert"]) | set(changes["update"])
+
+
+def merge_changed(previous: pd.DataFrame, fresh: pd.DataFrame, changes: dict, order,
+                  key="recipe_id") -> pd.DataFrame:
+    """
+    Rows of unchanged recipes from previous plus the fresh rows of changed
+    recipes, arranged in the recipe order of `order` (rows of one recipe
+    keep their relative order). Deleted recipes drop out.
+    """
+    import numpy as np
+    import pandas as pd
+
+    kept = previous[~previous[key].isin(changed_ids(changes) | set(changes["delete"]))]
+    merged = pd.concat([kept, fresh], ignore_index=True)
+    rank = pd.Series(np.arange(len(order)), index=pd.Index(order))
+    rank = rank[~rank.index.duplicated()]
+    position = merged[key].map(rank).fillna(len(order)).to_numpy()
+    return merged.iloc[np.argsort(position, kind="stable")].reset_index(drop=True)
@@ -0,0 +1,188 @@
+import os
+import logging
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils_retry import retry
+from utils_firestore import get_db
+from utils_metrics import stage, count
+from utils_write_scheduler import WriteScheduler
+
+# =====================================================
+# LOGGING
+# =====================================================
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# INTERACTION RETENTION / COMPACTION
+# -----------------------------------------------------
+# Raw interactions older than INTERACTION_RETENTION_DAYS
+# are rolled into one document per recipe and day in
+# interaction_aggregates (id "<recipe_id>__<YYYY-MM-DD>"):
+#
+#   {recipe_id, day, interactions,
+#    groups: [{user_id, type, rating, count}, ...]}
+#
+# A group counts the events sharing user, type and rating,
+# which is everything analytics derives from interactions
+# (likes/views/attempts, rating distribution, per-user
+# activity), so totals stay exact after the raw events
+# are gone. Export reads the aggregates next to the raw
+# events and analytics adds both up.
+#
+# Events are read oldest first in pages of COMPACT_PAGE_SIZE;
+# each page commits as ONE batch that writes the updated
+# aggregate documents and deletes the page's raw events,
+# so a crash or retry never counts an event twice.
+# Run it on a schedule (cron etc.); one compactor at a time.
+# =====================================================
+AGGREGATE_COLLECTION = "interaction_aggregates"
+RETENTION_DAYS = int(os.getenv("INTERACTION_RETENTION_DAYS", "90"))
+# aggregate writes + event deletes share one batch (max 500 writes)
+PAGE_SIZE = min(int(os.getenv("COMPACT_PAGE_SIZE", "250")), 250)
+LOOKUP_WORKERS = 16
+
+
+def aggregate_id(recipe_id, day) -> str:
+    return f"{recipe_id}__{day}"
+
+
+def group_key(event) -> tuple:
+    return (event.get("user_id"), event.get("type"), event.get("rating"))
+
+
+# =====================================================
+# FIRESTORE ACCESS
+# =====================================================
+@retry(Exception, tries=3, delay=1, backoff=2, backend="firestore")
+def fetch_old_events(cutoff: str, page_size, cursor=None):
+    query = (
+        get_db().collection("interactions")
+        .where("timestamp", "<", cutoff)
+        .order_by("timestamp")
+        .limit(page_size)
+    )
+    if cursor is not None:
+        query = query.start_after(cursor)
+    return list(query.stream())
+
+
+@retry(Exception, tries=3, delay=1, backoff=2, backend="firestore")
+def fetch_aggregate(doc_id):
+    snapshot = get_db().collection(AGGREGATE_COLLECTION).document(doc_id).get()
+    return snapshot.to_dict() if snapshot.exists else None
+
+
+def commit_page(aggregates: dict, event_refs: list):
+    """Aggregate documents and the deletes of the events they absorbed, atomically."""
+    db = get_db()
+    batch = db.batch()
+    for doc_id, doc in aggregates.items():
+        batch.set(db.collection(AGGREGATE_COLLECTION).document(doc_id), doc)
+    for ref in event_refs:
+        batch.delete(ref)
+    batch.commit()
+
+
+# =====================================================
+# COMPACTION
+# =====================================================
+def add_events(doc: dict, events: list) -> dict:
+    """Fold raw events into an aggregate document (returns a new document)."""
+    groups = {group_key(g): g["count"] for g in doc.get("groups", [])}
+    for event in events:
+        key = group_key(event)
+        groups[key] = groups.get(key, 0) + 1
+    return {
+        **doc,
+        "interactions": doc.get("interactions", 0) + len(events),
+        "groups": [
+            {"user_id": user_id, "type": kind, "rating": rating, "count": n}
+            for (user_id, kind, rating), n in groups.items()
+        ],
+        "updated_at": datetime.datetime.utcnow().isoformat(),
+    }
+
+
+@stage("compact_interactions")
+def compact_interactions(retention_days=RETENTION_DAYS, dry_run=False, page_size=PAGE_SIZE) -> dict:
+    """
+    Roll interactions older than retention_days into interaction_aggregates
+    and delete them. Returns counters; dry_run only reads.
+    """
+    load_dotenv()
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)).isoformat()
+    logger.info("%s interactions older than %s (%d days)...",
+                "Counting" if dry_run else "Compacting", cutoff, retention_days)
+
+    cache = {}          # aggregate id -> current document (this job is the only writer)
+    touched = set()
+    stats = {"events": 0, "skipped": 0, "aggregates": 0, "pages": 0}
+    cursor = None
+    with WriteScheduler("compact") as writes, ThreadPoolExecutor(LOOKUP_WORKERS) as lookups:
+        while True:
+            docs = fetch_old_events(cutoff, page_size, cursor)
+            count("firestore_calls")
+            if not docs:
+                break
+            cursor = docs[-1]
+
+            by_key = {}
+            refs = []
+            for doc in docs:
+                event = doc.to_dict()
+                if event.get("recipe_id") is None:
+                    stats["skipped"] += 1       # left raw for validation to report
+                    continue
+                day = str(event["timestamp"])[:10]
+                by_key.setdefault(aggregate_id(event["recipe_id"], day), []).append(event)
+                refs.append(doc.reference)
+
+            missing = [doc_id for doc_id in by_key if doc_id not in cache]
+            for doc_id, doc in zip(missing, lookups.map(fetch_aggregate, missing)):
+                if doc is None:
+                    doc = {"recipe_id": by_key[doc_id][0]["recipe_id"], "day": doc_id.rsplit("__", 1)[1]}
+                cache[doc_id] = doc
+            count("firestore_calls", len(missing))
+
+            updated = {doc_id: add_events(cache[doc_id], events) for doc_id, events in by_key.items()}
+            if not dry_run and refs:
+                # one page at a time: the next page may update the same documents
+                writes.submit(commit_page, updated, refs, ops=len(updated) + len(refs)).result()
+            cache.update(updated)
+            touched.update(updated)
+
+            stats["pages"] += 1
+            stats["events"] += len(refs)
+            if len(docs) < page_size:
+                break
+
+    stats["aggregates"] = len(touched)
+    count("rows_in", stats["events"] + stats["skipped"])
+    count("rows_out", 0 if dry_run else stats["events"])
+    logger.info("%d interactions %s into %d recipe-day aggregates (%d without recipe_id left raw).",
+                stats["events"], "would be compacted" if dry_run else "compacted",
+                stats["aggregates"], stats["skipped"])
+    return stats
+
+
+# =====================================================
+# MAIN
+# =====================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact old interactions into daily aggregates")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS,
+                        help="keep raw interactions this many days (INTERACTION_RETENTION_DAYS)")
+    parser.add_argument("--dry-run", action="store_true", help="count only, write nothing")
+    args = parser.parse_args()
+
+    try:
+        compact_interactions(args.retention_days, args.dry_run)
+    except Exception as e:
+        logger.error("Compaction failed: %s", e)
+        raise
@@ -1,48 +1,267 @@
 # delete_firestore_database.py
-import firebase_admin
-from firebase_admin import credentials, firestore
+import os
+import time
+import queue
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils_retry import retry
+from utils_firestore import get_db
+from utils_metrics import stage, count
+from utils_write_scheduler import WriteScheduler
 
-# -------- CONFIG --------
-SERVICE_ACCOUNT_PATH = r"C:\Users\DELL\Desktop\recipe-pipeline\serviceAccount.json"
-# ------------------------
+# =====================================================
+# LOGGING
+# =====================================================
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
 
-def delete_collection(coll_ref, batch_size=50):
+# =====================================================
+# BULK DELETE
+# -----------------------------------------------------
+# Connection comes from .env: SERVICE_ACCOUNT_PATH, or
+# FIRESTORE_BACKEND=local for the offline stand-in.
+#
+# Collections are processed from a worklist by
+# DELETE_WORKERS threads: each lists its collection in
+# pages of DELETE_PAGE_SIZE documents (cursor based, no
+# recursion), puts every document's subcollections on
+# the worklist (looked up in parallel; DELETE_SUBCOLLECTIONS=0
+# or --no-subcollections skips the one call per document
+# for flat schemas) and hands the page to the write scheduler
+# as batch deletes of up to DELETE_BATCH_SIZE documents,
+# so many batches are in flight while listing goes on.
+#
+# Scope: the whole database, --collection (a collection
+# path, with everything below it) and/or --older-than
+# (only documents whose time field is before the cutoff;
+# their subcollections go with them). --dry-run lists
+# and counts without deleting.
+# =====================================================
+PAGE_SIZE = int(os.getenv("DELETE_PAGE_SIZE", "1000"))
+BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "500"))
+WORKERS = int(os.getenv("DELETE_WORKERS", "4"))
+SUBCOLLECTIONS = os.getenv("DELETE_SUBCOLLECTIONS", "1") == "1"
+MAX_BATCH_SIZE = 500        # Firestore's per-batch maximum
+LOOKUPS_PER_WORKER = 8      # parallel subcollection lookups per listing worker
+LOG_EVERY_S = 10
+
+# time field of each collection for --older-than (others: created_at)
+TIME_FIELDS = {"interactions": "timestamp"}
+DEFAULT_TIME_FIELD = "created_at"
+
+
+# =====================================================
+# LISTING
+# =====================================================
+@retry(Exception, tries=3, delay=1, backoff=2, backend="firestore")
+def fetch_page(coll_ref, page_size, cursor=None, time_field=None, cutoff=None):
+    query = coll_ref
+    if cutoff is not None:
+        query = query.where(time_field, "<", cutoff).order_by(time_field)
+    else:
+        query = query.order_by("__name__")
+    query = query.limit(page_size)
+    if cursor is not None:
+        query = query.start_after(cursor)
+    return list(query.stream())
+
+
+@retry(Exception, tries=3, delay=1, backoff=2, backend="firestore")
+def list_subcollections(doc_ref):
+    return list(doc_ref.collections())
+
+
+def commit_deletes(refs):
+    batch = get_db().batch()
+    for ref in refs:
+        batch.delete(ref)
+    batch.commit()
+
+
+# =====================================================
+# DELETE ENGINE
+# =====================================================
+class Deleter:
     """
-    Recursively delete documents in a Firestore collection.
-    Deletes in batches to avoid timeouts.
+    Worklist of (collection, filtered) items shared by the worker threads.
+    Listing calls are counted in stats (worker threads have no metrics step).
     """
-    docs = coll_ref.limit(batch_size).stream()
-    deleted = 0
 
-    for doc in docs:
-        print(f"Deleting doc: {doc.id} from {coll_ref.id}")
-        
-        # If subcollections exist, delete them recursively
-        subcollections = doc.reference.collections()
-        for sub in subcollections:
-            delete_collection(sub)
+    def __init__(self, writes, dry_run=False, page_size=PAGE_SIZE, batch_size=BATCH_SIZE,
+                 workers=WORKERS, cutoff=None, time_field=None, subcollections=SUBCOLLECTIONS):
+        self.writes = writes
+        self.dry_run = dry_run
+        self.page_size = page_size
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.workers = workers
+        self.cutoff = cutoff
+        self.time_field = time_field
+        self.subcollections = subcollections
+        self.stats = {"collections": 0, "pages": 0, "list_calls": 0,
+                      "docs_listed": 0, "docs_submitted": 0}
+        self._worklist = queue.Queue()
+        self._lookups = None            # subcollection lookup pool, while run() is active
+        self._lock = threading.Lock()
+        self._errors = []
+        self._logged = time.monotonic()
 
-        doc.reference.delete()
-        deleted += 1
+    def run(self, collections):
+        for coll in collections:
+            # the scope filter applies to the chosen collections, not to what is below them
+            self._worklist.put((coll, self.cutoff is not None))
+        threads = [
+            threading.Thread(target=self._work, name=f"delete-lister-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers * LOOKUPS_PER_WORKER,
+                                thread_name_prefix="delete-lookup") as self._lookups:
+            for thread in threads:
+                thread.start()
+            self._worklist.join()
+            for _ in threads:
+                self._worklist.put(None)
+            for thread in threads:
+                thread.join()
+        if self._errors:
+            raise self._errors[0]
 
-    if deleted >= batch_size:
-        return delete_collection(coll_ref, batch_size)
+    def _work(self):
+        while True:
+            item = self._worklist.get()
+            try:
+                if item is None:
+                    return
+                if not self._errors:
+                    self._delete_collection(*item)
+            except Exception as e:
+                logger.error("Deleting %s failed: %s", item[0].id, e)
+                with self._lock:
+                    self._errors.append(e)
+            finally:
+                self._worklist.task_done()
 
+    def _delete_collection(self, coll_ref, filtered):
+        time_field = None
+        if filtered:
+            time_field = self.time_field or TIME_FIELDS.get(coll_ref.id, DEFAULT_TIME_FIELD)
+        cursor = None
+        while not self._errors:
+            docs = fetch_page(coll_ref, self.page_size, cursor,
+                              time_field, self.cutoff if filtered else None)
+            if not docs:
+                self._add(list_calls=1)
+                break
+            refs = [doc.reference for doc in docs]
+            if self.subcollections:
+                for subs in self._lookups.map(list_subcollections, refs):
+                    for sub in subs:
+                        self._worklist.put((sub, False))
+            for start in range(0, len(refs), self.batch_size):
+                chunk = refs[start:start + self.batch_size]
+                if not self.dry_run:
+                    self.writes.submit(commit_deletes, chunk, ops=len(chunk))
+            self._add(pages=1, docs_listed=len(docs),
+                      list_calls=1 + (len(refs) if self.subcollections else 0),
+                      docs_submitted=0 if self.dry_run else len(docs))
+            if len(docs) < self.page_size:
+                break
+            cursor = docs[-1]
+        self._add(collections=1)
 
-def delete_entire_database():
-    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
+    def _add(self, **amounts):
+        with self._lock:
+            for key, value in amounts.items():
+                self.stats[key] += value
+            if time.monotonic() - self._logged < LOG_EVERY_S:
+                return
+            self._logged = time.monotonic()
+        self.log_progress("progress")
 
-    print("\n⚠️ WARNING: You are about to delete the entire Firestore database.\n")
+    def log_progress(self, label):
+        writes = self.writes.stats()
+        logger.info("delete %s: %d collections, %d pages, %d documents listed, %d deleted, "
+                    "%d queued (%.0f docs/s, %d in flight)",
+                    label, self.stats["collections"], self.stats["pages"],
+                    self.stats["docs_listed"], writes["ops"],
+                    self.stats["docs_submitted"] - writes["ops"], writes["ops_per_s"],
+                    writes["in_flight"])
 
-    collections = db.collections()
-    for coll in collections:
-        print(f"\nDeleting collection: {coll.id}")
-        delete_collection(coll)
 
-    print("\n✅ All Firestore data deleted successfully!\n")
+# =====================================================
+# ENTRY POINT
+# =====================================================
+@stage("delete")
+def delete_documents(collection=None, older_than=None, time_field=None, dry_run=False,
+                     workers=WORKERS, page_size=PAGE_SIZE, batch_size=BATCH_SIZE,
+                     subcollections=SUBCOLLECTIONS) -> dict:
+    """
+    Delete the database, or one collection path, optionally only the
+    documents older than the ISO timestamp older_than. Returns the counters.
+    """
+    load_dotenv()
+    db = get_db()
+    roots = [db.collection(collection)] if collection else list(db.collections())
+
+    scope = f"collection {collection}" if collection else "the entire database"
+    if older_than:
+        scope += f" (documents older than {older_than})"
+    if dry_run:
+        logger.info("Dry run: listing %s, nothing is deleted.", scope)
+    else:
+        logger.warning("⚠️ Deleting %s.", scope)
+
+    with WriteScheduler("delete") as writes:
+        deleter = Deleter(writes, dry_run, page_size, batch_size, workers,
+                          cutoff=older_than, time_field=time_field, subcollections=subcollections)
+        deleter.run(roots)
+        writes.join()
+        deleter.log_progress("done")
 
+    count("firestore_calls", deleter.stats["list_calls"])
+    count("rows_in", deleter.stats["docs_listed"])
+    count("rows_out", 0 if dry_run else deleter.stats["docs_submitted"])
+    return deleter.stats
 
+
+def delete_entire_database(dry_run=False):
+    return delete_documents(dry_run=dry_run)
+
+
+# =====================================================
+# MAIN
+# =====================================================
 if __name__ == "__main__":
-    delete_entire_database()
+    parser = argparse.ArgumentParser(description="Bulk-delete Firestore documents")
+    parser.add_argument("--collection", help="collection path to delete (default: every collection)")
+    parser.add_argument("--older-than", metavar="ISO_TIMESTAMP",
+                        help="only delete documents whose time field is before this timestamp")
+    parser.add_argument("--time-field",
+                        help=f"field compared with --older-than (default: {DEFAULT_TIME_FIELD}, "
+                             "timestamp for interactions)")
+    parser.add_argument("--dry-run", action="store_true", help="list and count, delete nothing")
+    parser.add_argument("--no-subcollections", action="store_true",
+                        help="don't look for subcollections (flat schemas; one call less per document)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="collections listed in parallel (DELETE_WORKERS)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE,
+                        help="documents per listing page (DELETE_PAGE_SIZE)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="documents per delete batch, at most 500 (DELETE_BATCH_SIZE)")
+    args = parser.parse_args()
+
+    try:
+        stats = delete_documents(args.collection, args.older_than, args.time_field, args.dry_run,
+                                 args.workers, args.page_size, args.batch_size,
+                                 SUBCOLLECTIONS and not args.no_subcollections)
+        verb = "would be deleted" if args.dry_run else "deleted"
+        logger.info("✅ %d documents in %d collections %s.",
+                    stats["docs_listed"], stats["collections"], verb)
+    except Exception as e:
+        logger.error("Delete failed: %s", e)
+        raise
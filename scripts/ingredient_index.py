@@ -0,0 +1,234 @@
+import os
+import json
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from utils_retry import retry
+from cdc import incremental_changes, changed_ids, mark_processed
+
+# =====================================================
+# LOGGING
+# =====================================================
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+CLEAN_FOLDER = os.path.join("outputs", "clean")
+INDEX_FOLDER = os.path.join("outputs", "index", "ingredients")
+# --build is skipped when no recipe changed since the last build (cdc.py);
+# any change rebuilds the whole postings file (term/recipe pairs are
+# grouped vectorized, then each term's list is encoded in a Python loop)
+CDC_CONSUMER = "ingredient_index"
+CDC_SOURCES = ("ingredient_index.py", "cdc.py")
+
+
+# =====================================================
+# SAFE CSV READ WITH RETRY
+# =====================================================
+@retry(Exception, tries=3, delay=1, backoff=2)
+def safe_read_csv(path: str) -> pd.DataFrame:
+    return pd.read_csv(path)
+
+
+def normalize_ingredient(name) -> str:
+    return " ".join(str(name).strip().lower().split())
+
+
+# =====================================================
+# POSTING LIST ENCODING
+# -----------------------------------------------------
+# Each posting list is a sorted array of recipe integer
+# IDs stored as deltas in the narrowest unsigned dtype
+# that fits the largest gap. Very dense lists (common
+# ingredients such as onion or oil) are stored as a
+# packed bitmap instead when that is smaller.
+# =====================================================
+_DELTA_DTYPES = [np.uint8, np.uint16, np.uint32]
+
+
+def encode_postings(ids: np.ndarray, n_recipes: int):
+    """Return (kind, dtype_name, bytes) for one sorted posting list."""
+    bitmap_bytes = (n_recipes + 7) // 8
+    deltas = np.diff(ids, prepend=0)
+    max_delta = int(deltas.max()) if len(deltas) else 0
+    dtype = next(d for d in _DELTA_DTYPES if max_delta <= np.iinfo(d).max)
+
+    if len(ids) * np.dtype(dtype).itemsize > bitmap_bytes:
+        mask = np.zeros(n_recipes, dtype=bool)
+        mask[ids] = True
+        return "bitmap", "uint8", np.packbits(mask).tobytes()
+    return "delta", np.dtype(dtype).name, deltas.astype(dtype).tobytes()
+
+
+# =====================================================
+# INVERTED INDEX
+# =====================================================
+class IngredientIndex:
+    """
+    Inverted index from normalized ingredient name to recipe IDs.
+
+    All posting lists live in one postings.bin file that is memory-mapped at
+    query time; a JSON directory holds per-term offsets and the recipe ID
+    table.
+    """
+
+    def __init__(self, folder=INDEX_FOLDER):
+        with open(os.path.join(folder, "directory.json"), "r", encoding="utf-8") as f:
+            directory = json.load(f)
+        self.terms = directory["terms"]
+        self.n_recipes = directory["n_recipes"]
+        self.recipe_ids = np.asarray(directory["recipe_ids"], dtype=object)
+        self._data = np.memmap(os.path.join(folder, "postings.bin"), dtype=np.uint8, mode="r")
+
+    # ---------------------------- BUILD ----------------------------
+    @staticmethod
+    def build(ingredients: pd.DataFrame, folder=INDEX_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+
+        rows = ingredients[["recipe_id", "ingredient_name"]].dropna()
+        recipe_codes, recipe_ids = pd.factorize(rows["recipe_id"], sort=True)
+
+        name_codes, names = pd.factorize(rows["ingredient_name"])
+        normalized = pd.Index([normalize_ingredient(n) for n in names])
+        term_codes, terms = pd.factorize(normalized[name_codes])
+
+        pairs = np.unique(term_codes.astype(np.int64) * len(recipe_ids) + recipe_codes)
+        pair_terms, pair_recipes = pairs // len(recipe_ids), pairs % len(recipe_ids)
+        bounds = np.searchsorted(pair_terms, np.arange(len(terms) + 1))
+
+        directory = {}
+        offset = 0
+        with open(os.path.join(folder, "postings.bin"), "wb") as f:
+            for t, term in enumerate(terms):
+                ids = pair_recipes[bounds[t]:bounds[t + 1]]
+                kind, dtype, payload = encode_postings(ids, len(recipe_ids))
+                f.write(payload)
+                directory[term] = {
+                    "kind": kind, "dtype": dtype, "offset": offset,
+                    "length": len(payload), "count": int(len(ids)),
+                }
+                offset += len(payload)
+
+        with open(os.path.join(folder, "directory.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "n_recipes": int(len(recipe_ids)),
+                "recipe_ids": [str(r) for r in recipe_ids],
+                "terms": directory,
+            }, f)
+
+        logger.info(
+            "Ingredient index built: %d terms, %d recipes, %d bytes of postings.",
+            len(terms), len(recipe_ids), offset
+        )
+
+    # ---------------------------- DECODE ----------------------------
+    def _entry(self, ingredient):
+        return self.terms.get(normalize_ingredient(ingredient))
+
+    def postings(self, ingredient) -> np.ndarray:
+        """Sorted recipe integer IDs containing the ingredient."""
+        entry = self._entry(ingredient)
+        if entry is None:
+            return np.empty(0, dtype=np.int64)
+        raw = self._data[entry["offset"]:entry["offset"] + entry["length"]]
+        if entry["kind"] == "bitmap":
+            return np.flatnonzero(np.unpackbits(raw, count=self.n_recipes))
+        return np.cumsum(raw.view(entry["dtype"]), dtype=np.int64)
+
+    def contains(self, ingredient, ids: np.ndarray) -> np.ndarray:
+        """Boolean mask: which of the given recipe IDs contain the ingredient."""
+        entry = self._entry(ingredient)
+        if entry is None:
+            return np.zeros(len(ids), dtype=bool)
+        if entry["kind"] == "bitmap":
+            raw = self._data[entry["offset"]:entry["offset"] + entry["length"]]
+            return ((raw[ids >> 3] >> (7 - (ids & 7))) & 1).astype(bool)
+        postings = self.postings(ingredient)
+        pos = np.minimum(np.searchsorted(postings, ids), len(postings) - 1)
+        return postings[pos] == ids
+
+    # ---------------------------- QUERY ----------------------------
+    def _count(self, ingredient) -> int:
+        entry = self._entry(ingredient)
+        return entry["count"] if entry else 0
+
+    def query_ids(self, all_of=(), any_of=(), none_of=()) -> np.ndarray:
+        """
+        Recipe integer IDs matching AND(all_of) AND OR(any_of) AND NOT(none_of).
+
+        The candidate set starts from the shortest all_of list (or the union
+        of any_of lists) and every other clause is applied as a membership
+        filter, so work is proportional to the smallest list rather than to
+        the number of recipes.
+        """
+        all_of, any_of, none_of = list(all_of), list(any_of), list(none_of)
+        if not all_of and not any_of:
+            raise ValueError("Query needs at least one ingredient in all_of or any_of")
+
+        if all_of:
+            ordered = sorted(all_of, key=self._count)
+            ids = self.postings(ordered[0])
+            for ingredient in ordered[1:]:
+                if len(ids) == 0:
+                    break
+                ids = ids[self.contains(ingredient, ids)]
+            if any_of and len(ids):
+                keep = np.zeros(len(ids), dtype=bool)
+                for ingredient in any_of:
+                    keep |= self.contains(ingredient, ids)
+                ids = ids[keep]
+        elif any((self._entry(i) or {}).get("kind") == "bitmap" for i in any_of):
+            mask = np.zeros(self.n_recipes, dtype=bool)
+            for ingredient in any_of:
+                entry = self._entry(ingredient)
+                if entry is None:
+                    continue
+                if entry["kind"] == "bitmap":
+                    raw = self._data[entry["offset"]:entry["offset"] + entry["length"]]
+                    mask |= np.unpackbits(raw, count=self.n_recipes).astype(bool)
+                else:
+                    mask[self.postings(ingredient)] = True
+            ids = np.flatnonzero(mask)
+        else:
+            ids = np.sort(np.concatenate([self.postings(i) for i in any_of]))
+            ids = ids[np.r_[True, ids[1:] != ids[:-1]]] if len(ids) else ids
+
+        for ingredient in none_of:
+            if len(ids) == 0:
+                break
+            ids = ids[~self.contains(ingredient, ids)]
+        return ids
+
+    def query(self, all_of=(), any_of=(), none_of=()) -> list:
+        """Recipe ID strings matching the query."""
+        return self.recipe_ids[self.query_ids(all_of, any_of, none_of)].tolist()
+
+
+# =====================================================
+# MAIN
+# =====================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingredient inverted index")
+    parser.add_argument("--build", action="store_true", help="(re)build the index")
+    parser.add_argument("--all", nargs="*", default=[], help="ingredients that must all appear")
+    parser.add_argument("--any", nargs="*", default=[], help="at least one must appear")
+    parser.add_argument("--none", nargs="*", default=[], help="ingredients to exclude")
+    args = parser.parse_args()
+
+    try:
+        exists = os.path.exists(os.path.join(INDEX_FOLDER, "directory.json"))
+        changes = incremental_changes(CDC_CONSUMER, CDC_SOURCES) if exists else None
+        if args.build and changes is not None and not (changed_ids(changes) or changes["delete"]):
+            logger.info("Ingredient index already reflects snapshot %s: no rebuild.", changes["snapshot"])
+        elif args.build or not exists:
+            IngredientIndex.build(safe_read_csv(os.path.join(CLEAN_FOLDER, "ingredients_clean.csv")))
+            mark_processed(CDC_CONSUMER, CDC_SOURCES)
+        if args.all or args.any:
+            for rid in IngredientIndex().query(args.all, args.any, args.none):
+                print(rid)
+    except Exception as e:
+        logger.error("Ingredient index job failed: %s", e)
+        raise
@@ -0,0 +1,606 @@
+import os
+import json
+import time
+import uuid
+import random
+import datetime
+import bisect
+import threading
+import functools
+
+# =====================================================
+# LOCAL FIRESTORE STAND-IN
+# -----------------------------------------------------
+# The subset of the google-cloud-firestore client API the
+# pipeline uses, backed by memory or by a directory of
+# JSON files (one file per document, subcollections in a
+# folder next to their parent document):
+#
+#   client.collection(path) / client.document(path)
+#   client.collections() / client.batch()
+#   collection.document(id) / .stream() / .limit(n)
+#   collection.order_by(field, direction) / .where(f, op, v)
+#   collection.start_after(snapshot or {field: value})
+#   document.set(data, merge) / .get() / .update(data)
+#   document.delete() / .collection(name) / .collections()
+#   batch.set / .update / .delete / .commit()
+#
+# Every call (a stream, get, set, delete or batch commit)
+# can be slowed down by a fixed latency, limited to a
+# number of documents per second and made to fail with a
+# transient error at a given rate, so retries, batching and
+# pagination can be exercised offline.
+#
+# Selected with FIRESTORE_BACKEND=local (utils_firestore).
+# =====================================================
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+MAX_BATCH_WRITES = 500
+
+
+class LocalFirestoreError(Exception):
+    pass
+
+
+class ServiceUnavailable(LocalFirestoreError):
+    """Injected transient failure (Firestore's UNAVAILABLE)."""
+
+
+class DeadlineExceeded(LocalFirestoreError):
+    """Injected transient failure (Firestore's DEADLINE_EXCEEDED)."""
+
+
+class NotFound(LocalFirestoreError):
+    pass
+
+
+# =====================================================
+# VALUE ORDERING (Firestore's cross-type order)
+# =====================================================
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime.datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, (list, tuple)):
+        return 8
+    return 9
+
+
+def _compare(a, b) -> int:
+    rank_a, rank_b = _type_rank(a), _type_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    if rank_a == 0:
+        return 0
+    if rank_a == 8:
+        for x, y in zip(a, b):
+            c = _compare(x, y)
+            if c:
+                return c
+        return (len(a) > len(b)) - (len(a) < len(b))
+    if rank_a == 9:
+        a, b = json.dumps(a, sort_keys=True, default=str), json.dumps(b, sort_keys=True, default=str)
+    return (a > b) - (a < b)
+
+
+_MISSING = object()
+
+
+def _get_field(data, field_path):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data, field_path, value):
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+
+def _merge(target, updates):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _copy(data):
+    return json.loads(json.dumps(data, default=str))
+
+
+# =====================================================
+# STORAGE BACKENDS
+# A collection is addressed by its full path
+# ("recipes" or "recipes/r1/reviews").
+# =====================================================
+class _MemoryStore:
+    def __init__(self):
+        self._collections = {}
+        self._sorted_ids = {}       # collection -> sorted ids, dropped when ids change
+
+    def get(self, collection, doc_id):
+        return self._collections.get(collection, {}).get(doc_id)
+
+    def put(self, collection, doc_id, data):
+        docs = self._collections.setdefault(collection, {})
+        if doc_id not in docs:
+            self._sorted_ids.pop(collection, None)
+        docs[doc_id] = data
+
+    def delete(self, collection, doc_id):
+        if self._collections.get(collection, {}).pop(doc_id, None) is not None:
+            self._sorted_ids.pop(collection, None)
+
+    def document_ids(self, collection):
+        if collection not in self._sorted_ids:
+            self._sorted_ids[collection] = sorted(self._collections.get(collection, {}))
+        return list(self._sorted_ids[collection])
+
+    def documents(self, collection):
+        docs = self._collections.get(collection, {})
+        return [(doc_id, docs[doc_id]) for doc_id in sorted(docs)]
+
+    def collection_ids(self, parent):
+        prefix = parent + "/" if parent else ""
+        depth = prefix.count("/")
+        return sorted(
+            path[len(prefix):] for path, docs in self._collections.items()
+            if docs and path.startswith(prefix) and path.count("/") == depth
+        )
+
+
+class _DiskStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _doc_path(self, collection, doc_id):
+        return os.path.join(self.root, *collection.split("/"), doc_id + ".json")
+
+    def get(self, collection, doc_id):
+        try:
+            with open(self._doc_path(collection, doc_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, collection, doc_id, data):
+        path = self._doc_path(collection, doc_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp_path, path)
+
+    def delete(self, collection, doc_id):
+        try:
+            os.remove(self._doc_path(collection, doc_id))
+        except FileNotFoundError:
+            pass
+
+    def document_ids(self, collection):
+        folder = os.path.join(self.root, *collection.split("/"))
+        if not os.path.isdir(folder):
+            return []
+        return sorted(
+            entry.name[:-5] for entry in os.scandir(folder)
+            if entry.is_file() and entry.name.endswith(".json")
+        )
+
+    def documents(self, collection):
+        docs = ((doc_id, self.get(collection, doc_id)) for doc_id in self.document_ids(collection))
+        return [(doc_id, data) for doc_id, data in docs if data is not None]
+
+    def _has_documents(self, folder):
+        for _, _, files in os.walk(folder):
+            if any(name.endswith(".json") for name in files):
+                return True
+        return False
+
+    def collection_ids(self, parent):
+        folder = os.path.join(self.root, *parent.split("/")) if parent else self.root
+        if not os.path.isdir(folder):
+            return []
+        return sorted(
+            entry.name for entry in os.scandir(folder)
+            if entry.is_dir() and self._has_documents(entry.path)
+        )
+
+
+# =====================================================
+# SNAPSHOTS, REFERENCES, QUERIES
+# =====================================================
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return None if self._data is None else _copy(self._data)
+
+    def get(self, field_path):
+        if field_path == "__name__":
+            return self.id
+        value = _MISSING if self._data is None else _get_field(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return _copy(value) if isinstance(value, (dict, list)) else value
+
+
+class DocumentReference:
+    def __init__(self, client, collection_path, doc_id):
+        if not doc_id or "/" in doc_id or doc_id in (".", ".."):
+            raise ValueError(f"Invalid document id: {doc_id!r}")
+        self._client = client
+        self._collection_path = collection_path
+        self.id = doc_id
+        self.path = f"{collection_path}/{doc_id}"
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._collection_path)
+
+    def collection(self, name):
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def collections(self):
+        self._client._call()
+        return [self.collection(name) for name in self._client._store.collection_ids(self.path)]
+
+    def get(self):
+        self._client._call(docs=1)
+        with self._client._lock:
+            data = self._client._store.get(self._collection_path, self.id)
+        return DocumentSnapshot(self, data)
+
+    def set(self, data, merge=False):
+        self._client._call(docs=1)
+        self._client._apply([("set", self, data, merge)])
+
+    def update(self, data):
+        self._client._call(docs=1)
+        self._client._apply([("update", self, data, False)])
+
+    def delete(self):
+        self._client._call(docs=1)
+        self._client._apply([("delete", self, None, False)])
+
+
+class Query:
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    _OPERATORS = {
+        "==": lambda v, x: _compare(v, x) == 0,
+        "!=": lambda v, x: _compare(v, x) != 0,
+        "<": lambda v, x: _type_rank(v) == _type_rank(x) and _compare(v, x) < 0,
+        "<=": lambda v, x: _type_rank(v) == _type_rank(x) and _compare(v, x) <= 0,
+        ">": lambda v, x: _type_rank(v) == _type_rank(x) and _compare(v, x) > 0,
+        ">=": lambda v, x: _type_rank(v) == _type_rank(x) and _compare(v, x) >= 0,
+        "in": lambda v, x: any(_compare(v, item) == 0 for item in x),
+        "not-in": lambda v, x: all(_compare(v, item) != 0 for item in x),
+        "array_contains": lambda v, x: isinstance(v, list) and any(_compare(i, x) == 0 for i in v),
+        "array_contains_any": lambda v, x: isinstance(v, list) and any(
+            _compare(i, item) == 0 for i in v for item in x
+        ),
+    }
+
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None, cursor=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+
+    def _with(self, **changes):
+        state = {
+            "filters": self._filters, "orders": self._orders,
+            "limit": self._limit, "cursor": self._cursor,
+        }
+        state.update(changes)
+        return Query(self._client, self._collection_path, **state)
+
+    def where(self, field_path, op, value):
+        if op not in self._OPERATORS:
+            raise ValueError(f"Unsupported operator: {op}")
+        return self._with(filters=self._filters + ((field_path, op, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        if direction not in (ASCENDING, DESCENDING):
+            raise ValueError(f"Invalid direction: {direction}")
+        return self._with(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def start_after(self, document_fields):
+        """Continue after a DocumentSnapshot, or after {field: value} for the order_by fields."""
+        return self._with(cursor=document_fields)
+
+    # ---------------- EVALUATION ----------------
+    def _full_orders(self):
+        orders = list(self._orders)
+        if not any(field == "__name__" for field, _ in orders):
+            last_direction = orders[-1][1] if orders else ASCENDING
+            orders.append(("__name__", last_direction))
+        return orders
+
+    @staticmethod
+    def _value(doc_id, data, field_path):
+        return doc_id if field_path == "__name__" else _get_field(data, field_path)
+
+    def _cursor_values(self, orders):
+        cursor = self._cursor
+        if isinstance(cursor, DocumentSnapshot):
+            data = cursor._data or {}
+            return [self._value(cursor.id, data, field) for field, _ in orders]
+        return [cursor[field] for field, _ in orders if field in cursor]
+
+    def _matches(self, data):
+        for field_path, op, value in self._filters:
+            actual = _get_field(data, field_path)
+            if actual is _MISSING or not self._OPERATORS[op](actual, value):
+                return False
+        return True
+
+    def _run_by_name(self, direction):
+        """Query ordered by document id only: seek to the cursor, read just one page."""
+        store = self._client._store
+        cursor = self._cursor_values([("__name__", direction)]) if self._cursor is not None else []
+        with self._client._lock:
+            doc_ids = store.document_ids(self._collection_path)     # ascending
+            if direction == DESCENDING:
+                if cursor:
+                    doc_ids = doc_ids[:bisect.bisect_left(doc_ids, cursor[0])]
+                doc_ids.reverse()
+            elif cursor:
+                doc_ids = doc_ids[bisect.bisect_right(doc_ids, cursor[0]):]
+
+            rows = []
+            for doc_id in doc_ids:
+                if self._limit is not None and len(rows) >= self._limit:
+                    break
+                data = store.get(self._collection_path, doc_id)
+                if data is not None and self._matches(data):
+                    rows.append(([doc_id], doc_id, data))
+        return rows
+
+    def _run(self):
+        orders = self._full_orders()
+        if len(orders) == 1:
+            return self._run_by_name(orders[0][1])
+
+        rows = []
+        with self._client._lock:
+            documents = self._client._store.documents(self._collection_path)
+        for doc_id, data in documents:
+            if not self._matches(data):
+                continue
+            values = [self._value(doc_id, data, field) for field, _ in orders]
+            if any(v is _MISSING for v in values):
+                continue        # ordering by a field excludes documents without it
+            rows.append((values, doc_id, data))
+
+        def compare_rows(a_values, b_values):
+            for (_, direction), x, y in zip(orders, a_values, b_values):
+                c = _compare(x, y)
+                if c:
+                    return -c if direction == DESCENDING else c
+            return 0
+
+        rows.sort(key=functools.cmp_to_key(lambda a, b: compare_rows(a[0], b[0])))
+        if self._cursor is not None:
+            cursor = self._cursor_values(orders)
+            rows = [row for row in rows if compare_rows(row[0][:len(cursor)], cursor) > 0]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    def stream(self):
+        """Documents matching the query, as of the call (an iterator of snapshots)."""
+        rows = self._run()
+        self._client._call(docs=len(rows))
+        return iter([
+            DocumentSnapshot(DocumentReference(self._client, self._collection_path, doc_id), data)
+            for _, doc_id, data in rows
+        ])
+
+    def get(self):
+        return list(self.stream())
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, doc_id=None):
+        return DocumentReference(self._client, self.path, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def list_documents(self):
+        self._client._call()
+        with self._client._lock:
+            documents = self._client._store.documents(self.path)
+        return [self.document(doc_id) for doc_id, _ in documents]
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def _add(self, write):
+        if len(self._writes) >= MAX_BATCH_WRITES:
+            raise ValueError(f"A batch holds at most {MAX_BATCH_WRITES} writes")
+        self._writes.append(write)
+
+    def set(self, reference, data, merge=False):
+        self._add(("set", reference, data, merge))
+
+    def update(self, reference, data):
+        self._add(("update", reference, data, False))
+
+    def delete(self, reference):
+        self._add(("delete", reference, None, False))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        """Apply every write atomically; a failed commit applies none of them."""
+        self._client._call(docs=len(self._writes))
+        self._client._apply(self._writes)
+        committed = datetime.datetime.now(datetime.timezone.utc)
+        results = [committed] * len(self._writes)
+        self._writes = []
+        return results
+
+
+# =====================================================
+# CLIENT
+# =====================================================
+class _Throttle:
+    """Token bucket allowing rate documents per second (bursts up to one second's worth)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class LocalFirestore:
+    """
+    Stand-in for firestore.Client.
+
+    path: folder for the documents, or None to keep them in memory.
+    latency_ms: added to every call. max_docs_per_s: documents read or
+    written per second across the client (0 = unlimited). fault_rate:
+    share of calls failing with ServiceUnavailable / DeadlineExceeded
+    before they take effect.
+    """
+
+    def __init__(self, path=None, latency_ms=0.0, max_docs_per_s=0, fault_rate=0.0, seed=None):
+        self._store = _DiskStore(path) if path else _MemoryStore()
+        self._lock = threading.RLock()
+        self.latency_ms = latency_ms
+        self.fault_rate = fault_rate
+        self._throttle = _Throttle(max_docs_per_s) if max_docs_per_s else None
+        self._random = random.Random(seed)
+        self.stats = {"calls": 0, "docs": 0, "faults": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Configured from FIRESTORE_LOCAL_* (an empty FIRESTORE_LOCAL_PATH keeps data in memory)."""
+        seed = os.getenv("FIRESTORE_LOCAL_SEED")
+        return cls(
+            path=os.getenv("FIRESTORE_LOCAL_PATH", "local_firestore") or None,
+            latency_ms=float(os.getenv("FIRESTORE_LOCAL_LATENCY_MS", "0")),
+            max_docs_per_s=float(os.getenv("FIRESTORE_LOCAL_MAX_DOCS_PER_S", "0")),
+            fault_rate=float(os.getenv("FIRESTORE_LOCAL_FAULT_RATE", "0")),
+            seed=int(seed) if seed else None,
+        )
+
+    # ---------------- PUBLIC API ----------------
+    def collection(self, path):
+        if path.count("/") % 2:
+            raise ValueError(f"Not a collection path: {path}")
+        return CollectionReference(self, path)
+
+    def document(self, path):
+        collection_path, _, doc_id = path.rpartition("/")
+        if not collection_path or collection_path.count("/") % 2:
+            raise ValueError(f"Not a document path: {path}")
+        return DocumentReference(self, collection_path, doc_id)
+
+    def collections(self):
+        self._call()
+        return [CollectionReference(self, name) for name in self._store.collection_ids("")]
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def close(self):
+        pass
+
+    def import_collections(self, collections: dict, id_field="id"):
+        """Bulk-load {collection path: [documents]} (keyed by id_field) without latency or faults."""
+        with self._lock:
+            for path, docs in collections.items():
+                for data in docs:
+                    self._store.put(path, str(data[id_field]), _copy(data))
+
+    # ---------------- INTERNALS ----------------
+    def _call(self, docs=0):
+        """Account for one call: latency, throughput limit, injected faults."""
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["docs"] += docs
+            fault = self.fault_rate and self._random.random() < self.fault_rate
+            if fault:
+                self.stats["faults"] += 1
+                error = self._random.choice([ServiceUnavailable, DeadlineExceeded])
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self._throttle and docs:
+            self._throttle.acquire(docs)
+        if fault:
+            raise error(f"injected transient failure ({error.__name__})")
+
+    def _apply(self, writes):
+        with self._lock:
+            for kind, ref, _, _ in writes:
+                if kind == "update" and self._store.get(ref._collection_path, ref.id) is None:
+                    raise NotFound(f"No document to update: {ref.path}")
+            for kind, ref, data, merge in writes:
+                if kind == "delete":
+                    self._store.delete(ref._collection_path, ref.id)
+                    continue
+                current = self._store.get(ref._collection_path, ref.id)
+                if kind == "set" and not (merge and current):
+                    self._store.put(ref._collection_path, ref.id, _copy(data))
+                    continue
+                updated = _copy(current or {})
+                if kind == "update":
+                    for field_path, value in data.items():
+                        _set_field(updated, field_path, _copy(value))
+                else:
+                    _merge(updated, _copy(data))
+                self._store.put(ref._collection_path, ref.id, updated)
@@ -0,0 +1,180 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from utils_tables import get_table, interaction_window, warn_compacted_ignored
+from utils_engagement import interaction_weights
+
+# =====================================================
+# LOGGING
+# =====================================================
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+ANALYSIS_FOLDER = "analysis"
+
+NEIGHBOURS_K = 50          # similar recipes kept per recipe
+TOP_N = 10                 # recommendations per user
+ITEM_BLOCK = 2_000         # recipes per similarity block
+USER_BLOCK = 50_000        # users per scoring block
+
+
+# =====================================================
+# SPARSE HELPERS
+# =====================================================
+def build_user_item_matrix(interactions: pd.DataFrame):
+    """
+    Weighted user x recipe CSR matrix using the analytics engagement weights.
+
+    Repeated interactions of one user with one recipe are summed.
+    """
+    rows = interactions.dropna(subset=["user_id", "recipe_id"])
+    # sorted codes: ties break the same way whatever the row order
+    # (date-partitioned interactions come back in date order)
+    user_codes, user_ids = pd.factorize(rows["user_id"], sort=True)
+    recipe_codes, recipe_ids = pd.factorize(rows["recipe_id"], sort=True)
+
+    matrix = sparse.csr_matrix(
+        (interaction_weights(rows).to_numpy(dtype=np.float32), (user_codes, recipe_codes)),
+        shape=(len(user_ids), len(recipe_ids)),
+    )
+    matrix.sum_duplicates()
+    matrix.eliminate_zeros()
+    return matrix, np.asarray(user_ids, dtype=object), np.asarray(recipe_ids, dtype=object)
+
+
+def top_k_per_row(matrix, k: int):
+    """Keep only the k largest entries of every row of a CSR matrix."""
+    matrix = matrix.tocsr()
+    matrix.eliminate_zeros()
+    row_of = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+
+    order = np.lexsort((-matrix.data, row_of))
+    start_of_row = matrix.indptr[row_of[order]]
+    rank = np.arange(len(order)) - start_of_row
+    keep = order[rank < k]
+
+    return sparse.csr_matrix(
+        (matrix.data[keep], (row_of[keep], matrix.indices[keep])),
+        shape=matrix.shape,
+    )
+
+
+# =====================================================
+# ITEM-ITEM SIMILARITY
+# =====================================================
+def item_similarity(matrix, k=NEIGHBOURS_K, block=ITEM_BLOCK):
+    """
+    Cosine similarity between recipe columns, pruned to the top-k per recipe.
+
+    Computed block-wise over recipes (block x n_items at a time) so only the
+    pruned result is ever held for the whole catalogue.
+    """
+    csc = matrix.tocsc()
+    norms = np.sqrt(np.asarray(csc.multiply(csc).sum(axis=0)).ravel())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = (csc @ sparse.diags(inv.astype(np.float32))).tocsc()
+    normalized_t = normalized.T.tocsr()
+
+    n_items = matrix.shape[1]
+    blocks = []
+    for start in range(0, n_items, block):
+        stop = min(start + block, n_items)
+        sims = (normalized_t[start:stop] @ normalized).tocsr()
+        # drop self-similarity on the diagonal of this block
+        sims = sims - sparse.csr_matrix(
+            (sims.diagonal(k=start), (np.arange(stop - start), np.arange(start, stop))),
+            shape=sims.shape,
+        )
+        blocks.append(top_k_per_row(sims, k))
+        logger.info("Item similarity: %d / %d recipes done", stop, n_items)
+
+    if not blocks:
+        return sparse.csr_matrix((n_items, n_items), dtype=np.float32)
+    return sparse.vstack(blocks).tocsr()
+
+
+# =====================================================
+# RECOMMENDATIONS
+# =====================================================
+def recommend(matrix, similarity, n=TOP_N, block=USER_BLOCK):
+    """
+    Top-n unseen recipes per user: score = user_row @ similarity.
+
+    Users are scored in blocks; recipes the user already interacted with are
+    removed from the sparse score matrix before ranking.
+    """
+    results = []
+    for start in range(0, matrix.shape[0], block):
+        users = matrix[start:start + block]
+        scores = (users @ similarity).tocsr()
+        seen = (users > 0).astype(scores.dtype)
+        scores = scores - scores.multiply(seen)
+        top = top_k_per_row(scores, n).tocoo()
+        results.append((top.row + start, top.col, top.data))
+
+    rows = np.concatenate([r[0] for r in results]) if results else np.empty(0, dtype=int)
+    cols = np.concatenate([r[1] for r in results]) if results else np.empty(0, dtype=int)
+    data = np.concatenate([r[2] for r in results]) if results else np.empty(0)
+    return rows, cols, data
+
+
+def to_ranked_frame(rows, cols, data, row_ids, col_ids, row_name, col_name):
+    frame = pd.DataFrame({row_name: row_ids[rows], col_name: col_ids[cols], "score": data})
+    frame = frame.sort_values([row_name, "score"], ascending=[True, False], kind="stable")
+    frame["rank"] = frame.groupby(row_name).cumcount() + 1
+    return frame[[row_name, col_name, "rank", "score"]]
+
+
+# =====================================================
+# MAIN RECOMMENDER FUNCTION
+# =====================================================
+def run_recommender():
+    os.makedirs(ANALYSIS_FOLDER, exist_ok=True)
+
+    logger.info("Loading cleaned interactions...")
+    since, until = interaction_window()
+    interactions = get_table(None, "interactions_clean", since, until)
+    warn_compacted_ignored("recommender", since, until)
+
+    matrix, user_ids, recipe_ids = build_user_item_matrix(interactions)
+    logger.info(
+        "User x recipe matrix: %d users x %d recipes (%d non-zeros)",
+        matrix.shape[0], matrix.shape[1], matrix.nnz
+    )
+    if matrix.nnz == 0:
+        logger.warning("No interactions to learn from (compacted or outside the window): "
+                       "writing empty neighbour and recommendation files.")
+
+    logger.info("Computing item-item cosine similarity...")
+    similarity = item_similarity(matrix)
+
+    neighbours = similarity.tocoo()
+    to_ranked_frame(
+        neighbours.row, neighbours.col, neighbours.data,
+        recipe_ids, recipe_ids, "recipe_id", "similar_recipe_id"
+    ).to_csv(os.path.join(ANALYSIS_FOLDER, "recipe_neighbours_cf.csv"), index=False)
+
+    logger.info("Scoring top-%d recommendations per user...", TOP_N)
+    rows, cols, data = recommend(matrix, similarity)
+    recommendations = to_ranked_frame(
+        rows, cols, data, user_ids, recipe_ids, "user_id", "recipe_id"
+    )
+    recommendations.to_csv(os.path.join(ANALYSIS_FOLDER, "user_recommendations.csv"), index=False)
+
+    logger.info("Recommendations written for %d users.", recommendations["user_id"].nunique())
+
+
+# =====================================================
+# MAIN
+# =====================================================
+if __name__ == "__main__":
+    try:
+        run_recommender()
+    except Exception as e:
+        logger.error("Recommender failed: %s", e)
+        raise
@@ -1,8 +1,17 @@
 import subprocess
 import sys
 import os
+import re
+import json
+import time
+import hashlib
 import logging
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
+import utils_metrics
 
 # =====================================================
 # 1. LOGGING CONFIGURATION
@@ -19,44 +28,477 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 SCRIPTS_DIR = os.getenv("SCRIPTS_DIR", "scripts")
+DEFAULT_STAGE_TIMEOUT = int(os.getenv("STAGE_TIMEOUT_SECONDS", "1800"))
+MAX_PARALLEL_STAGES = int(os.getenv("MAX_PARALLEL_STAGES", "4"))
+STATE_PATH = os.getenv("PIPELINE_STATE_PATH", os.path.join("outputs", ".pipeline_state.json"))
 
 # =====================================================
-# 3. SAFE SCRIPT RUNNER
+# 3. STAGE GRAPH
+# Each stage lists the stages it depends on; stages whose
+# dependencies are all done run in parallel. inputs/outputs
+# are the local files a stage reads and writes, used to
+# skip stages whose fingerprint has not changed.
+# in_process stages expose run_stage(tables) -> tables
+# and can run inside the orchestrator (--in-process).
 # =====================================================
-def run_script(script_name):
-    """Runs a python script inside the same venv."""
+# interactions are date-partitioned: the manifest carries a content hash
+# per partition (the single CSV is listed for INTERACTIONS_PARTITIONED=0)
+RAW_TABLES = [
+    "outputs/recipe.csv", "outputs/ingredients.csv", "outputs/steps.csv",
+    "outputs/step_texts.csv", "outputs/users.csv", "outputs/interactions.csv",
+    "outputs/interactions/_manifest.json", "outputs/interaction_aggregates.csv",
+]
+CLEAN_TABLES = [
+    "outputs/clean/recipes_clean.csv", "outputs/clean/ingredients_clean.csv",
+    "outputs/clean/steps_clean.csv", "outputs/clean/step_texts_clean.csv",
+    "outputs/clean/users_clean.csv", "outputs/clean/interactions_clean.csv",
+    "outputs/clean/interactions_clean/_manifest.json",
+    "outputs/clean/interaction_aggregates_clean.csv",
+]
+# environment that changes what a stage produces (the interaction window)
+FINGERPRINT_ENV = ["INTERACTIONS_SINCE", "INTERACTIONS_UNTIL"]
+
+STAGES = [
+    {
+        "script": "1_setup_firestore.py", "deps": [],
+        "in_process": True,
+        # writes to Firestore only; re-seeding is skipped while the seed is unchanged
+        "inputs": [os.getenv("PAV_SEED_PATH", "seed_data.json")],
+        "outputs": [],
+    },
+    {
+        "script": "2_export_firestore.py", "deps": ["1_setup_firestore.py"],
+        "in_process": True,
+        "inputs": [],
+        "outputs": RAW_TABLES,
+    },
+    {
+        "script": "3_transform_to_csv.py", "deps": ["2_export_firestore.py"],
+        "in_process": True,
+        "inputs": RAW_TABLES,
+        "outputs": CLEAN_TABLES,
+    },
+    {
+        "script": "4_validate_csv.py", "deps": ["3_transform_to_csv.py"],
+        "in_process": True,
+        "inputs": RAW_TABLES,
+        "outputs": ["outputs/validated/validation_report.txt"],
+    },
+    {
+        "script": "4a_great_expectations_check.py", "deps": ["3_transform_to_csv.py"],
+        "in_process": True,
+        "inputs": CLEAN_TABLES,
+        "outputs": ["outputs/validated/custom_ge_report.txt"],
+    },
+    {
+        "script": "5_analytics.py", "deps": ["3_transform_to_csv.py"],
+        "in_process": True,
+        "inputs": CLEAN_TABLES,
+        "outputs": [
+            "analysis/insights_summary.txt", "analysis/correlation_matrix.csv",
+            "analysis/distribution_stats.csv",
+        ],
+    },
+]
+
+# --streaming: Firestore documents flow straight into aggregates
+# (stream_pipeline.py) instead of stages 2-5 and their CSV files
+STREAM_STAGES = [
+    STAGES[0],
+    {
+        "script": "stream_pipeline.py", "deps": ["1_setup_firestore.py"],
+        "in_process": True,
+        "inputs": [],
+        "outputs": [
+            "analysis/stream/recipe_metrics.csv", "analysis/stream/summary.json",
+            "analysis/stream/validation_report.txt",
+        ],
+    },
+]
+
+
+def check_graph(stages):
+    """Fail early on unknown dependencies or cycles; returns a topological order."""
+    names = {s["script"] for s in stages}
+    for stage in stages:
+        unknown = set(stage["deps"]) - names
+        if unknown:
+            raise ValueError(f"{stage['script']} depends on unknown stage(s): {sorted(unknown)}")
+
+    order = []
+    remaining = {s["script"]: set(s["deps"]) for s in stages}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if deps <= set(order)]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages: {sorted(remaining)}")
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+    return order
+
+
+# =====================================================
+# 4. STAGE FINGERPRINTS (make-style skip-if-unchanged)
+# =====================================================
+_LOCAL_IMPORT_RE = re.compile(r"^\s*(?:from|import)\s+(\w+)", re.MULTILINE)
+
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return "missing"
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_files(script_name):
+    """The stage script plus every local module it imports (transitively)."""
+    seen, queue = set(), [script_name]
+    while queue:
+        name = queue.pop()
+        path = os.path.join(SCRIPTS_DIR, name)
+        if name in seen or not os.path.exists(path):
+            continue
+        seen.add(name)
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+        for module in _LOCAL_IMPORT_RE.findall(source):
+            queue.append(f"{module}.py")
+    return sorted(seen)
+
+
+def stage_fingerprint(stage, upstream):
+    """Hash of the stage code, its input files and its dependencies' fingerprints."""
+    digest = hashlib.sha256()
+    for name in code_files(stage["script"]):
+        digest.update(f"code:{name}:{file_hash(os.path.join(SCRIPTS_DIR, name))}".encode())
+    for path in stage["inputs"]:
+        digest.update(f"input:{path}:{file_hash(path)}".encode())
+    for dep in sorted(stage["deps"]):
+        digest.update(f"dep:{dep}:{upstream.get(dep, '')}".encode())
+    for name in FINGERPRINT_ENV:
+        digest.update(f"env:{name}:{os.getenv(name, '')}".encode())
+    return digest.hexdigest()
+
+
+def load_state():
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH) or ".", exist_ok=True)
+    tmp = STATE_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, STATE_PATH)
+
+
+def is_up_to_date(stage, fingerprint, state):
+    recorded = state.get(stage["script"])
+    if not recorded or recorded.get("fingerprint") != fingerprint:
+        return False
+    # outputs must still be exactly what the recorded run produced
+    return all(
+        file_hash(path) == recorded.get("outputs", {}).get(path)
+        for path in stage["outputs"]
+    )
+
+
+def downstream_of(stages, start):
+    """start plus every stage that (transitively) depends on it."""
+    selected = {start}
+    changed = True
+    while changed:
+        changed = False
+        for stage in stages:
+            if stage["script"] not in selected and selected & set(stage["deps"]):
+                selected.add(stage["script"])
+                changed = True
+    return selected
+
+
+# =====================================================
+# 5. SAFE SCRIPT RUNNER
+# =====================================================
+def run_script(script_name, timeout=DEFAULT_STAGE_TIMEOUT):
+    """Runs a python script inside the same venv. Returns True on success."""
     script_path = os.path.join(SCRIPTS_DIR, script_name)
 
     logger.info(f"▶ Running: {script_name}")
+    started = time.monotonic()
 
     try:
-        result = subprocess.run([sys.executable, script_path], check=True)
-        logger.info(f"✔ Completed: {script_name}")
+        # orchestrator-side view: includes interpreter start-up and imports
+        with utils_metrics.stage(f"pipeline:{script_name}"):
+            subprocess.run([sys.executable, script_path], check=True, timeout=timeout)
+        logger.info(f"✔ Completed: {script_name} ({time.monotonic() - started:.1f}s)")
+        return True
+
+    except subprocess.TimeoutExpired:
+        logger.error(f"❌ Timeout: {script_name} exceeded {timeout}s and was killed")
+        return False
 
     except subprocess.CalledProcessError as e:
         logger.error(f"❌ Error in script: {script_name}")
         logger.error(e)
-        sys.exit(1)
+        return False
 
     except Exception as e:
         logger.error(f"❌ Unexpected error in {script_name}: {e}")
-        sys.exit(1)
+        return False
 
 
 # =====================================================
-# 4. PIPELINE EXECUTION ORDER
+# 6. IN-PROCESS STAGE RUNNER
+# Tables are handed between stages in memory; CSV files
+# are only written as checkpoints, off the critical path.
+# =====================================================
+_import_lock = threading.Lock()
+
+
+def load_stage(script_name):
+    """Import a stage script as a module (file names start with a digit)."""
+    module_name = "stage_" + os.path.splitext(script_name)[0]
+    with _import_lock:
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        if SCRIPTS_DIR not in sys.path:
+            sys.path.insert(0, SCRIPTS_DIR)
+        spec = importlib.util.spec_from_file_location(
+            module_name, os.path.join(SCRIPTS_DIR, script_name)
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[module_name] = module
+        return module
+
+
+def run_in_process(script_name, tables, timeout=DEFAULT_STAGE_TIMEOUT):
+    """
+    Runs stage.run_stage(tables). Returns the produced tables, or None on
+    failure or timeout.
+
+    The stage runs on a daemon thread: a thread cannot be killed, so one that
+    exceeds timeout is abandoned, which fails the run without keeping the
+    process alive.
+    """
+    logger.info(f"▶ Running in-process: {script_name}")
+    started = time.monotonic()
+    outcome = {}
+
+    def target():
+        try:
+            outcome["produced"] = load_stage(script_name).run_stage(tables) or {}
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=target, name=f"stage-{script_name}", daemon=True)
+    worker.start()
+    worker.join(timeout)
+
+    if worker.is_alive():
+        logger.error(f"❌ Timeout: {script_name} exceeded {timeout}s and was abandoned")
+        return None
+    if "produced" not in outcome:
+        logger.error(f"❌ Error in stage: {script_name}: {outcome.get('error')}")
+        return None
+    logger.info(f"✔ Completed: {script_name} ({time.monotonic() - started:.1f}s)")
+    return outcome["produced"]
+
+
+def write_checkpoint(script_name, produced):
+    from utils_tables import write_tables
+
+    started = time.monotonic()
+    with utils_metrics.stage(f"checkpoint:{script_name}"):
+        write_tables(produced)
+    # e.g. CDC consumers record their snapshot only once their outputs are on disk
+    hook = getattr(load_stage(script_name), "checkpoint_written", None)
+    if hook:
+        hook()
+    logger.info(f"💾 Checkpoint written: {script_name} ({time.monotonic() - started:.1f}s)")
+
+
+# =====================================================
+# 7. DAG SCHEDULER
+# =====================================================
+def run_dag(stages, max_parallel=MAX_PARALLEL_STAGES, forced=None, use_cache=True,
+            in_process=False):
+    """
+    Run stages as soon as their dependencies succeed.
+
+    A stage whose fingerprint matches the last successful run (and whose
+    outputs are untouched) is skipped unless it is in forced. On the first
+    failure no new stage is started; stages already running are allowed to
+    finish before the pipeline exits. Returns the list of failed stage names.
+
+    With in_process, stages marked in_process run inside this process and
+    receive upstream tables in memory; their CSV checkpoints are written in
+    the background and fingerprints are recorded once those are on disk.
+    """
+    order = check_graph(stages)
+    by_name = {s["script"]: s for s in stages}
+    forced = set(forced or ())
+    state = load_state() if use_cache else {}
+
+    pending = dict(by_name)
+    done, failed = set(), []
+    fingerprints = {}
+    running = {}
+
+    tables = {}         # in-memory tables produced during this run
+    in_memory = set()   # stages that ran in-process (checkpoints may be in flight)
+    checkpoints = {}    # checkpoint future -> stage
+
+    def record(name):
+        state[name] = {
+            "fingerprint": fingerprints[name],
+            "outputs": {path: file_hash(path) for path in by_name[name]["outputs"]},
+            "completed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        if use_cache:
+            save_state(state)
+
+    def flush_checkpoints():
+        for future, name in list(checkpoints.items()):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"❌ Checkpoint failed for {name}: {e}")
+                failed.append(name)
+            del checkpoints[future]
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool, \
+            ThreadPoolExecutor(max_workers=1) as writer:
+        while pending or running:
+            if not failed:
+                ready = [
+                    name for name, stage in pending.items()
+                    if set(stage["deps"]) <= done
+                ]
+                for name in ready:
+                    stage = pending.pop(name)
+                    runs_in_process = in_process and stage.get("in_process", False)
+
+                    if in_memory & set(stage["deps"]):
+                        # inputs are still in memory, not final on disk: fingerprint later
+                        fingerprints[name] = None
+                    else:
+                        fingerprints[name] = stage_fingerprint(stage, fingerprints)
+                        if use_cache and name not in forced and is_up_to_date(stage, fingerprints[name], state):
+                            logger.info(f"⏭ Skipped (unchanged): {name}")
+                            done.add(name)
+                            continue
+
+                    timeout = stage.get("timeout", DEFAULT_STAGE_TIMEOUT)
+                    if runs_in_process:
+                        running[pool.submit(run_in_process, name, dict(tables), timeout)] = name
+                    else:
+                        # a subprocess reads upstream tables from disk
+                        flush_checkpoints()
+                        running[pool.submit(run_script, name, timeout)] = name
+
+                # skipped stages may have unblocked others
+                if any(set(s["deps"]) <= done for s in pending.values()):
+                    continue
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                result = future.result()
+                if isinstance(result, dict):
+                    done.add(name)
+                    in_memory.add(name)
+                    tables.update(result)
+                    if result:
+                        checkpoints[writer.submit(write_checkpoint, name, result)] = name
+                elif result:
+                    done.add(name)
+                    if fingerprints[name] is not None:
+                        record(name)
+                else:
+                    state.pop(name, None)
+                    failed.append(name)
+                    if running:
+                        logger.warning(
+                            "Fail-fast: waiting for in-flight stage(s) to finish: %s",
+                            ", ".join(running.values())
+                        )
+
+        flush_checkpoints()
+
+    # checkpoints are on disk now: fingerprint in-memory stages in graph order
+    for name in order:
+        if name not in done or name in failed:
+            continue
+        if fingerprints.get(name) is None:
+            fingerprints[name] = stage_fingerprint(by_name[name], fingerprints)
+            record(name)
+        elif name in in_memory:
+            record(name)
+
+    if failed and pending:
+        logger.warning("Skipped stages: %s", ", ".join(pending))
+    return failed
+
+
+# =====================================================
+# 8. PIPELINE EXECUTION
 # =====================================================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recipe analytics pipeline")
+    parser.add_argument("--max-parallel", type=int, default=MAX_PARALLEL_STAGES,
+                        help="maximum number of stages running at once")
+    parser.add_argument("--force", action="store_true",
+                        help="rerun every stage, ignoring recorded fingerprints")
+    parser.add_argument("--from-stage", metavar="SCRIPT",
+                        help="rerun this stage and everything downstream of it")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run stages inside this process and hand tables over in memory")
+    parser.add_argument("--streaming", action="store_true",
+                        help="stream Firestore documents straight into aggregates (no CSV stages)")
+    args = parser.parse_args()
+
+    stages = STREAM_STAGES if args.streaming else STAGES
+    forced = set()
+    if args.force:
+        forced = {s["script"] for s in stages}
+    elif args.from_stage:
+        if args.from_stage not in {s["script"] for s in stages}:
+            parser.error(f"unknown stage: {args.from_stage}")
+        forced = downstream_of(stages, args.from_stage)
+    if forced:
+        # a forced CDC consumer (transform) cleans every recipe again instead
+        # of trusting its previous outputs (cdc.py)
+        os.environ["CDC_FULL_REBUILD"] = "1"
+
+    # one run id for every stage (subprocesses inherit it) -> one metrics report
+    os.environ.setdefault("PIPELINE_RUN_ID", utils_metrics.new_run_id())
+
     logger.info("\n============= RECIPE ANALYTICS PIPELINE =============")
+    logger.info(f"Run id: {os.environ['PIPELINE_RUN_ID']}")
+    started = time.monotonic()
 
-    run_script("1_setup_firestore.py")
-    run_script("2_export_firestore.py")
-    run_script("3_transform_to_csv.py")
-    run_script("4_validate_csv.py")
-    run_script("5_analytics.py")
+    if args.in_process:
+        # figures are rendered from worker threads
+        os.environ.setdefault("MPLBACKEND", "Agg")
+
+    failed = run_dag(stages, args.max_parallel, forced=forced, in_process=args.in_process)
+    utils_metrics.write_run_report(os.environ["PIPELINE_RUN_ID"])
+    if failed:
+        logger.error(f"❌ PIPELINE FAILED in: {', '.join(failed)}")
+        sys.exit(1)
 
     logger.info("=====================================================")
-    logger.info("🎉 PIPELINE COMPLETED SUCCESSFULLY!")
+    logger.info(f"🎉 PIPELINE COMPLETED SUCCESSFULLY in {time.monotonic() - started:.1f}s!")
     logger.info("📦 Check folders:")
     logger.info("   - exports/   (Raw Firebase JSON)")
     logger.info("   - outputs/   (CSV files)")
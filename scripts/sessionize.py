@@ -0,0 +1,167 @@
+import os
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from utils_tables import get_table, interaction_window, warn_compacted_ignored
+
+# =====================================================
+# LOGGING
+# =====================================================
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+ANALYSIS_FOLDER = "analysis"
+
+DEFAULT_GAP_MINUTES = 30
+FUNNEL_STEPS = ["view", "like", "cook_attempt"]
+FUNNEL_COUNTS = [
+    "sessions_viewed", "view_to_like", "like_to_cook", "view_to_cook",
+]
+SESSION_COUNTS = ["sessions", "events", "duration_seconds"]
+
+
+# =====================================================
+# SESSIONIZATION
+# =====================================================
+def assign_sessions(interactions: pd.DataFrame, gap_minutes=DEFAULT_GAP_MINUTES) -> pd.DataFrame:
+    """
+    Sort by (user_id, timestamp) once and number sessions per partition.
+
+    A new session starts when the user changes or when the gap since the
+    user's previous event exceeds gap_minutes (vectorized diff + cumsum).
+    """
+    events = interactions.dropna(subset=["user_id", "timestamp"]).copy()
+    events["timestamp"] = pd.to_datetime(events["timestamp"], errors="coerce")
+    events = events.dropna(subset=["timestamp"])
+    events = events.sort_values(["user_id", "timestamp"], kind="stable")
+
+    new_user = events["user_id"].ne(events["user_id"].shift())
+    gap = events["timestamp"].diff() > pd.Timedelta(minutes=gap_minutes)
+    events["session_seq"] = (new_user | gap).cumsum()
+    return events
+
+
+def funnel_counts(events: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-recipe view -> like -> cook_attempt conversions within sessions.
+
+    For every (session, recipe) the first time of each step is taken; a
+    conversion counts when the later step happens at or after the earlier.
+    """
+    steps = events[events["type"].isin(FUNNEL_STEPS)]
+    first = (
+        steps.groupby(["session_seq", "recipe_id", "type"])["timestamp"].min()
+        .unstack("type")
+        .reindex(columns=FUNNEL_STEPS)
+    )
+
+    viewed = first["view"].notna()
+    liked = viewed & (first["like"] >= first["view"])
+    cooked_after_like = liked & (first["cook_attempt"] >= first["like"])
+    cooked_after_view = viewed & (first["cook_attempt"] >= first["view"])
+
+    flags = pd.DataFrame({
+        "sessions_viewed": viewed,
+        "view_to_like": liked,
+        "like_to_cook": cooked_after_like,
+        "view_to_cook": cooked_after_view,
+    }).astype(int)
+    return flags.groupby(level="recipe_id").sum()
+
+
+def session_counts(events: pd.DataFrame) -> pd.Series:
+    grouped = events.groupby("session_seq")["timestamp"]
+    duration = (grouped.max() - grouped.min()).dt.total_seconds()
+    return pd.Series({
+        "sessions": float(grouped.ngroups),
+        "events": float(len(events)),
+        "duration_seconds": float(duration.sum()),
+    })
+
+
+def process_partition(args):
+    """Worker entry point: sessionize one user-hash partition."""
+    partition, gap_minutes = args
+    events = assign_sessions(partition, gap_minutes)
+    return funnel_counts(events), session_counts(events)
+
+
+# =====================================================
+# PARTITIONED DRIVER
+# =====================================================
+def partition_by_user(interactions: pd.DataFrame, partitions: int):
+    """Split interactions into user-hash partitions (a user never spans two)."""
+    bucket = pd.util.hash_pandas_object(interactions["user_id"], index=False) % partitions
+    return [part for _, part in interactions.groupby(bucket.to_numpy(), sort=False)]
+
+
+def run_sessionization(gap_minutes=DEFAULT_GAP_MINUTES, partitions=None):
+    os.makedirs(ANALYSIS_FOLDER, exist_ok=True)
+    partitions = partitions or os.cpu_count() or 1
+
+    logger.info("Loading cleaned interactions...")
+    since, until = interaction_window()
+    interactions = get_table(None, "interactions_clean", since, until)
+    warn_compacted_ignored("sessionize", since, until)
+
+    parts = partition_by_user(interactions, partitions)
+    logger.info("Sessionizing %d events in %d user partitions (gap = %d min)...",
+                len(interactions), len(parts), gap_minutes)
+
+    if len(parts) > 1:
+        with ProcessPoolExecutor(max_workers=min(partitions, len(parts))) as pool:
+            results = list(pool.map(process_partition, [(p, gap_minutes) for p in parts]))
+    else:
+        results = [process_partition((p, gap_minutes)) for p in parts]
+
+    # ---------------------------- MERGE PARTIALS ----------------------------
+    if results:
+        funnel = pd.concat([r[0] for r in results]).groupby(level="recipe_id").sum()
+        totals = sum((r[1] for r in results), pd.Series(0.0, index=SESSION_COUNTS))
+    else:
+        funnel = pd.DataFrame(columns=FUNNEL_COUNTS)
+        totals = pd.Series(0.0, index=SESSION_COUNTS)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        funnel["view_to_like_rate"] = funnel["view_to_like"] / funnel["sessions_viewed"]
+        funnel["like_to_cook_rate"] = funnel["like_to_cook"] / funnel["view_to_like"]
+        funnel["view_to_cook_rate"] = funnel["view_to_cook"] / funnel["sessions_viewed"]
+
+    funnel = funnel.sort_values("sessions_viewed", ascending=False)
+    funnel.to_csv(os.path.join(ANALYSIS_FOLDER, "recipe_funnel.csv"))
+
+    sessions = totals["sessions"]
+    pd.DataFrame([{
+        "gap_minutes": gap_minutes,
+        "sessions": int(sessions),
+        "events": int(totals["events"]),
+        "avg_events_per_session": totals["events"] / sessions if sessions else float("nan"),
+        "avg_session_seconds": totals["duration_seconds"] / sessions if sessions else float("nan"),
+        "overall_view_to_like_rate": funnel["view_to_like"].sum() / max(funnel["sessions_viewed"].sum(), 1),
+        "overall_view_to_cook_rate": funnel["view_to_cook"].sum() / max(funnel["sessions_viewed"].sum(), 1),
+    }]).to_csv(os.path.join(ANALYSIS_FOLDER, "session_summary.csv"), index=False)
+
+    logger.info("Sessionization complete: %d sessions.", int(sessions))
+
+
+# =====================================================
+# MAIN
+# =====================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sessionize interactions and compute funnels")
+    parser.add_argument("--gap-minutes", type=int, default=DEFAULT_GAP_MINUTES,
+                        help="inactivity gap that starts a new session")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="user-hash partitions processed in parallel (default: CPU count)")
+    args = parser.parse_args()
+
+    try:
+        run_sessionization(args.gap_minutes, args.partitions)
+    except Exception as e:
+        logger.error("Sessionization failed: %s", e)
+        raise
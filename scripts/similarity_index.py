@@ -0,0 +1,376 @@
+import os
+import json
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from utils_retry import retry
+
+# =====================================================
+# LOGGING
+# =====================================================
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+CLEAN_FOLDER = os.path.join("outputs", "clean")
+INDEX_FOLDER = os.path.join("outputs", "index", "similarity")
+ANALYSIS_FOLDER = "analysis"
+
+NUM_PERM = 128          # MinHash permutations per signature
+NUM_BANDS = 32          # LSH bands (NUM_PERM / NUM_BANDS rows per band)
+SEED = 42
+BATCH_ROWS = 50_000     # ingredient rows hashed per vectorized batch
+MAX_BUCKET = 200        # larger LSH buckets are skipped by the batch job
+DEFAULT_TOP_K = 10
+
+_PRIME = np.uint64((1 << 31) - 1)
+_BAND_MULT = np.uint64(0x9E3779B97F4A7C15)
+
+
+# =====================================================
+# SAFE CSV READ WITH RETRY
+# =====================================================
+@retry(Exception, tries=3, delay=1, backoff=2)
+def safe_read_csv(path: str) -> pd.DataFrame:
+    return pd.read_csv(path)
+
+
+# =====================================================
+# MINHASH SIGNATURES
+# =====================================================
+def _hash_params(num_perm=NUM_PERM, seed=SEED):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def _token_hashes(names: pd.Series) -> np.ndarray:
+    """Stable 32-bit token per normalized ingredient name (hashed once per distinct name)."""
+    codes, uniques = pd.factorize(names)
+    normalized = pd.Series(uniques).astype(str).str.strip().str.lower().to_numpy(dtype=object)
+    hashed = pd.util.hash_array(normalized) & np.uint64(0xFFFFFFFF)
+    return hashed[codes]
+
+
+def compute_signatures(ingredients: pd.DataFrame, num_perm=NUM_PERM, seed=SEED):
+    """
+    MinHash signature per recipe over its set of ingredient names.
+
+    Returns (recipe_ids, signatures) with signatures as uint32 (n, num_perm).
+    Hashing is done in vectorized batches of whole recipes and reduced with
+    np.minimum.reduceat, so no Python loop runs per recipe.
+    """
+    rows = ingredients[["recipe_id", "ingredient_name"]].dropna().copy()
+    rows["token"] = _token_hashes(rows["ingredient_name"])
+    rows = rows.drop_duplicates(["recipe_id", "token"]).sort_values("recipe_id", kind="stable")
+    if rows.empty:
+        return np.empty(0, dtype=object), np.empty((0, num_perm), dtype=np.uint32)
+
+    recipe_codes, recipe_ids = pd.factorize(rows["recipe_id"], sort=False)
+    tokens = rows["token"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, recipe_codes[1:] != recipe_codes[:-1]])
+    ends = np.r_[starts[1:], len(tokens)]
+
+    a, b = _hash_params(num_perm, seed)
+    signatures = np.empty((len(starts), num_perm), dtype=np.uint32)
+
+    first = 0
+    while first < len(starts):
+        # grow the batch by whole recipes up to BATCH_ROWS ingredient rows
+        last = int(np.searchsorted(ends, starts[first] + BATCH_ROWS, side="right"))
+        last = max(last, first + 1)
+        lo, hi = starts[first], ends[last - 1]
+
+        hashed = (tokens[lo:hi, None] * a[None, :] + b[None, :]) % _PRIME
+        signatures[first:last] = np.minimum.reduceat(hashed, starts[first:last] - lo, axis=0)
+        first = last
+
+    return np.asarray(recipe_ids, dtype=object), signatures
+
+
+def band_keys(signatures: np.ndarray, num_bands=NUM_BANDS) -> np.ndarray:
+    """Fold each band of a signature into one uint64 key, shape (bands, n)."""
+    n, num_perm = signatures.shape
+    rows_per_band = num_perm // num_bands
+    sig = signatures.astype(np.uint64)
+
+    keys = np.zeros((num_bands, n), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for band in range(num_bands):
+            block = sig[:, band * rows_per_band:(band + 1) * rows_per_band]
+            key = np.full(n, np.uint64(band), dtype=np.uint64)
+            for col in range(rows_per_band):
+                key = key * _BAND_MULT + block[:, col]
+            keys[band] = key
+    return keys
+
+
+# =====================================================
+# LSH INDEX
+# =====================================================
+class MinHashIndex:
+    """
+    MinHash signatures plus LSH band tables.
+
+    Band tables are stored as per-band sorted key arrays so that lookups
+    are np.searchsorted calls and the whole index persists as .npy files
+    that can be memory-mapped. Updates merge the changed recipes' keys into
+    the sorted bands instead of sorting them again.
+    """
+
+    def __init__(self, recipe_ids, signatures, num_bands=NUM_BANDS):
+        self.recipe_ids = np.asarray(recipe_ids, dtype=object)
+        self.signatures = signatures
+        self.num_bands = num_bands
+        self._position = {rid: i for i, rid in enumerate(self.recipe_ids)}
+        self._build_bands()
+
+    def _build_bands(self):
+        keys = band_keys(self.signatures, self.num_bands)
+        order = np.argsort(keys, axis=1, kind="stable")
+        self.band_order = order
+        self.band_sorted_keys = np.take_along_axis(keys, order, axis=1)
+
+    def _merge_bands(self, positions: np.ndarray):
+        """
+        Re-key the rows at positions (replaced or appended) in the sorted band
+        tables: their old entries are dropped and the new keys, sorted among
+        themselves, are inserted at their searchsorted place band by band.
+        Within one key the rows may end up in another order than a full build
+        gives, which no lookup depends on.
+        """
+        keep = ~np.isin(self.band_order, positions)
+        order = np.asarray(self.band_order)[keep].reshape(self.num_bands, -1)
+        keys = np.asarray(self.band_sorted_keys)[keep].reshape(self.num_bands, -1)
+
+        new_keys = band_keys(self.signatures[positions], self.num_bands)
+        new_order = np.argsort(new_keys, axis=1, kind="stable")
+        new_keys = np.take_along_axis(new_keys, new_order, axis=1)
+        new_positions = positions[new_order]
+
+        width = order.shape[1] + len(positions)
+        self.band_order = np.empty((self.num_bands, width), dtype=np.int64)
+        self.band_sorted_keys = np.empty((self.num_bands, width), dtype=np.uint64)
+        for band in range(self.num_bands):
+            at = np.searchsorted(keys[band], new_keys[band], side="right")
+            self.band_sorted_keys[band] = np.insert(keys[band], at, new_keys[band])
+            self.band_order[band] = np.insert(order[band], at, new_positions[band])
+
+    # ---------------------------- BUILD / UPDATE ----------------------------
+    @classmethod
+    def build(cls, ingredients: pd.DataFrame):
+        recipe_ids, signatures = compute_signatures(ingredients)
+        return cls(recipe_ids, signatures)
+
+    def add(self, ingredients: pd.DataFrame):
+        """Insert new recipes or replace the signatures of existing ones."""
+        new_ids, new_sigs = compute_signatures(ingredients)
+        if len(new_ids) == 0:
+            return self
+
+        existing = np.array([self._position.get(rid, -1) for rid in new_ids], dtype=np.int64)
+        is_update = existing >= 0
+        n_before = len(self.recipe_ids)
+
+        signatures = np.array(self.signatures)
+        signatures[existing[is_update]] = new_sigs[is_update]
+        self.signatures = np.concatenate([signatures, new_sigs[~is_update]])
+        self.recipe_ids = np.concatenate([self.recipe_ids, new_ids[~is_update]])
+
+        self._position = {rid: i for i, rid in enumerate(self.recipe_ids)}
+        self._merge_bands(np.r_[existing[is_update], np.arange(n_before, len(self.recipe_ids))])
+        logger.info(
+            "Similarity index updated: %d added, %d replaced.",
+            int((~is_update).sum()), int(is_update.sum())
+        )
+        return self
+
+    # ---------------------------- PERSISTENCE ----------------------------
+    @staticmethod
+    def _replace_file(path, write):
+        """Write through a temporary file, then swap it in: readers that
+        memory-mapped the old file keep a consistent copy."""
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+
+    def save(self, folder=INDEX_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+        for name, array in (("signatures", self.signatures), ("band_order", self.band_order),
+                            ("band_sorted_keys", self.band_sorted_keys)):
+            self._replace_file(os.path.join(folder, f"{name}.npy"),
+                               lambda f, array=array: np.save(f, np.asarray(array)))
+        meta = {
+            "num_perm": int(self.signatures.shape[1]),
+            "num_bands": self.num_bands,
+            "seed": SEED,
+            "recipe_ids": self.recipe_ids.tolist(),
+        }
+        self._replace_file(os.path.join(folder, "meta.json"),
+                           lambda f: f.write(json.dumps(meta).encode("utf-8")))
+        logger.info("Similarity index saved to %s", folder)
+
+    @classmethod
+    def load(cls, folder=INDEX_FOLDER):
+        with open(os.path.join(folder, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        index = cls.__new__(cls)
+        index.recipe_ids = np.asarray(meta["recipe_ids"], dtype=object)
+        index.num_bands = meta["num_bands"]
+        index.signatures = np.load(os.path.join(folder, "signatures.npy"), mmap_mode="r")
+        index.band_order = np.load(os.path.join(folder, "band_order.npy"), mmap_mode="r")
+        index.band_sorted_keys = np.load(os.path.join(folder, "band_sorted_keys.npy"), mmap_mode="r")
+        index._position = {rid: i for i, rid in enumerate(index.recipe_ids)}
+        return index
+
+    # ---------------------------- QUERY ----------------------------
+    def _candidates(self, signature: np.ndarray) -> np.ndarray:
+        keys = band_keys(signature[None, :], self.num_bands)[:, 0]
+        found = []
+        for band, key in enumerate(keys):
+            sorted_keys = self.band_sorted_keys[band]
+            lo = np.searchsorted(sorted_keys, key, side="left")
+            hi = np.searchsorted(sorted_keys, key, side="right")
+            if hi > lo:
+                found.append(self.band_order[band, lo:hi])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def query(self, recipe_id, k=DEFAULT_TOP_K) -> pd.DataFrame:
+        """Top-k recipes by estimated Jaccard similarity of ingredient sets."""
+        pos = self._position.get(recipe_id)
+        if pos is None:
+            raise KeyError(f"Recipe '{recipe_id}' is not in the similarity index")
+
+        signature = np.asarray(self.signatures[pos])
+        candidates = self._candidates(signature)
+        candidates = candidates[candidates != pos]
+
+        similarity = (np.asarray(self.signatures[candidates]) == signature).mean(axis=1)
+        if len(candidates) > k:
+            top = np.argpartition(-similarity, k)[:k]
+            candidates, similarity = candidates[top], similarity[top]
+        order = np.argsort(-similarity, kind="stable")
+
+        return pd.DataFrame({
+            "similar_recipe_id": self.recipe_ids[candidates[order]],
+            "jaccard_estimate": similarity[order],
+        })
+
+    # ---------------------------- BATCH ----------------------------
+    def candidate_pairs(self, max_bucket=MAX_BUCKET) -> np.ndarray:
+        """
+        All (i, j) row pairs sharing at least one LSH bucket, both directions.
+
+        Pairs are produced by comparing each sorted band with itself shifted
+        by d = 1..max_bucket-1, which keeps the work vectorized.
+        """
+        n = len(self.recipe_ids)
+        codes = []
+        for band in range(self.num_bands):
+            keys = np.asarray(self.band_sorted_keys[band])
+            order = np.asarray(self.band_order[band])
+
+            # drop oversized buckets so hot keys cannot explode the pair count
+            run_start = np.r_[True, keys[1:] != keys[:-1]]
+            run_id = np.cumsum(run_start) - 1
+            run_size = np.bincount(run_id)
+            small = run_size[run_id] <= max_bucket
+
+            for d in range(1, max_bucket):
+                if d >= len(keys):
+                    break
+                same = (keys[d:] == keys[:-d]) & small[d:]
+                if not same.any():
+                    break
+                left, right = order[:-d][same], order[d:][same]
+                codes.append(left.astype(np.int64) * n + right)
+                codes.append(right.astype(np.int64) * n + left)
+
+        if not codes:
+            return np.empty((0, 2), dtype=np.int64)
+        unique = np.unique(np.concatenate(codes))
+        return np.stack([unique // n, unique % n], axis=1)
+
+    def similar_table(self, k=DEFAULT_TOP_K, chunk=1_000_000) -> pd.DataFrame:
+        pairs = self.candidate_pairs()
+        similarity = np.empty(len(pairs))
+        for lo in range(0, len(pairs), chunk):
+            left = np.asarray(self.signatures[pairs[lo:lo + chunk, 0]])
+            right = np.asarray(self.signatures[pairs[lo:lo + chunk, 1]])
+            similarity[lo:lo + chunk] = (left == right).mean(axis=1)
+
+        table = pd.DataFrame({
+            "row": pairs[:, 0],
+            "other": pairs[:, 1],
+            "jaccard_estimate": similarity,
+        }).sort_values(["row", "jaccard_estimate"], ascending=[True, False], kind="stable")
+        table["rank"] = table.groupby("row").cumcount() + 1
+        table = table[table["rank"] <= k]
+
+        return pd.DataFrame({
+            "recipe_id": self.recipe_ids[table["row"].to_numpy()],
+            "similar_recipe_id": self.recipe_ids[table["other"].to_numpy()],
+            "rank": table["rank"].to_numpy(),
+            "jaccard_estimate": table["jaccard_estimate"].to_numpy(),
+        })
+
+
+# =====================================================
+# JOBS
+# =====================================================
+def build_index():
+    ingredients = safe_read_csv(os.path.join(CLEAN_FOLDER, "ingredients_clean.csv"))
+    logger.info("Computing MinHash signatures for %d ingredient rows...", len(ingredients))
+    index = MinHashIndex.build(ingredients)
+    index.save()
+    return index
+
+
+def update_index(ingredients_path: str):
+    """Add or replace recipes from an ingredients CSV in the persisted index."""
+    index = MinHashIndex.load()
+    index.add(safe_read_csv(ingredients_path))
+    index.save()
+    return index
+
+
+def write_similar_recipes(index: MinHashIndex, k=DEFAULT_TOP_K):
+    os.makedirs(ANALYSIS_FOLDER, exist_ok=True)
+    table = index.similar_table(k)
+    path = os.path.join(ANALYSIS_FOLDER, "similar_recipes.csv")
+    table.to_csv(path, index=False)
+    logger.info("Similar-recipes table written to %s (%d rows)", path, len(table))
+
+
+# =====================================================
+# MAIN
+# =====================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MinHash/LSH similar-recipe index")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("build", help="build the index and the similar-recipes table")
+    upd = sub.add_parser("update", help="add/replace recipes from an ingredients CSV")
+    upd.add_argument("ingredients_csv")
+    qry = sub.add_parser("query", help="top-k similar recipes for one recipe_id")
+    qry.add_argument("recipe_id")
+    qry.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "query":
+            print(MinHashIndex.load().query(args.recipe_id, args.k).to_string(index=False))
+        elif args.command == "update":
+            write_similar_recipes(update_index(args.ingredients_csv))
+        else:
+            write_similar_recipes(build_index())
+    except Exception as e:
+        logger.error("Similarity index job failed: %s", e)
+        raise
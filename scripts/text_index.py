@@ -0,0 +1,298 @@
+import os
+import re
+import math
+import pickle
+import hashlib
+import logging
+import argparse
+from collections import Counter, defaultdict
+import pandas as pd
+from utils_retry import retry
+from utils_steps import STEP_TEXT_CLEAN_FILE, decode_step_text
+from cdc import incremental_changes, changed_ids, mark_processed
+
+# =====================================================
+# LOGGING
+# =====================================================
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+CLEAN_FOLDER = os.path.join("outputs", "clean")
+INDEX_PATH = os.path.join("outputs", "index", "text", "text_index.pkl")
+CDC_CONSUMER = "text_index"
+CDC_SOURCES = ("text_index.py", "utils_steps.py", "cdc.py")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_TOP_K = 10
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_PHRASE_RE = re.compile(r'"([^"]+)"')
+
+
+# =====================================================
+# SAFE CSV READ WITH RETRY
+# =====================================================
+@retry(Exception, tries=3, delay=1, backoff=2)
+def safe_read_csv(path: str) -> pd.DataFrame:
+    return pd.read_csv(path)
+
+
+def tokenize(text) -> list:
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+# =====================================================
+# DOCUMENTS
+# =====================================================
+def build_documents(recipes: pd.DataFrame, steps: pd.DataFrame, step_texts=None) -> pd.Series:
+    """
+    One text document per recipe: title + description + ordered step text.
+
+    steps may be dictionary-encoded (step_text_id + step_texts table).
+    """
+    ordered = steps.sort_values(["recipe_id", "order"])
+    step_text = (
+        decode_step_text(ordered, step_texts)
+        .astype(str)
+        .groupby(ordered["recipe_id"])
+        .agg(" ".join)
+    )
+    docs = (
+        recipes["title"].fillna("").astype(str) + " "
+        + recipes["description"].fillna("").astype(str) + " "
+        + recipes["id"].map(step_text).fillna("")
+    )
+    docs.index = recipes["id"]
+    return docs
+
+
+# =====================================================
+# FULL-TEXT INDEX
+# =====================================================
+class TextIndex:
+    """
+    BM25-ranked inverted index with positional postings.
+
+    postings: term -> {recipe_id: [positions]}
+    docs:     recipe_id -> (content hash, token count, distinct terms)
+
+    The forward entry in docs lets a changed recipe be removed from the
+    postings without rescanning the index.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.docs = {}
+        self.total_length = 0
+
+    # ---------------------------- MAINTENANCE ----------------------------
+    def _remove(self, recipe_id):
+        _, length, terms = self.docs.pop(recipe_id)
+        self.total_length -= length
+        for term in terms:
+            plist = self.postings.get(term)
+            if plist is None:
+                continue
+            plist.pop(recipe_id, None)
+            if not plist:
+                del self.postings[term]
+
+    def _add(self, recipe_id, text, content_hash):
+        tokens = tokenize(text)
+        positions = defaultdict(list)
+        for pos, token in enumerate(tokens):
+            positions[token].append(pos)
+        for term, plist in positions.items():
+            self.postings[term][recipe_id] = plist
+        self.docs[recipe_id] = (content_hash, len(tokens), tuple(positions))
+        self.total_length += len(tokens)
+
+    def update(self, documents: pd.Series, drop_missing=True):
+        """
+        Bring the index in line with documents (recipe_id -> text).
+
+        Only recipes whose content hash changed are re-tokenized. With
+        drop_missing, recipes absent from documents are removed.
+        """
+        added = changed = removed = 0
+        for recipe_id, text in documents.items():
+            content_hash = hashlib.md5(str(text).encode("utf-8")).hexdigest()
+            current = self.docs.get(recipe_id)
+            if current is not None and current[0] == content_hash:
+                continue
+            if current is not None:
+                self._remove(recipe_id)
+                changed += 1
+            else:
+                added += 1
+            self._add(recipe_id, text, content_hash)
+
+        if drop_missing:
+            for recipe_id in set(self.docs) - set(documents.index):
+                self._remove(recipe_id)
+                removed += 1
+
+        logger.info("Text index updated: %d added, %d changed, %d removed.", added, changed, removed)
+        return self
+
+    def remove(self, recipe_ids):
+        for recipe_id in recipe_ids:
+            if recipe_id in self.docs:
+                self._remove(recipe_id)
+        return self
+
+    # ---------------------------- PERSISTENCE ----------------------------
+    def save(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                {"postings": dict(self.postings), "docs": self.docs, "total_length": self.total_length},
+                f, protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        index = cls()
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            index.postings = defaultdict(dict, state["postings"])
+            index.docs = state["docs"]
+            index.total_length = state["total_length"]
+        return index
+
+    # ---------------------------- QUERY ----------------------------
+    def _phrase_docs(self, phrase_terms) -> set:
+        """Recipes containing the terms at consecutive positions."""
+        if not phrase_terms or any(t not in self.postings for t in phrase_terms):
+            return set()
+        candidates = set(self.postings[phrase_terms[0]])
+        for term in phrase_terms[1:]:
+            candidates &= set(self.postings[term])
+
+        matches = set()
+        for rid in candidates:
+            starts = set(self.postings[phrase_terms[0]][rid])
+            for offset, term in enumerate(phrase_terms[1:], start=1):
+                starts &= {p - offset for p in self.postings[term][rid]}
+                if not starts:
+                    break
+            if starts:
+                matches.add(rid)
+        return matches
+
+    def search(self, query: str, k=DEFAULT_TOP_K) -> list:
+        """
+        BM25-ranked (recipe_id, score) pairs.
+
+        Quoted parts of the query ("simmer for 10 minutes") must match as
+        phrases; all terms contribute to the score.
+        """
+        n_docs = len(self.docs)
+        if n_docs == 0:
+            return []
+        avgdl = self.total_length / n_docs
+
+        phrases = [tokenize(p) for p in _PHRASE_RE.findall(query)]
+        terms = tokenize(query)
+
+        scores = Counter()
+        for term in set(terms):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for rid, positions in plist.items():
+                tf = len(positions)
+                dl = self.docs[rid][1]
+                scores[rid] += idf * tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl)
+                )
+
+        if phrases:
+            allowed = set.intersection(*(self._phrase_docs(p) for p in phrases))
+            scores = Counter({rid: s for rid, s in scores.items() if rid in allowed})
+
+        return scores.most_common(k)
+
+    def term_frequencies(self, words) -> pd.DataFrame:
+        """recipe_id x word matrix of term counts (0 where absent)."""
+        data = {}
+        for word in words:
+            term = word.lower()
+            data[word] = {rid: len(p) for rid, p in self.postings.get(term, {}).items()}
+        frame = pd.DataFrame(data, index=list(self.docs), columns=list(words))
+        return frame.fillna(0).astype(int)
+
+
+# =====================================================
+# JOBS
+# =====================================================
+def index_for(recipes: pd.DataFrame, steps: pd.DataFrame, step_texts=None,
+              path=INDEX_PATH) -> TextIndex:
+    """
+    The persisted index brought in line with exactly these tables, in memory.
+
+    Every document is compared by hash, so only changed recipes are
+    re-tokenized; nothing is saved and no CDC state is touched.
+    """
+    return TextIndex.load(path).update(build_documents(recipes, steps, step_texts))
+
+
+def refresh_index(recipes: pd.DataFrame, steps: pd.DataFrame, step_texts=None,
+                  path=INDEX_PATH) -> TextIndex:
+    """
+    Load the persisted index, re-index changed recipes and save it.
+
+    When the index is in sync with the base of the current CDC change set
+    (cdc.py) only the recipes in that set are rebuilt and hashed; otherwise
+    every recipe's document is built and compared by hash.
+    """
+    changes = incremental_changes(CDC_CONSUMER, CDC_SOURCES) if os.path.exists(path) else None
+    index = TextIndex.load(path)
+    if changes is None:
+        index.update(build_documents(recipes, steps, step_texts))
+    else:
+        changed = changed_ids(changes)
+        index.update(
+            build_documents(recipes[recipes["id"].isin(changed)],
+                            steps[steps["recipe_id"].isin(changed)], step_texts),
+            drop_missing=False,
+        )
+        index.remove(changes["delete"])
+    index.save(path)
+    mark_processed(CDC_CONSUMER, CDC_SOURCES)
+    return index
+
+
+# =====================================================
+# MAIN
+# =====================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text recipe search index")
+    parser.add_argument("query", nargs="?", help="search query")
+    parser.add_argument("--build", action="store_true", help="(re)build the index")
+    parser.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    args = parser.parse_args()
+
+    try:
+        if args.build or not os.path.exists(INDEX_PATH):
+            index = refresh_index(
+                safe_read_csv(os.path.join(CLEAN_FOLDER, "recipes_clean.csv")),
+                safe_read_csv(os.path.join(CLEAN_FOLDER, "steps_clean.csv")),
+                safe_read_csv(os.path.join(CLEAN_FOLDER, STEP_TEXT_CLEAN_FILE)),
+            )
+        else:
+            index = TextIndex.load()
+        if args.query:
+            for rid, score in index.search(args.query, args.k):
+                print(f"{score:8.4f}  {rid}")
+    except Exception as e:
+        logger.error("Text index job failed: %s", e)
+        raise
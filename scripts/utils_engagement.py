@@ -0,0 +1,24 @@
+import pandas as pd
+
+# =====================================================
+# ENGAGEMENT WEIGHTS
+# engagement_score = views*0.5 + likes*1 + attempts*2
+# Shared by 5_analytics.py and the analytics modules so
+# every score in the pipeline uses the same weighting.
+# =====================================================
+ENGAGEMENT_WEIGHTS = {
+    "view": 0.5,
+    "like": 1.0,
+    "cook_attempt": 2.0,
+}
+
+
+def interaction_weights(interactions: pd.DataFrame) -> pd.Series:
+    """Per-row engagement weight (unknown interaction types weigh 0)."""
+    return interactions["type"].map(ENGAGEMENT_WEIGHTS).fillna(0.0)
+
+
+def engagement_by_recipe(interactions: pd.DataFrame) -> pd.Series:
+    """Total engagement score per recipe_id."""
+    weights = interaction_weights(interactions)
+    return weights.groupby(interactions["recipe_id"]).sum().rename("engagement_score")
@@ -0,0 +1,70 @@
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+from utils_retry import retry
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# LAZY FIRESTORE CLIENT
+# -----------------------------------------------------
+# Importing a stage module must not connect to (or write
+# to) Firestore; the client is created on first use and
+# shared by every caller in the process. firebase_admin
+# itself is only imported at that point.
+#
+# FIRESTORE_BACKEND=local swaps in the offline stand-in
+# from local_firestore.py (see FIRESTORE_LOCAL_* in
+# .env.example).
+# =====================================================
+_db = None
+_db_lock = threading.Lock()
+
+
+@retry(Exception, tries=5, delay=1, backoff=2, deadline=60)
+def init_firestore(service_account_path: str):
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    cred = credentials.Certificate(service_account_path)
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+
+def get_db():
+    """The process-wide Firestore client, connected on first call."""
+    global _db
+    with _db_lock:
+        if _db is None:
+            load_dotenv()
+            backend = os.getenv("FIRESTORE_BACKEND", "firestore").lower()
+            if backend == "local":
+                from local_firestore import LocalFirestore
+
+                _db = LocalFirestore.from_env()
+                logger.info("Using the local Firestore stand-in (%s).",
+                            os.getenv("FIRESTORE_LOCAL_PATH", "local_firestore") or "in memory")
+                return _db
+            if backend != "firestore":
+                raise ValueError(f"Unknown FIRESTORE_BACKEND: {backend}")
+
+            service_account_path = os.getenv("SERVICE_ACCOUNT_PATH")
+            if not service_account_path:
+                raise ValueError("SERVICE_ACCOUNT_PATH missing in .env")
+
+            try:
+                _db = init_firestore(service_account_path)
+                logger.info("Connected to Firestore.")
+            except Exception as e:
+                logger.error("Failed to connect to Firestore: %s", e)
+                raise
+    return _db
+
+
+def set_db(client):
+    """Use client instead of connecting (stand-ins for offline runs and benchmarks)."""
+    global _db
+    with _db_lock:
+        _db = client
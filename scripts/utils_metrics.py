@@ -0,0 +1,302 @@
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource     # not available on Windows
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# RUN METRICS
+# -----------------------------------------------------
+# Every stage wraps its work in stage(), named sub-steps
+# in step(). Each stage writes one JSON file per run to
+# METRICS_FOLDER/<run id>/; write_run_report() merges them
+# into run_<id>.json and compares it with the previous run.
+#
+# The run id comes from PIPELINE_RUN_ID (set by
+# run_pipeline.py for all stages of one run); a script
+# started on its own gets a fresh id and reports itself.
+#
+# CPU time, peak RSS and tracemalloc peaks are process
+# wide, so with stages running in parallel threads
+# (--in-process) they overlap; use --max-parallel 1 for
+# clean attribution.
+# =====================================================
+TIMING_KEYS = ["wall_s", "cpu_s", "peak_rss_mb", "tracemalloc_peak_mb"]
+COUNTERS = [
+    "rows_in", "rows_out", "bytes_read", "bytes_written",
+    "firestore_calls", "firestore_docs", "retries", "retry_giveups", "permanent_errors",
+]
+
+REGRESSION_MIN_SECONDS = 0.25   # ignore wall-time changes below this (noise)
+
+_local = threading.local()
+_standalone_run_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+
+def metrics_folder() -> str:
+    return os.getenv("METRICS_FOLDER", os.path.join("outputs", "metrics"))
+
+
+def current_run_id() -> str:
+    return os.getenv("PIPELINE_RUN_ID") or _standalone_run_id
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class _Node:
+    def __init__(self, path, sequential=False):
+        self.path = path
+        self.sequential = sequential
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.children = []
+        self.traced_peak = 0
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.result = None
+
+    def close(self):
+        self.result = {
+            "path": self.path,
+            "wall_s": round(time.perf_counter() - self.wall, 4),
+            "cpu_s": round(time.process_time() - self.cpu, 4),
+            "peak_rss_mb": _peak_rss_mb(),
+            "tracemalloc_peak_mb": round(self.traced_peak / 2**20, 2) if tracemalloc.is_tracing() else None,
+            **self.counters,
+        }
+
+    def flatten(self):
+        rows = [self.result]
+        for child in self.children:
+            rows.extend(child.flatten())
+        return rows
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _sample_traced_peak(node):
+    if tracemalloc.is_tracing():
+        node.traced_peak = max(node.traced_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+
+def _open(name, sequential=False):
+    stack = _stack()
+    parent = stack[-1]
+    _sample_traced_peak(parent)
+    node = _Node(f"{parent.path}/{name}", sequential)
+    stack.append(node)
+    return node
+
+
+def _close_until(node):
+    """Close steps above node on this thread's stack, rolling them up into their parents."""
+    stack = _stack()
+    while stack[-1] is not node:
+        child = stack.pop()
+        _sample_traced_peak(child)
+        child.close()
+        parent = stack[-1]
+        parent.children.append(child)
+        parent.traced_peak = max(parent.traced_peak, child.traced_peak)
+        for key, value in child.counters.items():
+            parent.counters[key] = parent.counters.get(key, 0) + value
+
+
+@contextmanager
+def step(name: str):
+    """Time a named sub-step of the current stage (no-op outside a stage)."""
+    stack = _stack()
+    if not stack:
+        yield
+        return
+
+    parent = stack[-1]
+    _open(name)
+    try:
+        yield
+    finally:
+        _close_until(parent)
+
+
+def next_step(name: str):
+    """
+    End the current sequential step (if any) and start the next one.
+
+    Lets a long linear function be split into steps without re-indenting
+    it; the last one ends with the enclosing step or stage.
+    """
+    stack = _stack()
+    if not stack:
+        return
+    if stack[-1].sequential:
+        _close_until(stack[-2])
+    _open(name, sequential=True)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Top-level metrics scope of one stage; its record is written on exit.
+
+    Also usable as a decorator. Set METRICS_TRACEMALLOC=1 to also track
+    Python heap peaks (slower).
+    """
+    stack = _stack()
+    if stack:
+        # nested stage (e.g. a stage called from another): treat as a step
+        with step(name):
+            yield
+        return
+
+    if os.getenv("METRICS_TRACEMALLOC", "0") == "1" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    node = _Node(name)
+    stack.append(node)
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _close_until(node)
+        stack.pop()
+        _sample_traced_peak(node)
+        node.close()
+        _write_stage_record(name, node, failed)
+        if not os.getenv("PIPELINE_RUN_ID"):
+            write_run_report(current_run_id())
+
+
+def count(key: str, value=1):
+    """Add to a counter of the innermost active step on this thread."""
+    stack = _stack()
+    if stack and value:
+        stack[-1].counters[key] = stack[-1].counters.get(key, 0) + int(value)
+
+
+def _write_stage_record(name, node, failed):
+    folder = os.path.join(metrics_folder(), current_run_id())
+    os.makedirs(folder, exist_ok=True)
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    record = {
+        "run_id": current_run_id(),
+        "stage": name,
+        "pid": os.getpid(),
+        "failed": failed,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "steps": node.flatten(),
+    }
+    with open(os.path.join(folder, f"{safe_name}.{os.getpid()}.json"), "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+
+
+# =====================================================
+# RUN REPORT + COMPARISON WITH THE PREVIOUS RUN
+# =====================================================
+def _previous_report(run_id, steps):
+    """Most recent earlier report sharing at least one step with this run."""
+    reports = sorted(
+        (path for path in glob.glob(os.path.join(metrics_folder(), "run_*.json"))
+         if os.path.basename(path) != f"run_{run_id}.json"),
+        key=os.path.getmtime, reverse=True,
+    )
+    for path in reports:
+        with open(path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        if set(report.get("steps", {})) & set(steps):
+            return report
+    return None
+
+
+def write_run_report(run_id=None, regression_pct=None) -> dict:
+    """
+    Merge the stage records of a run into run_<id>.json and write
+    run_<id>_comparison.csv against the most recent earlier run.
+
+    Returns the report; steps whose wall time grew by more than
+    regression_pct percent (METRICS_REGRESSION_PCT, default 20) are logged.
+    """
+    run_id = run_id or current_run_id()
+    if regression_pct is None:
+        regression_pct = float(os.getenv("METRICS_REGRESSION_PCT", "20"))
+    folder = metrics_folder()
+    os.makedirs(folder, exist_ok=True)
+
+    steps, stages = {}, []
+    for path in sorted(glob.glob(os.path.join(folder, run_id, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+        stages.append({k: record[k] for k in ("stage", "pid", "failed", "finished_at")})
+        for row in record["steps"]:
+            steps[row["path"]] = row
+
+    report = {
+        "run_id": run_id,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stages": stages,
+        "steps": steps,
+    }
+    with open(os.path.join(folder, f"run_{run_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    previous = _previous_report(run_id, steps)
+    if previous is None:
+        logger.info("Run metrics written (run %s, no previous run to compare).", run_id)
+        return report
+
+    comparison = []
+    for path, row in steps.items():
+        before = previous["steps"].get(path)
+        if before is None:
+            continue
+        for key in TIMING_KEYS + COUNTERS:
+            old, new = before.get(key), row.get(key)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else (0.0 if new == old else float("inf"))
+            regression = key == "wall_s" and change > regression_pct and new - old > REGRESSION_MIN_SECONDS
+            comparison.append({
+                "path": path, "metric": key, "previous": old, "current": new,
+                "change_pct": round(change, 1), "regression": regression,
+            })
+            if regression:
+                logger.warning("Regression: %s wall time %.2fs -> %.2fs (+%.0f%%)",
+                               path, old, new, change)
+
+    with open(os.path.join(folder, f"run_{run_id}_comparison.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(
+            f, fieldnames=["path", "metric", "previous", "current", "change_pct", "regression"]
+        )
+        writer.writeheader()
+        writer.writerows(comparison)
+
+    logger.info("Run metrics written (run %s, compared with run %s).", run_id, previous["run_id"])
+    return report
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import io
+import os
+import json
+import shutil
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:       # pandas is imported on first use, not at import time
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# DATE-PARTITIONED TABLES
+# -----------------------------------------------------
+# A partitioned table is a folder with one CSV per day
+# of its time column plus a manifest:
+#
+#   interactions/
+#     _manifest.json
+#     date=2025-01-14/part-0.csv
+#     date=2025-01-15/part-0.csv
+#     date=__null__/part-0.csv     (no parsable time)
+#
+# The manifest lists every partition with its row count,
+# min/max time, size and content hash. Readers use it to
+# skip partitions outside a time window without opening
+# them, and read the remaining ones in parallel. Writers
+# leave partitions whose content is unchanged untouched.
+# =====================================================
+MANIFEST_FILE = "_manifest.json"
+PART_FILE = "part-0.csv"
+NULL_PARTITION = "__null__"
+READ_WORKERS = int(os.getenv("PARTITION_READ_WORKERS", "8"))
+
+
+def manifest_path(folder: str) -> str:
+    return os.path.join(folder, MANIFEST_FILE)
+
+
+def has_manifest(folder: str) -> bool:
+    return os.path.exists(manifest_path(folder))
+
+
+def load_manifest(folder: str):
+    if not has_manifest(folder):
+        return None
+    with open(manifest_path(folder), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def to_timestamp(value):
+    """ISO string / datetime -> Timestamp (None stays None)."""
+    import pandas as pd
+
+    return None if value is None or value == "" else pd.Timestamp(value)
+
+
+def in_window(times: pd.Series, since=None, until=None) -> pd.Series:
+    """Mask of times within [since, until); unparsable times are outside any window."""
+    import pandas as pd
+
+    times = pd.to_datetime(times, errors="coerce")
+    mask = pd.Series(True, index=times.index)
+    if since is not None:
+        mask &= times >= to_timestamp(since)
+    if until is not None:
+        mask &= times < to_timestamp(until)
+    return mask
+
+
+# =====================================================
+# WRITE
+# =====================================================
+def write_partitioned(frame: pd.DataFrame, folder: str, time_column: str, columns=None) -> dict:
+    """
+    Write frame as one CSV per day of time_column and return the manifest.
+
+    Rows keep their order within a partition. Partitions whose CSV content
+    is unchanged are not rewritten; partitions no longer present are removed.
+    An empty frame (possibly without any columns) gives an empty manifest
+    listing columns; rows without time_column go to the null partition.
+    """
+    import pandas as pd
+
+    os.makedirs(folder, exist_ok=True)
+    previous = {p["path"]: p for p in (load_manifest(folder) or {}).get("partitions", [])}
+    columns = [str(c) for c in frame.columns] or list(columns or [])
+
+    if time_column in frame.columns:
+        times = pd.to_datetime(frame[time_column], errors="coerce")
+    else:
+        times = pd.Series(pd.NaT, index=frame.index, dtype="datetime64[ns]")
+    days = times.dt.strftime("%Y-%m-%d").fillna(NULL_PARTITION)
+
+    partitions = []
+    written = 0
+    for day, positions in sorted(days.groupby(days.to_numpy(), sort=False).indices.items()):
+        rel_path = f"date={day}/{PART_FILE}"
+        data = frame.iloc[positions].to_csv(index=False).encode("utf-8")
+        digest = hashlib.sha1(data).hexdigest()
+        path = os.path.join(folder, rel_path)
+        old = previous.get(rel_path)
+        if old is None or old["sha1"] != digest or not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            written += len(data)
+        part_times = times.iloc[positions].dropna()
+        partitions.append({
+            "date": None if day == NULL_PARTITION else day,
+            "path": rel_path,
+            "rows": int(len(positions)),
+            "min": part_times.min().isoformat() if len(part_times) else None,
+            "max": part_times.max().isoformat() if len(part_times) else None,
+            "bytes": len(data),
+            "sha1": digest,
+        })
+
+    kept = {os.path.dirname(p["path"]) for p in partitions}
+    for name in os.listdir(folder):
+        if name.startswith("date=") and name not in kept:
+            shutil.rmtree(os.path.join(folder, name))
+
+    manifest = {
+        "time_column": time_column,
+        "partition_by": "date",
+        "columns": columns,
+        "rows": int(len(frame)),
+        "partitions": partitions,
+    }
+    tmp = manifest_path(folder) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path(folder))
+    logger.info("%s: %d rows in %d date partitions (%d bytes rewritten).",
+                os.path.basename(os.path.normpath(folder)), len(frame), len(partitions), written)
+    manifest["bytes_written"] = written
+    return manifest
+
+
+def remove_partitioned(folder: str):
+    """Drop a partitioned copy (the table is stored as a single CSV again)."""
+    if has_manifest(folder):
+        shutil.rmtree(folder)
+
+
+# =====================================================
+# READ
+# =====================================================
+def select_partitions(manifest: dict, since=None, until=None) -> list:
+    """Partitions that can hold rows in [since, until), by their min/max time."""
+    since, until = to_timestamp(since), to_timestamp(until)
+    if since is None and until is None:
+        return list(manifest["partitions"])
+    return [
+        p for p in manifest["partitions"]
+        if p["min"] is not None
+        and (since is None or to_timestamp(p["max"]) >= since)
+        and (until is None or to_timestamp(p["min"]) < until)
+    ]
+
+
+def _read_part(path):
+    import pandas as pd
+
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, pd.read_csv(io.BytesIO(data))
+
+
+def read_partitioned(folder: str, since=None, until=None, workers=READ_WORKERS):
+    """
+    Rows of a partitioned table within [since, until) (everything without a
+    window), reading only the partitions the manifest says can match.
+    Returns (frame, bytes read).
+    """
+    import pandas as pd
+
+    manifest = load_manifest(folder)
+    selected = select_partitions(manifest, since, until)
+    logger.info("%s: reading %d of %d date partitions.",
+                os.path.basename(os.path.normpath(folder)), len(selected), len(manifest["partitions"]))
+    if not selected:
+        return pd.DataFrame(columns=manifest["columns"]), 0
+
+    paths = [os.path.join(folder, p["path"]) for p in selected]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        parts = list(pool.map(_read_part, paths))
+
+    frames = [frame for _, frame in parts]
+    if all(list(f.dtypes) == list(frames[0].dtypes) for f in frames[1:]):
+        frame = pd.concat(frames, ignore_index=True)
+    else:
+        # partitions inferred different types (e.g. a column empty in one day):
+        # parse the rows together, as a single CSV would be
+        body = b"".join(data.split(b"\n", 1)[1] if i else data for i, (data, _) in enumerate(parts))
+        frame = pd.read_csv(io.BytesIO(body))
+
+    if since is not None or until is not None:
+        frame = frame[in_window(frame[manifest["time_column"]], since, until)].reset_index(drop=True)
+    return frame, sum(len(data) for data, _ in parts)
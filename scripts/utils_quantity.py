@@ -0,0 +1,137 @@
+import re
+import unicodedata
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# =====================================================
+# QUANTITY NORMALIZATION
+# -----------------------------------------------------
+# Free-text quantities ("1 cup", "½ cup", "2 tbsp",
+# "150g", "3 medium", "to taste") are parsed into a
+# numeric value, a canonical unit and a metric amount
+# (grams for mass, millilitres for volume).
+# =====================================================
+
+# canonical unit -> (metric unit, factor to metric)
+UNITS = {
+    "g": ("g", 1.0),
+    "kg": ("g", 1000.0),
+    "mg": ("g", 0.001),
+    "oz": ("g", 28.3495),
+    "lb": ("g", 453.592),
+    "ml": ("ml", 1.0),
+    "l": ("ml", 1000.0),
+    "cup": ("ml", 240.0),
+    "tbsp": ("ml", 15.0),
+    "tsp": ("ml", 5.0),
+    "pinch": ("g", 0.36),
+    "piece": (None, None),
+}
+
+UNIT_ALIASES = {
+    "g": "g", "gm": "g", "gms": "g", "gram": "g", "grams": "g",
+    "kg": "kg", "kgs": "kg", "kilogram": "kg", "kilograms": "kg",
+    "mg": "mg",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "ml": "ml", "millilitre": "ml", "milliliter": "ml", "millilitres": "ml", "milliliters": "ml",
+    "l": "l", "litre": "l", "liter": "l", "litres": "l", "liters": "l",
+    "cup": "cup", "cups": "cup",
+    "tbsp": "tbsp", "tbs": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "pinch": "pinch", "pinches": "pinch",
+    "piece": "piece", "pieces": "piece", "pc": "piece", "pcs": "piece",
+    "small": "piece", "medium": "piece", "large": "piece",
+    "clove": "piece", "cloves": "piece",
+}
+
+_NUMBER = r"\d+(?:\.\d+)?(?:\s*/\s*\d+)?"
+_QUANTITY_RE = re.compile(
+    rf"^\s*(?P<num>{_NUMBER}(?:\s+{_NUMBER})?)?"
+    rf"(?:\s*(?:-|to)\s*(?P<num_hi>{_NUMBER}))?"
+    r"\s*(?P<unit>[a-z]+)?\b"
+)
+
+COLUMNS = ["quantity_value", "quantity_unit", "quantity_metric", "metric_unit"]
+
+
+def _replace_unicode_fractions(text: str) -> str:
+    # "1½" -> "1 0.5", "½" -> "0.5"
+    out = []
+    for ch in text:
+        if unicodedata.category(ch) == "No" and unicodedata.numeric(ch, None) is not None:
+            out.append(f" {unicodedata.numeric(ch)!r} ")
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _to_number(text: str) -> float:
+    total = 0.0
+    for part in text.split():
+        if "/" in part:
+            num, den = part.split("/")
+            total += float(num) / float(den)
+        else:
+            total += float(part)
+    return total
+
+
+@lru_cache(maxsize=None)
+def parse_quantity(text) -> tuple:
+    """
+    Parse one quantity string.
+
+    Returns (value, unit, metric_amount, metric_unit); parts that cannot be
+    determined are None, e.g. "to taste" -> (None, None, None, None).
+    """
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return (None, None, None, None)
+
+    cleaned = _replace_unicode_fractions(str(text).lower())
+    cleaned = re.sub(r"(?<=\d)\s*/\s*(?=\d)", "/", cleaned)
+    cleaned = re.sub(r"(?<=\d)(?=[a-z])", " ", cleaned)
+
+    match = _QUANTITY_RE.match(cleaned)
+    if not match or not (match.group("num") or match.group("unit")):
+        return (None, None, None, None)
+
+    value = _to_number(match.group("num")) if match.group("num") else None
+    if value is not None and match.group("num_hi"):
+        value = (value + _to_number(match.group("num_hi"))) / 2
+
+    unit = UNIT_ALIASES.get(match.group("unit") or "")
+    if unit is None:
+        # bare number ("1") counts pieces; unknown words stay unparsed
+        if value is None or match.group("unit"):
+            return (value, None, None, None)
+        unit = "piece"
+    if value is None:
+        value = 1.0
+
+    metric_unit, factor = UNITS[unit]
+    metric = value * factor if factor is not None else None
+    return (value, unit, metric, metric_unit)
+
+
+def normalize_quantities(quantities: pd.Series) -> pd.DataFrame:
+    """
+    Vectorized normalization of a quantity column.
+
+    Each distinct string is parsed once (and memoized across calls); the
+    parsed values are then mapped back onto all rows by integer code.
+    """
+    codes, uniques = pd.factorize(quantities)
+    parsed = [parse_quantity(u) for u in uniques]
+    # slot -1 (missing input) maps onto an all-None row appended at the end
+    parsed.append((None, None, None, None))
+    codes = np.where(codes < 0, len(parsed) - 1, codes)
+
+    values, units, metrics, metric_units = zip(*parsed)
+    return pd.DataFrame({
+        "quantity_value": np.asarray(values, dtype=float)[codes],
+        "quantity_unit": np.asarray(units, dtype=object)[codes],
+        "quantity_metric": np.asarray(metrics, dtype=float)[codes],
+        "metric_unit": np.asarray(metric_units, dtype=object)[codes],
+    }, index=quantities.index)
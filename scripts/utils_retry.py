@@ -1,37 +1,316 @@
 import time
+import random
+import inspect
 import logging
+import functools
+import threading
+from utils_metrics import count
 
 logger = logging.getLogger(__name__)
 
-def retry(exceptions, tries=5, delay=1, backoff=2):
+# =====================================================
+# RETRY LAYER
+# -----------------------------------------------------
+# retry() keeps its original signature and adds:
+#
+# * full-jitter backoff: sleep uniform(0, min(max_delay,
+#   delay * backoff**n)), so concurrent workers failing
+#   together do not retry in lockstep
+# * an overall deadline (seconds) across all attempts
+# * error classification: only transient errors are
+#   retried; missing files, bad input and auth errors
+#   fail immediately
+# * a per-backend guard (backend="firestore") shared by
+#   every caller in the process: a retry budget (retries
+#   stop while most recent calls fail) and a circuit
+#   breaker (calls fail fast for reset_timeout seconds
+#   after failure_threshold transient failures in a row)
+# * plain and asyncio callables
+#
+# Metrics counters: retries, retry_giveups (transient
+# error not retried further), permanent_errors.
+# =====================================================
+MAX_DELAY = 30.0
+
+# matched against the exception's class and base class names, so the
+# Google client libraries do not have to be imported to classify their errors
+PERMANENT_ERRORS = {
+    # builtins: bad input or environment, retrying cannot help
+    "FileNotFoundError", "IsADirectoryError", "NotADirectoryError", "PermissionError",
+    "ValueError", "TypeError", "KeyError", "AttributeError", "NotImplementedError",
+    "ImportError", "CircuitOpenError",
+    # google.api_core / google.auth
+    "Unauthenticated", "Unauthorized", "PermissionDenied", "Forbidden",
+    "DefaultCredentialsError", "RefreshError", "InvalidArgument", "BadRequest",
+    "NotFound", "AlreadyExists", "FailedPrecondition", "OutOfRange",
+}
+TRANSIENT_ERRORS = {
+    "ConnectionError", "TimeoutError",
+    "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "TooManyRequests",
+    "ResourceExhausted", "Aborted", "GatewayTimeout", "BadGateway", "Unknown", "TransportError",
+}
+
+
+def is_transient(error: BaseException) -> bool:
+    """Transient errors are worth retrying; unknown errors count as transient."""
+    for cls in type(error).__mro__:
+        if cls.__name__ in TRANSIENT_ERRORS:
+            return True
+        if cls.__name__ in PERMANENT_ERRORS:
+            return False
+    return True
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the backend while its circuit breaker is open."""
+
+
+# =====================================================
+# PER-BACKEND RETRY BUDGET + CIRCUIT BREAKER
+# =====================================================
+class RetryBudget:
     """
-    Retry decorator with exponential backoff.
-    
+    Token bucket shared by all callers of one backend (gRPC-style throttling).
+
+    Every transient failure takes a token, every success returns token_ratio
+    of one; retries are only allowed while more than half the tokens are left.
+    """
+
+    def __init__(self, max_tokens=100.0, token_ratio=0.1):
+        self.max_tokens = max_tokens
+        self.token_ratio = token_ratio
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.token_ratio)
+
+    def record_failure(self):
+        with self._lock:
+            self.tokens = max(0.0, self.tokens - 1)
+
+    def can_retry(self) -> bool:
+        with self._lock:
+            return self.tokens > self.max_tokens / 2
+
+
+class CircuitBreaker:
+    """closed -> open after failure_threshold transient failures in a row;
+    open -> half-open (one trial call) after reset_timeout seconds."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self, name) -> bool:
+        """Raise while open; True when this call is the half-open trial."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_running):
+                raise CircuitOpenError(f"{name}: circuit open after {self.failures} failures")
+            if state == "half-open":
+                self._trial_running = True
+                return True
+            return False
+
+    def end_trial(self):
+        """Free the trial slot of a call that ended without a verdict (e.g. cancelled)."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Circuit opened after %d failures in a row.", self.failures)
+                self.opened_at = time.monotonic()
+
+
+class BackendGuard:
+    def __init__(self, name, budget: RetryBudget, breaker: CircuitBreaker):
+        self.name = name
+        self.budget = budget
+        self.breaker = breaker
+
+    def before_call(self) -> bool:
+        return self.breaker.before_call(self.name)
+
+    def record_success(self):
+        self.budget.record_success()
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.budget.record_failure()
+        self.breaker.record_failure()
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def backend_guard(name: str, **settings) -> BackendGuard:
+    """The process-wide guard of a backend (created with settings on first use)."""
+    with _guards_lock:
+        if name not in _guards:
+            budget_keys = {"max_tokens", "token_ratio"}
+            _guards[name] = BackendGuard(
+                name,
+                RetryBudget(**{k: v for k, v in settings.items() if k in budget_keys}),
+                CircuitBreaker(**{k: v for k, v in settings.items() if k not in budget_keys}),
+            )
+        return _guards[name]
+
+
+# =====================================================
+# DECORATOR
+# =====================================================
+class _Attempts:
+    """Retry bookkeeping of one decorated call; sync and async wrappers share it."""
+
+    def __init__(self, func, exceptions, tries, delay, backoff, max_delay, deadline, guard):
+        self.func = func
+        self.exceptions = exceptions
+        self.tries_left = tries
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.deadline = None if deadline is None else time.monotonic() + deadline
+        self.guard = guard
+        self.trial = False
+
+    def before_call(self):
+        self.trial = self.guard.before_call() if self.guard else False
+
+    def abandoned(self):
+        """The call raised something not retried (cancellation, an exception
+        outside `exceptions`): free a half-open trial without judging the backend."""
+        if self.trial:
+            self.guard.breaker.end_trial()
+
+    def succeeded(self):
+        if self.guard:
+            self.guard.record_success()
+
+    def next_sleep(self, error):
+        """Seconds to sleep before the next attempt, or None to re-raise error."""
+        name = self.func.__name__
+        if not is_transient(error):
+            if self.guard:
+                # the backend answered, so it is up (also ends a half-open trial)
+                self.guard.breaker.record_success()
+            count("permanent_errors")
+            logger.warning("%s failed with a permanent error (%s: %s), not retrying.",
+                           name, type(error).__name__, error)
+            return None
+
+        if self.guard:
+            self.guard.record_failure()
+        self.tries_left -= 1
+
+        sleep = random.uniform(0, min(self.max_delay, self.delay))
+        reason = None
+        if self.tries_left < 1:
+            reason = "no attempts left"
+        elif self.deadline is not None and time.monotonic() + sleep > self.deadline:
+            reason = "deadline reached"
+        elif self.guard and not self.guard.budget.can_retry():
+            reason = f"{self.guard.name} retry budget exhausted"
+        if reason:
+            count("retry_giveups")
+            logger.warning("%s failed with error: %s. Giving up (%s).", name, error, reason)
+            return None
+
+        logger.warning("%s failed with error: %s. Retrying in %.2fs... (%d retries left)",
+                       name, error, sleep, self.tries_left)
+        count("retries")
+        self.delay *= self.backoff
+        return sleep
+
+
+def retry(exceptions=Exception, tries=5, delay=1, backoff=2,
+          max_delay=MAX_DELAY, deadline=None, backend=None):
+    """
+    Retry decorator with full-jitter exponential backoff.
+
     Args:
         exceptions: Exception or tuple of exceptions to catch.
-        tries (int): Number of attempts.
-        delay (int): Initial delay in seconds.
-        backoff (int): Multiplier for delay.
+        tries (int): Maximum number of attempts.
+        delay (float): Backoff cap of the first retry in seconds.
+        backoff (float): Multiplier of the cap per retry.
+        max_delay (float): Upper bound of any single sleep.
+        deadline (float): Give up once this many seconds have passed in total.
+        backend (str): Name of the shared retry budget / circuit breaker.
+
+    Works on plain functions and on coroutine functions.
     """
     def decorator(func):
-        def wrapper(*args, **kwargs):
-            _tries, _delay = tries, delay
+        def attempts():
+            guard = backend_guard(backend) if backend else None
+            return _Attempts(func, exceptions, tries, delay, backoff, max_delay, deadline, guard)
 
-            while _tries > 1:
-                try:
-                    return func(*args, **kwargs)
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                import asyncio
+
+                state = attempts()
+                while True:
+                    state.before_call()
+                    try:
+                        result = await func(*args, **kwargs)
+                    except exceptions as e:
+                        sleep = state.next_sleep(e)
+                        if sleep is None:
+                            raise
+                        await asyncio.sleep(sleep)
+                    except BaseException:
+                        state.abandoned()
+                        raise
+                    else:
+                        state.succeeded()
+                        return result
 
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            state = attempts()
+            while True:
+                state.before_call()
+                try:
+                    result = func(*args, **kwargs)
                 except exceptions as e:
-                    logger.warning(
-                        f"{func.__name__} failed with error: {e}. "
-                        f"Retrying in {_delay}s... ({_tries - 1} retries left)"
-                    )
-                    time.sleep(_delay)
-                    _tries -= 1
-                    _delay *= backoff
-
-            # final attempt (let exception raise if fails)
-            return func(*args, **kwargs)
+                    sleep = state.next_sleep(e)
+                    if sleep is None:
+                        raise
+                    time.sleep(sleep)
+                except BaseException:
+                    state.abandoned()
+                    raise
+                else:
+                    state.succeeded()
+                    return result
 
         return wrapper
     return decorator
@@ -0,0 +1,280 @@
+import math
+import numpy as np
+import pandas as pd
+
+# =====================================================
+# MERGEABLE STREAMING ACCUMULATORS
+# -----------------------------------------------------
+# Every accumulator here can be fed chunk by chunk with
+# update() and combined with merge(), so the same numbers
+# come out of a single pass, a chunked pass or a
+# partitioned run without materializing the full table.
+# =====================================================
+
+
+def iter_chunks(frame: pd.DataFrame, chunk_size: int):
+    """Yield consecutive row slices of a DataFrame."""
+    for start in range(0, len(frame), chunk_size):
+        yield frame.iloc[start:start + chunk_size]
+
+
+class RunningMoments:
+    """Count, mean, variance, min and max of one numeric column (Welford / Chan)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        arr = np.asarray(values, dtype=float)
+        arr = arr[~np.isnan(arr)]
+        if arr.size == 0:
+            return self
+
+        chunk = RunningMoments()
+        chunk.n = int(arr.size)
+        chunk.mean = float(arr.mean())
+        chunk.m2 = float(((arr - chunk.mean) ** 2).sum())
+        chunk.min = float(arr.min())
+        chunk.max = float(arr.max())
+        return self.merge(chunk)
+
+    def merge(self, other: "RunningMoments"):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean, self.m2 = other.n, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self) -> float:
+        # sample variance (ddof=1), same as pandas .var()
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance) if self.n > 1 else math.nan
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.n,
+            "mean": self.mean if self.n else math.nan,
+            "std": self.std,
+            "min": self.min if self.n else math.nan,
+            "max": self.max if self.n else math.nan,
+        }
+
+
+class RunningCovariance:
+    """
+    Pairwise co-moments over a fixed set of columns.
+
+    Each column pair keeps its own count, means and co-moment over the rows
+    where both values are present (pairwise-complete, like pandas), so a
+    missing value only drops the row from the pairs it takes part in. The
+    results match DataFrame.cov() / DataFrame.corr() on incomplete data.
+
+    n, mean, m2, comoment are k x k: entry [i, j] describes column i over
+    the rows where columns i and j are both present.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.n = np.zeros((k, k))
+        self.mean = np.zeros((k, k))
+        self.m2 = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+
+    def update(self, frame: pd.DataFrame):
+        arr = frame[self.columns].to_numpy(dtype=float)
+        present = ~np.isnan(arr)
+        if not present.any():
+            return self
+
+        # shift by the column means first: sums of products stay small
+        counts = present.sum(axis=0)
+        shift = np.where(present, arr, 0.0).sum(axis=0) / np.maximum(counts, 1)
+        x = np.where(present, arr - shift, 0.0)
+        m = present.astype(float)
+
+        chunk = RunningCovariance(self.columns)
+        chunk.n = m.T @ m
+        sums = x.T @ m                          # [i, j]: sum of column i where j is present too
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(chunk.n > 0, sums / chunk.n, 0.0)
+            chunk.comoment = np.where(chunk.n > 0, x.T @ x - sums * sums.T / chunk.n, 0.0)
+            chunk.m2 = np.where(chunk.n > 0, (x * x).T @ m - sums * sums / chunk.n, 0.0)
+        chunk.mean = mean + shift[:, None]
+        return self.merge(chunk)
+
+    def merge(self, other: "RunningCovariance"):
+        if other.columns != self.columns:
+            raise ValueError("Cannot merge covariance accumulators over different columns")
+
+        n = self.n + other.n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(n > 0, self.n * other.n / n, 0.0)
+            share = np.where(n > 0, other.n / n, 0.0)
+        delta = other.mean - self.mean          # [i, j]: shift of column i's pair mean
+        self.comoment = self.comoment + other.comoment + delta * delta.T * weight
+        self.m2 = self.m2 + other.m2 + delta * delta * weight
+        self.mean = self.mean + delta * share
+        self.n = n
+        return self
+
+    def cov(self) -> pd.DataFrame:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.where(self.n > 1, self.comoment / (self.n - 1), np.nan)
+        return pd.DataFrame(values, index=self.columns, columns=self.columns)
+
+    def corr(self) -> pd.DataFrame:
+        divisor = np.sqrt(self.m2 * self.m2.T)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.where(divisor > 0, self.comoment / divisor, np.nan)
+        np.fill_diagonal(values, np.where(np.diag(self.m2) > 0, 1.0, np.nan))
+        return pd.DataFrame(values, index=self.columns, columns=self.columns)
+
+
+class FixedBinHistogram:
+    """
+    Histogram over fixed bin edges, usable as a quantile sketch.
+
+    Values outside the edges are counted in underflow/overflow and
+    ignored by quantile(). Two histograms merge only if their edges match.
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    @classmethod
+    def from_range(cls, lo: float, hi: float, bins: int):
+        # same convention as np.histogram(bins=n) on a degenerate range
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        return cls(np.linspace(lo, hi, bins + 1))
+
+    def update(self, values):
+        arr = np.asarray(values, dtype=float)
+        arr = arr[~np.isnan(arr)]
+        self.underflow += int((arr < self.edges[0]).sum())
+        self.overflow += int((arr > self.edges[-1]).sum())
+        counts, _ = np.histogram(arr, bins=self.edges)
+        self.counts += counts
+        return self
+
+    def merge(self, other: "FixedBinHistogram"):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge histograms with different bin edges")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile by linear interpolation inside the target bin."""
+        total = self.total
+        if total == 0:
+            return math.nan
+
+        target = q * total
+        cumulative = np.cumsum(self.counts)
+        idx = int(np.searchsorted(cumulative, target, side="left"))
+        idx = min(idx, len(self.counts) - 1)
+
+        before = cumulative[idx - 1] if idx > 0 else 0
+        in_bin = self.counts[idx]
+        frac = (target - before) / in_bin if in_bin else 0.0
+        lo, hi = self.edges[idx], self.edges[idx + 1]
+        return float(lo + frac * (hi - lo))
+
+
+class RatingAccumulator:
+    """
+    Per-recipe rating counts, sums and 1-5 star distribution.
+
+    State is a small DataFrame indexed by recipe_id, so partial results from
+    chunks or partitions merge by index-aligned addition.
+    """
+
+    STARS = [1, 2, 3, 4, 5]
+    COLUMNS = [f"rating_{s}" for s in STARS] + ["rating_sum"]
+
+    def __init__(self):
+        self.state = pd.DataFrame(columns=self.COLUMNS, dtype=float)
+        self.state.index.name = "recipe_id"
+
+    def update(self, interactions: pd.DataFrame, weight=None):
+        """weight: optional column counting the events of each row (compacted interactions)."""
+        ratings = pd.to_numeric(interactions["rating"], errors="coerce")
+        rated = interactions.loc[ratings.notna(), ["recipe_id"]].assign(rating=ratings.dropna())
+        if rated.empty:
+            return self
+
+        stars = rated["rating"].round().clip(1, 5).astype(int)
+        if weight is None:
+            counts = pd.crosstab(rated["recipe_id"], stars)
+            rating_sum = rated.groupby("recipe_id")["rating"].sum()
+        else:
+            n = interactions.loc[ratings.notna(), weight]
+            counts = pd.crosstab(rated["recipe_id"], stars, values=n, aggfunc="sum").fillna(0)
+            rating_sum = (rated["rating"] * n).groupby(rated["recipe_id"]).sum()
+        counts = (
+            counts
+            .reindex(columns=self.STARS, fill_value=0)
+            .rename(columns=lambda s: f"rating_{s}")
+        )
+        counts["rating_sum"] = rating_sum
+
+        chunk = RatingAccumulator()
+        chunk.state = counts.astype(float)
+        return self.merge(chunk)
+
+    def merge(self, other: "RatingAccumulator"):
+        if self.state.empty:
+            self.state = other.state.copy()
+        elif not other.state.empty:
+            self.state = self.state.add(other.state, fill_value=0)
+        self.state.index.name = "recipe_id"
+        return self
+
+    def result(self, prior_weight: float) -> pd.DataFrame:
+        """
+        Count, mean and Bayesian (damped) average per recipe.
+
+        rating_bayes = (prior_weight * global_mean + sum) / (prior_weight + count)
+        """
+        star_cols = [f"rating_{s}" for s in self.STARS]
+        out = self.state.copy()
+        out["rating_count"] = out[star_cols].sum(axis=1)
+
+        total = out["rating_count"].sum()
+        global_mean = out["rating_sum"].sum() / total if total else float("nan")
+
+        out["rating_mean"] = out["rating_sum"] / out["rating_count"]
+        out["rating_bayes"] = (
+            (prior_weight * global_mean + out["rating_sum"])
+            / (prior_weight + out["rating_count"])
+        )
+        out.attrs["global_mean"] = global_mean
+        return out[["rating_count", "rating_mean", "rating_bayes"] + star_cols]
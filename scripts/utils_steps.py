@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:       # pandas is imported on first use, not at import time
+    import pandas as pd
+
+# =====================================================
+# DICTIONARY-ENCODED STEP TEXT
+# -----------------------------------------------------
+# Most step sentences are shared templates ("Heat oil on
+# medium flame."), so step_text is stored once in a
+# dictionary table and steps only carry an integer
+# step_text_id.
+# =====================================================
+STEP_TEXT_FILE = "step_texts.csv"
+STEP_TEXT_CLEAN_FILE = "step_texts_clean.csv"
+
+
+def encode_step_text(steps: pd.DataFrame):
+    """
+    Replace step_text with step_text_id.
+
+    Returns (encoded_steps, dictionary) where dictionary has columns
+    step_text_id, step_text. Missing text gets no id (NA).
+    """
+    import pandas as pd
+
+    codes, uniques = pd.factorize(steps["step_text"])
+    encoded = steps.drop(columns=["step_text"]).copy()
+    encoded["step_text_id"] = pd.array(codes, dtype="Int64")
+    encoded.loc[codes < 0, "step_text_id"] = pd.NA
+
+    dictionary = pd.DataFrame({
+        "step_text_id": range(len(uniques)),
+        "step_text": uniques,
+    })
+    return encoded, dictionary
+
+
+def compact_dictionary(steps: pd.DataFrame, dictionary: pd.DataFrame):
+    """Drop dictionary entries no step references and renumber ids densely."""
+    import pandas as pd
+
+    used = dictionary[dictionary["step_text_id"].isin(steps["step_text_id"].dropna())]
+    remap = pd.Series(range(len(used)), index=used["step_text_id"].to_numpy())
+
+    steps = steps.copy()
+    steps["step_text_id"] = steps["step_text_id"].map(remap).astype("Int64")
+    dictionary = pd.DataFrame({
+        "step_text_id": range(len(used)),
+        "step_text": used["step_text"].to_numpy(),
+    })
+    return steps, dictionary
+
+
+def decode_step_text(steps: pd.DataFrame, dictionary: pd.DataFrame) -> pd.Series:
+    """step_text for every step row (works on legacy un-encoded tables too)."""
+    import pandas as pd
+
+    if "step_text" in steps.columns:
+        return steps["step_text"]
+    lookup = pd.Series(dictionary["step_text"].to_numpy(), index=dictionary["step_text_id"].to_numpy())
+    return steps["step_text_id"].map(lookup)
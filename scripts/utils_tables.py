@@ -0,0 +1,159 @@
+import os
+import logging
+from utils_retry import retry
+from utils_metrics import count
+from utils_steps import STEP_TEXT_FILE, STEP_TEXT_CLEAN_FILE
+from utils_partitions import (has_manifest, in_window, read_partitioned, remove_partitioned,
+                              to_timestamp, write_partitioned)
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# PIPELINE TABLES
+# -----------------------------------------------------
+# Stage functions exchange tables as {name: DataFrame}.
+# When a stage runs in-process the orchestrator hands
+# tables over in memory; otherwise (or for tables an
+# upstream stage did not produce in this run) they are
+# read from their CSV checkpoint below.
+# =====================================================
+RAW_FOLDER = "outputs"
+CLEAN_FOLDER = os.path.join("outputs", "clean")
+
+TABLE_PATHS = {
+    # exported from Firestore (2_export_firestore.py)
+    "recipe": os.path.join(RAW_FOLDER, "recipe.csv"),
+    "ingredients": os.path.join(RAW_FOLDER, "ingredients.csv"),
+    "steps": os.path.join(RAW_FOLDER, "steps.csv"),
+    "step_texts": os.path.join(RAW_FOLDER, STEP_TEXT_FILE),
+    "users": os.path.join(RAW_FOLDER, "users.csv"),
+    "interactions": os.path.join(RAW_FOLDER, "interactions.csv"),
+    "interaction_aggregates": os.path.join(RAW_FOLDER, "interaction_aggregates.csv"),
+    # cleaned (3_transform_to_csv.py)
+    "recipes_clean": os.path.join(CLEAN_FOLDER, "recipes_clean.csv"),
+    "ingredients_clean": os.path.join(CLEAN_FOLDER, "ingredients_clean.csv"),
+    "steps_clean": os.path.join(CLEAN_FOLDER, "steps_clean.csv"),
+    "step_texts_clean": os.path.join(CLEAN_FOLDER, STEP_TEXT_CLEAN_FILE),
+    "users_clean": os.path.join(CLEAN_FOLDER, "users_clean.csv"),
+    "interactions_clean": os.path.join(CLEAN_FOLDER, "interactions_clean.csv"),
+    "interaction_aggregates_clean": os.path.join(CLEAN_FOLDER, "interaction_aggregates_clean.csv"),
+}
+
+# =====================================================
+# DATE-PARTITIONED INTERACTIONS
+# -----------------------------------------------------
+# Interactions are written as date=YYYY-MM-DD/ folders
+# with a manifest (utils_partitions.py) instead of one
+# CSV; INTERACTIONS_PARTITIONED=0 keeps the single file.
+# Readers take whichever layout is on disk.
+#
+# INTERACTIONS_SINCE / INTERACTIONS_UNTIL (ISO date or
+# timestamp, [since, until)) restrict the interactions
+# validation and analytics read (transform always cleans
+# everything); partitions outside the window are not opened.
+# =====================================================
+PARTITIONED = os.getenv("INTERACTIONS_PARTITIONED", "1") == "1"
+PARTITIONED_TABLES = {
+    # name: (folder, time column)
+    "interactions": (os.path.join(RAW_FOLDER, "interactions"), "timestamp"),
+    "interactions_clean": (os.path.join(CLEAN_FOLDER, "interactions_clean"), "timestamp"),
+}
+
+
+def interaction_window():
+    """(since, until) from INTERACTIONS_SINCE / INTERACTIONS_UNTIL; None = unbounded."""
+    return os.getenv("INTERACTIONS_SINCE") or None, os.getenv("INTERACTIONS_UNTIL") or None
+
+
+def aggregates_in_window(aggregates, since=None, until=None):
+    """Compacted interaction rows whose day overlaps [since, until)."""
+    if since is None and until is None:
+        return aggregates
+    since = to_timestamp(since).floor("D") if since is not None else None
+    return aggregates[in_window(aggregates["day"], since, until)].reset_index(drop=True)
+
+
+# raw interaction documents; the collection may be empty once
+# compact_interactions.py has rolled every event into aggregates
+INTERACTION_COLUMNS = ["id", "recipe_id", "user_id", "type", "timestamp", "rating"]
+
+# compacted interactions (compact_interactions.py): event counts per
+# recipe, day, user, type and rating
+AGGREGATE_COLUMNS = ["recipe_id", "day", "user_id", "type", "rating", "count"]
+
+
+@retry(Exception, tries=3, delay=1, backoff=2)
+def safe_read_csv(path: str):
+    import pandas as pd
+
+    frame = pd.read_csv(path)
+    count("bytes_read", os.path.getsize(path))
+    return frame
+
+
+def is_partitioned(name: str) -> bool:
+    return name in PARTITIONED_TABLES and has_manifest(PARTITIONED_TABLES[name][0])
+
+
+def get_table(tables, name: str, since=None, until=None):
+    """
+    A private copy of a table: from memory when handed over, else from its CSV
+    (or its date partitions). since/until keep the rows of a partitioned
+    table whose time is in [since, until).
+
+    Copies keep stages running side by side from mutating each other's input.
+    """
+    window = since is not None or until is not None
+    if tables and name in tables:
+        frame = tables[name].copy()
+    elif is_partitioned(name):
+        frame, size = read_partitioned(PARTITIONED_TABLES[name][0], since, until)
+        count("bytes_read", size)
+        window = False
+    else:
+        frame = safe_read_csv(TABLE_PATHS[name])
+    if window and name in PARTITIONED_TABLES:
+        time_column = PARTITIONED_TABLES[name][1]
+        frame = frame[in_window(frame[time_column], since, until)].reset_index(drop=True)
+    count("rows_in", len(frame))
+    return frame
+
+
+def get_optional_table(tables, name: str, columns):
+    """get_table, or an empty table with columns when no CSV exists (older exports)."""
+    if not (tables and name in tables) and not os.path.exists(TABLE_PATHS[name]) and not is_partitioned(name):
+        import pandas as pd
+
+        return pd.DataFrame(columns=columns)
+    return get_table(tables, name)
+
+
+def warn_compacted_ignored(reader: str, since=None, until=None):
+    """Warn when reader, which needs individual events, skips compacted interactions in the window."""
+    compacted = aggregates_in_window(
+        get_optional_table(None, "interaction_aggregates_clean", AGGREGATE_COLUMNS), since, until
+    )
+    if len(compacted):
+        logger.warning("%s: %d compacted interactions (interaction_aggregates) are not included; "
+                       "it needs individual events.", reader, int(compacted["count"].sum()))
+
+
+def write_tables(tables: dict):
+    """Write tables to their CSV checkpoints (interactions: date partitions)."""
+    for name, frame in tables.items():
+        path = TABLE_PATHS[name]
+        if name in PARTITIONED_TABLES and PARTITIONED:
+            folder, time_column = PARTITIONED_TABLES[name]
+            manifest = write_partitioned(frame, folder, time_column, INTERACTION_COLUMNS)
+            if os.path.exists(path):
+                os.remove(path)         # single-file copy from an earlier layout
+            count("rows_out", len(frame))
+            count("bytes_written", manifest["bytes_written"])
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame.to_csv(path, index=False)
+        if name in PARTITIONED_TABLES:
+            remove_partitioned(PARTITIONED_TABLES[name][0])
+        count("rows_out", len(frame))
+        count("bytes_written", os.path.getsize(path))
+        logger.info("%s written.", os.path.basename(path))
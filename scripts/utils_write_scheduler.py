@@ -0,0 +1,332 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from utils_retry import retry, is_transient
+from utils_metrics import count
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# RATE-LIMITED WRITE SCHEDULER
+# -----------------------------------------------------
+# Bulk writers submit write calls here instead of firing
+# them at full speed. Two limits apply:
+#
+# * rate: a token bucket following Firestore's 500/50/5
+#   ramp-up rule: start at WRITE_BASE_RATE (500) ops/s
+#   and grow by 50% every WRITE_RAMP_PERIOD_S (300) s,
+#   up to WRITE_MAX_RATE (0 = no cap). A batch of n
+#   documents takes n tokens.
+# * concurrency (writes in flight): AIMD. +1 per window
+#   of successful writes, halved (at most once per
+#   window) on a contention error (ResourceExhausted,
+#   Aborted, DeadlineExceeded, ...) or when the average
+#   latency exceeds WRITE_TARGET_LATENCY_MS (0 = twice
+#   the fastest latency seen), between 1 and
+#   WRITE_MAX_CONCURRENCY.
+#
+# Each attempt is retried through utils_retry (shared
+# "firestore" budget and circuit breaker) and observed
+# by the AIMD controller. stats() exposes the current
+# rate, concurrency limit, writes in flight and queue
+# depth; a progress line is logged every
+# WRITE_LOG_EVERY_S seconds.
+# =====================================================
+BASE_RATE = float(os.getenv("WRITE_BASE_RATE", "500"))
+RAMP_PERIOD_S = float(os.getenv("WRITE_RAMP_PERIOD_S", "300"))
+RAMP_FACTOR = 1.5
+MAX_RATE = float(os.getenv("WRITE_MAX_RATE", "0"))
+MAX_CONCURRENCY = int(os.getenv("WRITE_MAX_CONCURRENCY", "32"))
+TARGET_LATENCY_MS = float(os.getenv("WRITE_TARGET_LATENCY_MS", "0"))
+LOG_EVERY_S = float(os.getenv("WRITE_LOG_EVERY_S", "10"))
+QUEUE_SIZE = 10_000         # submit() blocks while this many writes wait
+LATENCY_EWMA = 0.2
+
+
+# =====================================================
+# RAMP-UP TOKEN BUCKET
+# =====================================================
+class RampUpBucket:
+    """Token bucket whose rate follows the 500/50/5 rule from the first write."""
+
+    def __init__(self, base_rate=BASE_RATE, ramp_period_s=RAMP_PERIOD_S, max_rate=MAX_RATE):
+        self.base_rate = base_rate
+        self.ramp_period_s = ramp_period_s
+        self.max_rate = max_rate
+        self._started = None
+        self._tokens = 0.0
+        self._updated = None
+        self._lock = threading.Lock()
+
+    def rate(self, now=None) -> float:
+        if self._started is None:
+            return self.base_rate
+        now = time.monotonic() if now is None else now
+        periods = int((now - self._started) // self.ramp_period_s) if self.ramp_period_s else 0
+        rate = self.base_rate * RAMP_FACTOR ** min(periods, 64)
+        return min(rate, self.max_rate) if self.max_rate else rate
+
+    def acquire(self, amount=1):
+        """Block until amount tokens are available (bursts up to one second's worth)."""
+        with self._lock:
+            now = time.monotonic()
+            if self._started is None:
+                self._started = self._updated = now
+                self._tokens = self.base_rate
+            rate = self.rate(now)
+            self._tokens = min(max(rate, amount), self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+# =====================================================
+# AIMD CONCURRENCY LIMIT
+# =====================================================
+class AimdLimit:
+    """Writes allowed in flight: additive increase, multiplicative decrease."""
+
+    def __init__(self, initial=4, minimum=1, maximum=MAX_CONCURRENCY,
+                 target_latency_ms=TARGET_LATENCY_MS, decrease=0.5):
+        self.limit = float(min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency_ms = target_latency_ms
+        self.decrease = decrease
+        self.latency_ms = None          # EWMA of successful attempts
+        self.fastest_ms = None
+        self.decreases = 0
+        self._since_decrease = 0        # attempts finished since the last decrease
+        self._lock = threading.Lock()
+
+    def target_ms(self) -> float:
+        if self.target_latency_ms:
+            return self.target_latency_ms
+        # twice the unloaded latency, with a floor so sub-millisecond calls don't flap
+        return max(2 * (self.fastest_ms or 0.0), 5.0)
+
+    def on_success(self, latency_ms):
+        with self._lock:
+            self._since_decrease += 1
+            self.fastest_ms = latency_ms if self.fastest_ms is None else min(self.fastest_ms, latency_ms)
+            self.latency_ms = latency_ms if self.latency_ms is None else (
+                (1 - LATENCY_EWMA) * self.latency_ms + LATENCY_EWMA * latency_ms
+            )
+            if self.latency_ms > self.target_ms():
+                self._decrease()
+            else:
+                # about +1 per window of `limit` writes
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_contention(self):
+        with self._lock:
+            self._since_decrease += 1
+            self._decrease()
+
+    def _decrease(self):
+        # once per window: the writes already in flight saw the same congestion
+        if self.decreases and self._since_decrease < self.limit:
+            return
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        self.decreases += 1
+        self._since_decrease = 0
+
+
+# =====================================================
+# SCHEDULER
+# =====================================================
+_STOP = object()
+
+
+class WriteScheduler:
+    """
+    Runs submitted write calls on worker threads within the ramp-up rate
+    and the AIMD concurrency limit.
+
+        with WriteScheduler("setup") as writes:
+            writes.submit(doc_ref.set, data)
+            writes.submit(batch.commit, ops=len(docs))
+            writes.join()       # wait; raises the first error
+
+    Counters (firestore_calls, firestore_docs, retries) are added to the
+    metrics step of the thread calling join().
+    """
+
+    def __init__(self, name="writes", max_concurrency=MAX_CONCURRENCY, bucket=None,
+                 limit=None, tries=5, log_every_s=LOG_EVERY_S):
+        self.name = name
+        self.bucket = bucket or RampUpBucket()
+        self.limit = limit or AimdLimit(maximum=max_concurrency)
+        self.log_every_s = log_every_s
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._pending = 0               # submitted, not finished
+        self._errors = []
+        self._stats = {"calls": 0, "attempts": 0, "ops": 0, "contention_errors": 0, "failed": 0}
+        self._reported = dict(self._stats)
+        self._started = time.monotonic()
+        self._logged = self._started
+        self._retry = retry(Exception, tries=tries, delay=1, backoff=2, backend="firestore")
+        self._workers = [
+            threading.Thread(target=self._work, name=f"{name}-writer-{i}", daemon=True)
+            for i in range(self.limit.maximum)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    # ---------- public ----------
+    def submit(self, fn, *args, ops=1, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs), a write of ops documents; blocks while the queue is full."""
+        future = Future()
+        with self._cond:
+            if self._errors:
+                raise self._errors[0]
+            self._pending += 1
+        self._queue.put((fn, args, kwargs, ops, future))
+        return future
+
+    def join(self):
+        """Wait for every submitted write; re-raise the first failure."""
+        with self._cond:
+            while self._pending:
+                self._cond.wait(timeout=self.log_every_s or None)
+                self._maybe_log()
+            errors, self._errors = self._errors, []
+        self._report_counts()
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        try:
+            self.join()
+        finally:
+            for _ in self._workers:
+                self._queue.put(_STOP)
+            for worker in self._workers:
+                worker.join()
+            self._log_progress("done")
+
+    def stats(self) -> dict:
+        with self._cond:
+            elapsed = time.monotonic() - self._started
+            return {
+                **self._stats,
+                "rate_limit": round(self.bucket.rate(), 1),
+                "concurrency_limit": round(self.limit.limit, 2),
+                "in_flight": self._in_flight,
+                "queue_depth": self._queue.qsize(),
+                "latency_ms": round(self.limit.latency_ms, 1) if self.limit.latency_ms else None,
+                "ops_per_s": round(self._stats["ops"] / elapsed, 1) if elapsed else 0.0,
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return
+        # failing already: drop what is queued, don't mask the error
+        try:
+            while True:
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    item[4].cancel()
+                    self._finish(None, ran=False)
+        except queue.Empty:
+            pass
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    # ---------- workers ----------
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            fn, args, kwargs, ops, future = item
+            if not future.set_running_or_notify_cancel():
+                self._finish(None, ran=False)
+                continue
+            error = None
+            try:
+                result = self._retry(self._observed(fn, ops))(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            self._finish(error, ops)
+
+    def _observed(self, fn, ops):
+        """
+        One attempt: wait for a concurrency slot and rate tokens, time it,
+        feed the AIMD controller. Retry sleeps happen outside the slot.
+        """
+        def attempt(*args, **kwargs):
+            with self._cond:
+                while self._in_flight >= max(1, int(self.limit.limit)):
+                    self._cond.wait()
+                self._in_flight += 1
+                self._stats["attempts"] += 1
+            try:
+                self.bucket.acquire(ops)
+                started = time.perf_counter()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    if is_transient(e):
+                        with self._cond:
+                            self._stats["contention_errors"] += 1
+                        self.limit.on_contention()
+                    raise
+                self.limit.on_success((time.perf_counter() - started) * 1000)
+                return result
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+        attempt.__name__ = getattr(fn, "__name__", "write")
+        return attempt
+
+    def _finish(self, error, ops=0, ran=True):
+        with self._cond:
+            self._pending -= 1
+            if error is not None:
+                self._stats["failed"] += 1
+                self._errors.append(error)
+            elif ran:
+                self._stats["calls"] += 1
+                self._stats["ops"] += ops
+            self._cond.notify_all()
+        self._maybe_log()
+
+    # ---------- reporting ----------
+    def _maybe_log(self):
+        if self.log_every_s and time.monotonic() - self._logged >= self.log_every_s:
+            self._logged = time.monotonic()
+            self._log_progress("progress")
+
+    def _log_progress(self, label):
+        s = self.stats()
+        logger.info("%s %s: %d writes (%d docs, %.0f docs/s), rate limit %.0f/s, "
+                    "concurrency %.1f (%d in flight), queue %d, contention errors %d",
+                    self.name, label, s["calls"], s["ops"], s["ops_per_s"], s["rate_limit"],
+                    s["concurrency_limit"], s["in_flight"], s["queue_depth"],
+                    s["contention_errors"])
+
+    def _report_counts(self):
+        with self._cond:
+            delta = {key: value - self._reported[key] for key, value in self._stats.items()}
+            self._reported = dict(self._stats)
+        count("firestore_calls", delta["attempts"])
+        count("firestore_docs", delta["ops"])
+        count("retries", max(0, delta["attempts"] - delta["calls"] - delta["failed"]))